@@ -0,0 +1,6 @@
+"""
+Offline benchmarks.  Data is generated by benchmarks.synthetic, nothing is downloaded.
+
+    python -m benchmarks.suite             timed scenarios with JSON results, see benchmarks/suite.py
+    python -m benchmarks.bench_<name>      comparisons of individual optimizations against their reference code
+"""
@@ -0,0 +1,74 @@
+"""
+Benchmark datasets held in compact dtypes against the default dtypes.
+
+    python -m benchmarks.bench_compact [locations] [days]
+
+Synthetic OWID and PHAC files are loaded with and without compact=True.  The memory of the frames and the time of
+a groupby, a full pivot and the uncached analytic methods are printed for both.
+"""
+import io
+import sys
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from src import ECDC, PHAC
+from benchmarks.synthetic import owid_csv, phac_csv
+
+
+def _best_of(func, repeat=5):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _scenarios(dataset, locations):
+    df = dataset.df
+    return {
+        'groupby sum': lambda: df.groupby('location', observed=True)['new_cases'].sum(),
+        'pivot': lambda: df.pivot(index='date', columns='location', values='total_cases'),
+        'var_by_location': lambda: dataset.var_by_location('total_cases', *locations),
+        'growth_rate': lambda: dataset.growth_rate('total_cases', [3, 7, 28], *locations),
+    }
+
+
+def compare(name, load, locations):
+    full, compact = load(compact=False), load(compact=True)
+    for var in ('total_cases', 'new_cases'):
+        pd.testing.assert_frame_equal(compact.var_by_location(var, *locations), full.var_by_location(var, *locations))
+
+    full_mb = full.df.memory_usage(deep=True).sum() / 2 ** 20
+    compact_mb = compact.df.memory_usage(deep=True).sum() / 2 ** 20
+    print(f"{name}: {len(full.df)} rows")
+    print(f"  {'memory':<18}{full_mb:>9.1f} MiB{compact_mb:>9.1f} MiB{full_mb / compact_mb:>8.1f}x")
+    full_runs, compact_runs = _scenarios(full, locations), _scenarios(compact, locations)
+    for scenario in full_runs:
+        full_time, compact_time = _best_of(full_runs[scenario]), _best_of(compact_runs[scenario])
+        print(f"  {scenario:<18}{1000 * full_time:>9.1f} ms {1000 * compact_time:>9.1f} ms "
+              f"{full_time / compact_time:>7.1f}x")
+    return
+
+
+def main(locations=200, days=2 * 365):
+    print(f"{'':<20}{'default':>12}{'compact':>13}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "owid-covid-data.csv"
+        owid_csv(path, locations, days)
+        owid_locations = [f"Location {k:03d}" for k in range(0, locations, 4)]
+        compare("OWID", lambda compact: ECDC(source=str(path), compact=compact, cache_size=0), owid_locations)
+
+    text = phac_csv(days=days)
+    compare("PHAC", lambda compact: PHAC(source=io.StringIO(text), compact=compact, cache_size=0),
+            PHAC.large_provinces)
+    return
+
+
+if __name__ == '__main__':
+    import warnings
+    warnings.simplefilter("ignore")
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,45 @@
+"""
+Benchmark GeometricProcess.fit against the original per-date lstsq loop.
+
+    python -m benchmarks.bench_growth_fit [days]
+
+The two fits are checked for agreement before the timings are printed.
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from src.models.growth import GeometricProcess
+from benchmarks.synthetic import geometric_series, reference_growth_fit
+
+
+def main(days=2000, est_per=14):
+    series = geometric_series(days)
+
+    start = time.perf_counter()
+    expected = reference_growth_fit(series, est_per)
+    legacy_time = time.perf_counter() - start
+
+    process = GeometricProcess(est_per=est_per)
+    start = time.perf_counter()
+    process.fit(series)
+    fit_time = time.perf_counter() - start
+
+    np.testing.assert_allclose(process.model.values, expected.values, rtol=1e-7, atol=1e-9)
+    print(f"days: {days}, est_per: {est_per}")
+    print(f"per-date lstsq: {legacy_time:.3f}s")
+    print(f"closed form:    {fit_time:.4f}s")
+    print(f"speedup:        {legacy_time / fit_time:.0f}x")
+
+    frame = pd.DataFrame({f"L{k:03d}": geometric_series(days, seed=k) for k in range(250)})
+    for workers in sorted({1, os.cpu_count() or 1}):
+        start = time.perf_counter()
+        GeometricProcess(est_per=est_per).fit_many(frame, workers=workers)
+        print(f"fit_many, {frame.shape[1]} locations, {workers} workers: {time.perf_counter() - start:.3f}s")
+    return
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
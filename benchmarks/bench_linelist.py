@@ -0,0 +1,62 @@
+"""
+Benchmark the streaming line list aggregation against reading the whole file at once.
+
+    python -m benchmarks.bench_linelist [days] [cases]
+
+A synthetic line list in the layout of the Ontario confirmed cases file is aggregated by a full read_csv and
+groupby and by aggregate_line_list with 1, 2, 4, ... worker processes up to the number of cores.  The peak memory
+allocated by this process is reported for the full read and the serial streaming aggregation.
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+
+from src.linelist import aggregate_line_list
+from benchmarks.synthetic import ontario_line_list_csv
+
+
+def full_read(path):
+    """
+    The daily case counts from the whole file read at once, the reference implementation
+    """
+    full = pd.read_csv(path)
+    return full.groupby(['Reporting_PHU_City', 'Accurate_Episode_Date']).size()
+
+
+def _measure(func, *args, **kwargs):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(days=365, cases=100):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "conposcovidloc.csv"
+        rows = ontario_line_list_csv(path, days=days, cases=cases)
+        print(f"{rows} cases, {path.stat().st_size / 2 ** 20:.0f} MiB")
+
+        expected, full, peak = _measure(full_read, path)
+        print(f"{'full read':<24}{full:>8.2f} s{rows / full / 1e6:>8.2f} M rows/s{peak / 2 ** 20:>8.0f} MiB")
+
+        processes = 1
+        while processes <= (os.cpu_count() or 1):
+            daily, elapsed, peak = _measure(aggregate_line_list, path, processes=processes)
+            assert daily['new_cases'].sum() == expected.sum()
+            memory = f"{peak / 2 ** 20:>8.0f} MiB" if processes == 1 else ""
+            print(f"{f'streaming, {processes} processes':<24}{elapsed:>8.2f} s{rows / elapsed / 1e6:>8.2f} M rows/s"
+                  f"{memory}")
+            processes *= 2
+    return
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,82 @@
+"""
+Benchmark the streaming OWID ingest against reading the whole file.
+
+    python -m benchmarks.bench_owid_ingest [locations] [days]
+
+A synthetic file in the owid-covid-data.csv layout (see benchmarks.synthetic) is written to a temporary directory.
+Each ingest runs in a fresh process so that the peak resident set size of the process can be compared.
+"""
+import datetime
+import multiprocessing
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+import pandas as pd
+
+from src import ECDC
+from benchmarks.synthetic import owid_csv
+
+
+def legacy_parse(source):
+    """
+    The whole-file read ECDC used before streaming, kept as the reference implementation
+    """
+    dateparse = lambda x: datetime.date(*time.strptime(x, '%Y-%m-%d')[:3])
+    return pd.read_csv(source,
+                       error_bad_lines=False,
+                       warn_bad_lines=False,
+                       parse_dates=['date'],
+                       date_parser=dateparse)
+
+
+def _measure(name, path, queue):
+    import warnings
+    warnings.simplefilter("ignore")
+    start = time.perf_counter()
+    if name == "legacy":
+        df = legacy_parse(path)
+    elif name == "streaming":
+        df = ECDC.parse(path)
+    else:
+        df = ECDC.parse(path, locations=[f"Location {k:03d}" for k in range(10)])
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is reported in kilobytes on Linux
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, df.shape,
+               df.memory_usage(deep=True).sum() / 2 ** 20))
+    return
+
+
+def _run(name, path):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(name, path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(locations=200, days=2 * 365):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "owid-covid-data.csv"
+        owid_csv(path, locations, days)
+
+        # measure before this process grows: a child process starts with the peak RSS of its parent
+        print(f"file: {path.stat().st_size / 2 ** 20:.0f} MiB, {locations * days} rows")
+        print(f"{'ingest':<20}{'time':>8}{'peak RSS':>12}{'frame':>12}  shape")
+        for name in ("legacy", "streaming", "streaming-10-locs"):
+            elapsed, rss, shape, frame = _run(name, path)
+            print(f"{name:<20}{elapsed:>7.2f}s{rss:>8.0f} MiB{frame:>8.0f} MiB  {shape}")
+
+        # the projected columns of the streaming read match the whole-file read
+        streamed = ECDC.parse(path, chunksize=10000)
+        pd.testing.assert_frame_equal(streamed, legacy_parse(path)[list(streamed.columns)])
+    return
+
+
+if __name__ == '__main__':
+    import warnings
+    warnings.simplefilter("ignore")
+    main(*map(int, sys.argv[1:]))
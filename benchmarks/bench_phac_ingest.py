@@ -0,0 +1,77 @@
+"""
+Benchmark the PHAC ingest path against the original row-wise implementation.
+
+    python -m benchmarks.bench_phac_ingest [days]
+
+A synthetic multi-year file in the covid19.csv layout is generated by benchmarks.synthetic, parsed by both
+implementations, the outputs are checked for equality and the timings are printed.
+"""
+import datetime
+import io
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from src import PHAC
+from benchmarks.synthetic import phac_csv
+
+
+def legacy_read_source(source):
+    """
+    The row-wise ingest PHAC used before vectorization, kept as the reference implementation
+    """
+    dateparse = lambda x: datetime.date(*time.strptime(x, '%d-%m-%Y')[:3])
+    src = pd.read_csv(source,
+                      error_bad_lines=False,
+                      warn_bad_lines=False,
+                      parse_dates=['date'],
+                      date_parser=dateparse)
+    src['numtests'] = src.apply(lambda row: row['numtested']
+                                    if not np.isnan(row['numtested'])
+                                    else row['numtests'], axis=1)
+    src['numteststoday'] = src.apply(lambda row: row['numtestedtoday']
+                                        if not np.isnan(row['numtestedtoday'])
+                                        else row['numteststoday'], axis=1)
+    src = src[list(PHAC.col_map)]
+    src.rename(columns=PHAC.col_map, inplace=True)
+    src = src.loc[src.location != 'Repatriated travellers']
+    for var in PHAC.count_columns:
+        src[var] = src[var].apply(lambda x: int(x.replace(",", "")) if isinstance(x, str) else x)
+    src['test_units'] = src.apply(lambda row: 'persons'
+                                               if row['date'] < datetime.date(2021, 2, 1)
+                                               else 'tests', axis=1)
+    src['population'] = 100000 * src['total_cases'] / src['total_cases_rate']
+    src['total_cases_rate'] = src['total_cases_rate'] / 100000.0
+    src['total_deaths_rate'] = src['total_deaths_rate'] / 100000.0
+    for var in ['new_cases', 'new_tests', 'total_tests', 'new_deaths', 'total_confirmed_cases',
+                'total_probable_cases', 'total_recovered', 'new_recovered', 'active_cases']:
+        src[var + "_rate"] = src[var] / src['population']
+    return src
+
+
+def _best_of(func, text, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(io.StringIO(text))
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(days=3 * 365):
+    text = phac_csv(days=days)
+    legacy_time, legacy = _best_of(legacy_read_source, text)
+    vector_time, vector = _best_of(PHAC.read_source, text)
+    pd.testing.assert_frame_equal(vector, legacy)
+    print(f"rows: {len(vector)}")
+    print(f"row-wise ingest:   {legacy_time:.3f}s")
+    print(f"vectorized ingest: {vector_time:.3f}s")
+    print(f"speedup:           {legacy_time / vector_time:.1f}x")
+    return
+
+
+if __name__ == '__main__':
+    import warnings
+    warnings.simplefilter("ignore")
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,56 @@
+"""
+Benchmark batch rendering of the location charts against the plot_location loop.
+
+    python -m benchmarks.bench_render [locations] [days]
+
+A synthetic OWID file is loaded and a PNG of every location is written by a serial plot_location loop and by
+render_locations with 1, 2, 4, ... worker processes up to the number of cores.
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from src import ECDC
+from src.render import render_locations
+from benchmarks.synthetic import owid_csv
+
+
+def plot_loop(ecdc, directory):
+    for location in ecdc.locations:
+        fig = ecdc.plot_location(location)
+        fig.savefig(Path(directory) / f"{location}.png")
+        plt.close(fig)
+    return
+
+
+def main(locations=64, days=365):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "owid-covid-data.csv"
+        owid_csv(path, locations, days)
+        ecdc = ECDC(source=str(path), cache_size=0)
+
+        start = time.perf_counter()
+        plot_loop(ecdc, tmp)
+        loop = time.perf_counter() - start
+        print(f"{'plot_location loop':<24}{loop:>8.2f} s")
+
+        processes = 1
+        while processes <= (os.cpu_count() or 1):
+            start = time.perf_counter()
+            render_locations(ecdc, directory=Path(tmp) / str(processes), processes=processes)
+            elapsed = time.perf_counter() - start
+            print(f"{f'render, {processes} processes':<24}{elapsed:>8.2f} s{loop / elapsed:>8.1f}x")
+            processes *= 2
+    return
+
+
+if __name__ == '__main__':
+    import warnings
+    warnings.simplefilter("ignore")
+    main(*map(int, sys.argv[1:]))
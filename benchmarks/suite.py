@@ -0,0 +1,265 @@
+"""
+Timed benchmark scenarios over synthetic data, with results written as JSON so that versions can be compared.
+
+    python -m benchmarks.suite [--locations N] [--days N] [--gap-rate F] [--repeat N] [--output FILE]
+                               [--only NAME ...] [--compare BASELINE.json]
+
+Each scenario is timed repeat times after an untimed setup and the best time is reported.  Analytic methods run on
+datasets created with cache_size=0 so that every call does the full computation.  A scenario that raises is
+recorded with its error rather than stopping the suite.
+"""
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from src import ECDC, PHAC
+from src.ontario import Ontario
+from src.models.growth import GeometricProcess
+from benchmarks import synthetic
+
+
+class Context:
+    """
+    Synthetic sources shared by the scenarios, generated on first use
+    """
+
+    def __init__(self, locations, days, gap_rate, workdir):
+        self.locations = locations
+        self.days = days
+        self.gap_rate = gap_rate
+        self.workdir = Path(workdir)
+        self._owid_path = None
+        self._line_list_path = None
+        self._ecdc = None
+        return
+
+    @property
+    def owid_path(self):
+        if self._owid_path is None:
+            self._owid_path = self.workdir / "owid-covid-data.csv"
+            synthetic.owid_csv(self._owid_path, self.locations, self.days, self.gap_rate)
+        return self._owid_path
+
+    @property
+    def line_list_path(self):
+        if self._line_list_path is None:
+            self._line_list_path = self.workdir / "conposcovidloc.csv"
+            synthetic.ontario_line_list_csv(self._line_list_path, days=self.days, cases=5)
+        return self._line_list_path
+
+    @property
+    def ecdc(self):
+        if self._ecdc is None:
+            self._ecdc = ECDC(source=str(self.owid_path), cache_size=0)
+        return self._ecdc
+
+    @property
+    def query_locations(self):
+        """
+        Every fourth location, the columns of the var_by_location style scenarios
+        """
+        return self.ecdc.locations[::4]
+
+
+def _ingest_owid(ctx):
+    path = str(ctx.owid_path)
+    return lambda: ECDC(source=path)
+
+
+def _ingest_phac(ctx):
+    text = synthetic.phac_csv(days=ctx.days, gap_rate=ctx.gap_rate)
+    return lambda: PHAC(source=io.StringIO(text))
+
+
+def _ingest_ontario(ctx):
+    text = synthetic.ontario_csv(days=ctx.days, gap_rate=ctx.gap_rate)
+    return lambda: Ontario(source=io.StringIO(text))
+
+
+def _ingest_ontario_line_list(ctx):
+    path = str(ctx.line_list_path)
+    return lambda: Ontario(source=path, line_list=True)
+
+
+def _var_by_location(ctx):
+    ecdc, locations = ctx.ecdc, ctx.query_locations
+    return lambda: ecdc.var_by_location('total_cases', *locations)
+
+
+def _growth_rate(ctx):
+    ecdc, locations = ctx.ecdc, ctx.query_locations
+    return lambda: ecdc.growth_rate('total_cases', [3, 7, 28], *locations)
+
+
+def _cum_pos_test_rate(ctx):
+    ecdc, locations = ctx.ecdc, ctx.query_locations
+    return lambda: ecdc.cum_pos_test_rate(*locations)
+
+
+def _geometric_fit(ctx):
+    series = synthetic.geometric_series(ctx.days, gap_rate=ctx.gap_rate)
+    return lambda: GeometricProcess(est_per=14).fit(series)
+
+
+def _geometric_fit_many(ctx):
+    frame = ctx.ecdc.var_by_location('total_cases', *ctx.query_locations)
+    return lambda: GeometricProcess(est_per=14).fit_many(frame)
+
+
+def _plot_location(ctx):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    ecdc, location = ctx.ecdc, ctx.query_locations[0]
+
+    def run():
+        fig = ecdc.plot_location(location)
+        fig.canvas.draw()
+        plt.close(fig)
+    return run
+
+
+# name -> setup(context) returning the callable to be timed
+SCENARIOS = {
+    'ingest_owid': _ingest_owid,
+    'ingest_phac': _ingest_phac,
+    'ingest_ontario': _ingest_ontario,
+    'ingest_ontario_line_list': _ingest_ontario_line_list,
+    'var_by_location': _var_by_location,
+    'growth_rate': _growth_rate,
+    'cum_pos_test_rate': _cum_pos_test_rate,
+    'geometric_fit': _geometric_fit,
+    'geometric_fit_many': _geometric_fit_many,
+    'plot_location': _plot_location,
+}
+
+
+def time_scenario(run, repeat):
+    """
+    Return the wall times of repeat calls of run
+
+    :param run: callable
+    :param repeat: int
+
+    :return: list of float
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def _revision():
+    try:
+        result = subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def run_suite(locations=200, days=2 * 365, gap_rate=0.05, repeat=5, only=None):
+    """
+    Run the scenarios
+
+    :param locations: int - number of locations of the synthetic OWID file
+    :param days: int - number of days of the synthetic sources
+    :param gap_rate: float - fraction of location x date rows left out of the synthetic sources
+    :param repeat: int - number of timed calls of each scenario
+    :param only: list like (default=all scenarios) - names of the scenarios to run
+
+    :return: dict - meta data and a result per scenario
+    """
+    names = list(SCENARIOS) if only is None else list(only)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"unknown scenarios: {unknown}")
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        ctx = Context(locations, days, gap_rate, workdir)
+        for name in names:
+            result = {'name': name}
+            try:
+                run = SCENARIOS[name](ctx)
+                times = time_scenario(run, repeat)
+            except Exception as err:
+                result.update(status='error', error=f"{type(err).__name__}: {err}")
+            else:
+                result.update(status='ok', best=min(times), median=float(np.median(times)), times=times)
+            results.append(result)
+
+    meta = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'revision': _revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'parameters': dict(locations=locations, days=days, gap_rate=gap_rate, repeat=repeat),
+    }
+    return {'meta': meta, 'results': results}
+
+
+def compare(baseline, current):
+    """
+    Return the ratio baseline best time / current best time of the scenarios that succeeded in both runs
+
+    :param baseline: dict - output of run_suite
+    :param current: dict - output of run_suite
+
+    :return: dict name -> float, above 1 when current is faster
+    """
+    before = {r['name']: r['best'] for r in baseline['results'] if r['status'] == 'ok'}
+    return {r['name']: before[r['name']] / r['best']
+            for r in current['results'] if r['status'] == 'ok' and r['name'] in before}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the offline benchmark scenarios")
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--days", type=int, default=2 * 365)
+    parser.add_argument("--gap-rate", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", nargs="+", choices=list(SCENARIOS))
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.locations, args.days, args.gap_rate, args.repeat, args.only)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    ratios = compare(baseline, report) if baseline else {}
+
+    for result in report['results']:
+        if result['status'] == 'ok':
+            line = f"{result['name']:<22}{1000 * result['best']:>10.1f} ms"
+            if result['name'] in ratios:
+                line += f"{ratios[result['name']]:>8.2f}x"
+        else:
+            line = f"{result['name']:<22}{'error':>13}  {result['error']}"
+        print(line)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    import warnings
+    warnings.simplefilter("ignore")
+    main(sys.argv[1:])
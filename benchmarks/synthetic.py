@@ -0,0 +1,299 @@
+"""
+Synthetic data in the layouts of the sources read by ECDC, PHAC and Ontario.
+
+Every generator takes the number of locations and days, a gap rate (the fraction of location x date rows left out
+of the file, as in the real sources where reporting has gaps) and a seed.  The generated values follow noisy
+geometric growth so that the analytic methods and models see realistic inputs.
+"""
+import numpy as np
+import pandas as pd
+
+from src import PHAC
+
+START = "2020-03-01"
+
+# Columns of the OWID file beyond those read by ECDC, all numeric
+OWID_EXTRA_COLUMNS = ['reproduction_rate', 'icu_patients', 'icu_patients_per_million', 'hosp_patients',
+                      'hosp_patients_per_million', 'weekly_icu_admissions', 'weekly_icu_admissions_per_million',
+                      'weekly_hosp_admissions', 'weekly_hosp_admissions_per_million', 'new_cases_smoothed',
+                      'new_deaths_smoothed', 'new_tests_smoothed', 'new_tests_smoothed_per_thousand',
+                      'positive_rate', 'tests_per_case', 'total_vaccinations', 'people_vaccinated',
+                      'people_fully_vaccinated', 'total_boosters', 'new_vaccinations', 'new_vaccinations_smoothed',
+                      'total_vaccinations_per_hundred', 'people_vaccinated_per_hundred',
+                      'people_fully_vaccinated_per_hundred', 'total_boosters_per_hundred',
+                      'new_vaccinations_smoothed_per_million', 'stringency_index', 'population_density',
+                      'median_age', 'aged_65_older', 'aged_70_older', 'gdp_per_capita', 'extreme_poverty',
+                      'cardiovasc_death_rate', 'diabetes_prevalence', 'female_smokers', 'male_smokers',
+                      'handwashing_facilities', 'hospital_beds_per_thousand', 'life_expectancy',
+                      'human_development_index', 'excess_mortality_cumulative_absolute',
+                      'excess_mortality_cumulative', 'excess_mortality']
+
+# Public health units reported in the Ontario line list
+ONTARIO_CITIES = ['Toronto', 'Ottawa', 'Mississauga', 'Newmarket', 'Whitby', 'Hamilton', 'Oakville', 'London',
+                  'Waterloo', 'Windsor', 'Guelph', 'Barrie', 'Thorold', 'Sudbury', 'Kingston', 'Peterborough',
+                  'Thunder Bay', 'Chatham', 'Point Edward', 'Owen Sound', 'Simcoe', 'Stratford', 'Belleville',
+                  'Brockville', 'Cornwall', 'Port Hope', 'Pembroke', 'North Bay', 'Sault Ste. Marie', 'Timmins',
+                  'New Liskeard', 'Kenora', 'Brantford', 'St. Thomas']
+
+
+def location_names(prefix, locations, known=()):
+    """
+    Return locations names, taken from known first and numbered after that
+
+    :param prefix: str - prefix of the numbered names
+    :param locations: int
+    :param known: list like of str
+
+    :return: list of str
+    """
+    names = list(known)[:locations]
+    return names + [f"{prefix} {k:03d}" for k in range(len(names), locations)]
+
+
+def geometric_series(days=2000, seed=0, gap_rate=0.1):
+    """
+    Return a noisy geometric series with missing values indexed by date
+
+    :param days: int
+    :param seed: int
+    :param gap_rate: float - fraction of the values set to nan
+
+    :return: pd.Series
+    """
+    rng = np.random.default_rng(seed)
+    rate = 0.05 * np.sin(np.arange(days) / 40)
+    values = 100 * np.exp(np.cumsum(rate) + rng.normal(0, 0.05, days))
+    values[rng.random(days) < gap_rate] = np.nan
+    return pd.Series(values, index=pd.date_range(START, periods=days, freq="D"))
+
+
+def reference_growth_fit(series, est_per):
+    """
+    The original per-date lstsq fit of GeometricProcess.fit, the reference its output is checked against
+
+    :param series: pd.Series with sorted DatetimeIndex
+    :param est_per: int
+
+    :return: pd.DataFrame - the model in the layout of GeometricProcess.model
+    """
+    logser = np.log(series)
+    x, fits = [], []
+    for idx in series.index[est_per:]:
+        s = idx - est_per * pd.Timedelta("1 day")
+        vals = logser[s:idx].values
+        lvals = np.where(np.logical_not(np.isnan(vals)))[0]
+        if len(lvals) > 1:
+            A = np.ones((len(lvals), 2))
+            A[:, 0] = lvals
+            fits.append(np.linalg.lstsq(A, vals[lvals], rcond=None))
+            x.append(idx)
+    model = pd.DataFrame(
+        {"LogGrowthRate": [fit[0][0] for fit in fits],
+         "LogPriorProcessLoad": [fit[0][1] for fit in fits],
+         "Error": [fit[1][0] if len(fit[1]) > 0 else 0 for fit in fits]},
+        index=x
+    )
+    model["PredictedLogValue"] = model["LogPriorProcessLoad"] + (est_per - 1) * model["LogGrowthRate"]
+    model["ActualLogValue"] = logser[model.index]
+    return model
+
+
+def _keep(rng, days, gap_rate):
+    """
+    Return a mask of the days reported for a location.  The first day is always reported
+    """
+    keep = rng.random(days) >= gap_rate
+    keep[0] = True
+    return keep
+
+
+def owid_frame(locations=200, days=2 * 365, gap_rate=0.0, seed=0, extra_columns=OWID_EXTRA_COLUMNS):
+    """
+    Return a frame in the owid-covid-data.csv layout.  Each location is generated separately, see owid_csv
+
+    :param locations: int
+    :param days: int
+    :param gap_rate: float - fraction of the location x date rows left out
+    :param seed: int
+    :param extra_columns: list like - additional random numeric columns
+
+    :return: pd.DataFrame
+    """
+    return pd.concat(_owid_locations(locations, days, gap_rate, seed, extra_columns), ignore_index=True)
+
+
+def _owid_locations(locations, days, gap_rate, seed, extra_columns):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(START, periods=days, freq="D").strftime('%Y-%m-%d')
+    for k, name in enumerate(location_names("Location", locations)):
+        new_cases = rng.poisson(100, days).astype(float)
+        new_deaths = rng.poisson(2, days).astype(float)
+        new_tests = rng.poisson(2000, days).astype(float)
+        population = 1e6 * (k + 1)
+        df = pd.DataFrame({
+            'iso_code': f"L{k:03d}", 'continent': 'Synthetic', 'location': name,
+            'date': dates,
+            'total_cases': np.cumsum(new_cases), 'new_cases': new_cases,
+            'total_deaths': np.cumsum(new_deaths), 'new_deaths': new_deaths,
+            'total_cases_per_million': 1e6 * np.cumsum(new_cases) / population,
+            'new_cases_per_million': 1e6 * new_cases / population,
+            'total_deaths_per_million': 1e6 * np.cumsum(new_deaths) / population,
+            'new_deaths_per_million': 1e6 * new_deaths / population,
+            'total_tests': np.cumsum(new_tests), 'new_tests': new_tests,
+            'total_tests_per_thousand': 1e3 * np.cumsum(new_tests) / population,
+            'new_tests_per_thousand': 1e3 * new_tests / population,
+            'tests_units': 'tests performed',
+            'population': population
+        })
+        for col in extra_columns:
+            df[col] = rng.random(days).round(3)
+        if gap_rate > 0:
+            df = df.loc[_keep(rng, days, gap_rate)]
+        yield df
+
+
+def owid_csv(path, locations=200, days=2 * 365, gap_rate=0.0, seed=0, extra_columns=OWID_EXTRA_COLUMNS):
+    """
+    Write a file in the owid-covid-data.csv layout, one location at a time so that large files can be written
+    with little memory
+
+    :param path: str or Path
+    :param locations: int
+    :param days: int
+    :param gap_rate: float - fraction of the location x date rows left out
+    :param seed: int
+    :param extra_columns: list like - additional random numeric columns
+    """
+    with open(path, "w") as f:
+        for k, df in enumerate(_owid_locations(locations, days, gap_rate, seed, extra_columns)):
+            df.to_csv(f, header=(k == 0), index=False)
+    return
+
+
+def phac_csv(locations=None, days=3 * 365, gap_rate=0.0, seed=0):
+    """
+    Return text in the covid19.csv layout.  The provinces of PHAC.provinces are used first, followed by numbered
+    regions, and a 'Repatriated travellers' location is always included.
+
+    :param locations: int (default=len(PHAC.provinces))
+    :param days: int
+    :param gap_rate: float - fraction of the location x date rows left out
+    :param seed: int
+
+    :return: str
+    """
+    rng = np.random.default_rng(seed)
+    if locations is None:
+        locations = len(PHAC.provinces)
+    names = location_names("Region", locations, PHAC.provinces) + ['Repatriated travellers']
+    dates = pd.date_range(START, periods=days, freq="D")
+    tested_era = dates < pd.Timestamp(2021, 2, 1)
+    frames = []
+    for pruid, loc in enumerate(names):
+        new = rng.poisson(50 * (pruid + 1), days)
+        total = np.cumsum(new)
+        deaths = np.cumsum(rng.poisson(1, days))
+        tests_today = rng.poisson(2000 * (pruid + 1), days)
+        tests = np.cumsum(tests_today)
+        population = 1e6 * (pruid + 1)
+        recovered = (0.9 * total).astype(int)
+        df = pd.DataFrame({
+            'pruid': pruid, 'prname': loc, 'prnameFR': loc,
+            'date': dates.strftime('%d-%m-%Y'),
+            'numconf': total, 'numprob': 0, 'numdeaths': deaths, 'numtotal': total,
+            'numtested': np.where(tested_era, tests, np.nan),
+            'numtests': np.where(tested_era, np.nan, tests),
+            'numrecover': recovered,
+            'ratetotal': 100000 * total / population,
+            'ratedeaths': 100000 * deaths / population,
+            'numtoday': new, 'numdeathstoday': np.diff(deaths, prepend=0),
+            'numtestedtoday': np.where(tested_era, tests_today, np.nan),
+            'numteststoday': np.where(tested_era, np.nan, tests_today),
+            'numrecoveredtoday': np.diff(recovered, prepend=0),
+            'numactive': total - recovered - deaths,
+            'rateactive': 100000 * (total - recovered - deaths) / population
+        })
+        frames.append(df.loc[_keep(rng, days, gap_rate)] if gap_rate > 0 else df)
+    df = pd.concat(frames).sort_values(['date', 'pruid'], kind='mergesort')
+
+    # PHAC reports some counts with thousands separators
+    for col in ['numtotal', 'numconf', 'numrecover', 'numactive']:
+        df[col] = df[col].map('{:,}'.format)
+    return df.to_csv(index=False)
+
+
+def ontario_csv(locations=len(ONTARIO_CITIES), days=365, gap_rate=0.0, seed=0):
+    """
+    Return text in the layout read by Ontario: a report date (dd-mm-yyyy), the episode date and reporting city of
+    each row, and cumulative case, death and test counts.
+
+    :param locations: int
+    :param days: int
+    :param gap_rate: float - fraction of the location x date rows left out
+    :param seed: int
+
+    :return: str
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(START, periods=days, freq="D")
+    frames = []
+    for k, city in enumerate(location_names("City", locations, ONTARIO_CITIES)):
+        df = pd.DataFrame({
+            'date': dates.strftime('%d-%m-%Y'),
+            'Accurate_Episode_Date': dates.strftime('%Y-%m-%d'),
+            'Reporting_PHU_City': city,
+            'numtotal': np.cumsum(rng.poisson(20 * (k + 1), days)),
+            'numdeaths': np.cumsum(rng.poisson(1, days)),
+            'numtested': np.cumsum(rng.poisson(500 * (k + 1), days))
+        })
+        frames.append(df.loc[_keep(rng, days, gap_rate)] if gap_rate > 0 else df)
+    return pd.concat(frames).sort_values('Accurate_Episode_Date', kind='mergesort').to_csv(index=False)
+
+
+# Outcomes of the cases of the Ontario line list and their probabilities
+ONTARIO_OUTCOMES = (['Resolved', 'Not Resolved', 'Fatal'], [0.9, 0.08, 0.02])
+
+
+def ontario_line_list_csv(path, locations=len(ONTARIO_CITIES), days=365, cases=50, seed=0, block_days=30):
+    """
+    Write a line list in the layout of the Ontario confirmed cases file, a row per case with its episode date,
+    outcome and reporting city.  Cases of the same block of days are written in random order, as in the real file
+    where rows are not sorted by episode date.  The file is written a block at a time, so large files can be made.
+
+    :param path: str or Path
+    :param locations: int
+    :param days: int
+    :param cases: float - mean daily cases of the first location, the k-th location has k times as many
+    :param seed: int
+    :param block_days: int (default=30) - number of days written at a time
+
+    :return: int - number of cases written
+    """
+    rng = np.random.default_rng(seed)
+    cities = np.array(location_names("City", locations, ONTARIO_CITIES))
+    dates = pd.date_range(START, periods=days, freq="D")
+    outcomes, probabilities = ONTARIO_OUTCOMES
+    written = 0
+    with open(path, "w", newline="") as f:
+        for first in range(0, days, block_days):
+            block = dates[first:first + block_days]
+            counts = rng.poisson(cases * np.arange(1, locations + 1)[None, :], (len(block), locations))
+            day_codes = np.repeat(np.arange(len(block)), counts.sum(axis=1))
+            city_codes = np.concatenate([np.repeat(np.arange(locations), row) for row in counts])
+            order = rng.permutation(len(day_codes))
+            day_codes, city_codes = day_codes[order], city_codes[order]
+            episode = block[day_codes]
+            df = pd.DataFrame({
+                'Row_ID': np.arange(written + 1, written + len(order) + 1),
+                'Accurate_Episode_Date': episode.strftime('%Y-%m-%d'),
+                'Case_Reported_Date': (episode + pd.to_timedelta(rng.integers(0, 5, len(order)), unit="D"))
+                .strftime('%Y-%m-%d'),
+                'Age_Group': rng.choice(['<20', '20s', '30s', '40s', '50s', '60s', '70s', '80s', '90+'],
+                                        len(order)),
+                'Client_Gender': rng.choice(['FEMALE', 'MALE'], len(order)),
+                'Outcome1': rng.choice(outcomes, len(order), p=probabilities),
+                'Reporting_PHU_City': cities[city_codes],
+            })
+            df.to_csv(f, header=first == 0, index=False)
+            written += len(order)
+    return written
@@ -1,4 +1,4 @@
 from .dataset import CovidDataset
-from .populationdata import PopulationData, population_table
+from .populationdata import PopulationData, LazyPopulationTable, population_table
 from .ecdc import ECDC
 from .phac import PHAC
\ No newline at end of file
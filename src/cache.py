@@ -0,0 +1,100 @@
+"""
+Caching helpers shared by the data sources and datasets.
+
+The cache root defaults to ~/.cache/covid-19 and can be moved with the COVID19_CACHE_DIR environment variable.
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+def cache_dir(*parts):
+    """
+    Return (and create if necessary) a directory below the cache root
+
+    :param parts: str - path components below the cache root
+
+    :return: pathlib.Path
+    """
+
+    root = Path(os.environ.get("COVID19_CACHE_DIR", Path.home() / ".cache" / "covid-19"))
+    path = root.joinpath(*parts)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class LRUCache:
+    """
+    Bounded mapping that evicts the least recently used entry and counts hits and misses
+    """
+
+    def __init__(self, maxsize=128):
+        """
+        Instantiate an LRUCache
+
+        :param maxsize: int (default=128) - maximum number of entries.  0 disables caching
+        """
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        return
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """
+        Return the value stored for key and mark it as most recently used, or default if key is not cached
+        """
+
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return
+
+    def discard(self, predicate):
+        """
+        Remove the entries whose key satisfies predicate
+
+        :param predicate: callable(key) -> boolean
+
+        :return: int - number of entries removed
+        """
+
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        return
+
+    def info(self):
+        """
+        :return: dict with the hits, misses, current size and maxsize of the cache
+        """
+
+        return dict(hits=self.hits, misses=self.misses, size=len(self._data), maxsize=self.maxsize)
@@ -0,0 +1,187 @@
+"""
+One store answering queries across the ECDC, PHAC and Ontario datasets, keyed by (source, location, date).
+
+The store keeps a reference to the DenseStore of each dataset rather than a copy of its values, and maps the dates
+of each source onto one shared date axis, so a query over several sources is one aligned array lookup that
+allocates only its result.  Per capita values use the shared population table.
+
+    combined = CombinedStore(build_environment(['ecdc', 'phac'], dataset_options=dict(dense=True)))
+    combined.compare('total_cases', 'Canada')
+"""
+import numpy as np
+import pandas as pd
+
+from .dense import DenseStore
+from .populationdata import population_table
+
+
+class CombinedStore:
+    """
+    Aligned view of the dense date x location x variable arrays of several datasets
+    """
+
+    def __init__(self, datasets):
+        """
+        Instantiate a CombinedStore
+
+        :param datasets: dict name -> CovidDataset.  The DenseStore of datasets created with dense=True is shared and
+                         follows their refreshes; for other datasets one is built, holding the data at this time
+        """
+
+        self.datasets = dict(datasets)
+        self._stores = {}
+        for name, dataset in self.datasets.items():
+            self._stores[name] = dataset.dense if dataset.dense is not None else \
+                DenseStore(dataset.df, dataset.variables)
+        self._align()
+        return
+
+    def _align(self):
+        """
+        Build the shared date axis, the position of each source's dates on it and the (source, location) keys
+        """
+        self._source_dates = {name: pd.DatetimeIndex(pd.to_datetime(store.dates))
+                              for name, store in self._stores.items()}
+        values = [dates.to_numpy() for dates in self._source_dates.values()]
+        self.dates = pd.DatetimeIndex(np.unique(np.concatenate(values)) if values else [], name='date')
+        self._date_positions = {name: self.dates.get_indexer(dates) for name, dates in self._source_dates.items()}
+        self.keys = pd.MultiIndex.from_tuples([(name, location) for name, store in self._stores.items()
+                                               for location in store.locations], names=['source', 'location'])
+        return
+
+    def _sync(self):
+        """
+        Pick up DenseStores that their datasets rebuilt on refresh
+        """
+        rebuilt = [name for name, dataset in self.datasets.items()
+                   if dataset.dense is not None and dataset.dense is not self._stores[name]]
+        for name in rebuilt:
+            self._stores[name] = self.datasets[name].dense
+        if rebuilt:
+            self._align()
+        return
+
+    @property
+    def sources(self):
+        return list(self._stores)
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the store beyond the shared DenseStores: the date axis and the date positions
+        """
+        return self.dates.nbytes + sum(positions.nbytes for positions in self._date_positions.values())
+
+    def sources_of(self, location):
+        """
+        Return the sources that hold location
+
+        :param location: str
+
+        :return: list of str
+        """
+
+        self._sync()
+        return [name for name, store in self._stores.items() if location in store.location_map]
+
+    def _resolve(self, keys):
+        """
+        Expand bare locations in keys to a (source, location) key for each source that holds them
+        """
+        resolved = []
+        for key in keys:
+            if isinstance(key, str):
+                resolved.extend((name, key) for name in self.sources_of(key))
+            else:
+                resolved.append(tuple(key))
+        return resolved
+
+    def _populations(self, source, locations):
+        """
+        Return the populations of locations under the names used by source: from the dataset's own populations()
+        where it has one, else from the population table through the dataset's location_map
+        """
+        dataset = self.datasets[source]
+        if callable(getattr(dataset, 'populations', None)):
+            return np.asarray(dataset.populations(locations), dtype=float)
+        return population_table.populations(locations, aliases=getattr(dataset, 'location_map', None))
+
+    def frame(self, var, *keys, **kwargs):
+        """
+        Return a DataFrame date x (source, location) -> var, aligned on the shared date axis
+
+        :param var: str - variable of the datasets
+        :param keys: (str, str) or str - (source, location) keys, a bare location selects it in every source
+        :keyword per_million: boolean (default=False) - divide by the population in millions from the population
+                              table, looked up under each source's aliases of the location names
+        :keyword dropna: boolean (default=True) - drop the dates on which none of the keys has a row
+
+        :return: DataFrame with a (source, location) MultiIndex of columns and a DatetimeIndex
+        """
+
+        self._sync()
+        keys = self._resolve(keys)
+        values = np.full((len(self.dates), len(keys)), np.nan)
+        present = np.zeros(len(self.dates), dtype=bool)
+
+        by_source = {}
+        for column, (name, location) in enumerate(keys):
+            if name not in self._stores:
+                raise KeyError(f"unknown source {name!r}")
+            by_source.setdefault(name, []).append((column, location))
+        for name, selected in by_source.items():
+            store = self._stores[name]
+            known = [(column, store.location_map[location]) for column, location in selected
+                     if location in store.location_map]
+            if not known or var not in store.variable_map:
+                continue
+            columns, positions = (np.array(axis, dtype=np.intp) for axis in zip(*known))
+            rows = self._date_positions[name]
+            values[rows[:, None], columns[None, :]] = store.values[:, positions, store.variable_map[var]]
+            present[rows] |= store.present[:, positions].any(axis=1)
+
+        if kwargs.get("per_million", False):
+            populations = np.full(len(keys), np.nan)
+            for name, selected in by_source.items():
+                columns, locations = zip(*selected)
+                populations[list(columns)] = self._populations(name, list(locations))
+            values /= populations / 1e6
+        result = pd.DataFrame(values, index=self.dates,
+                              columns=pd.MultiIndex.from_tuples(keys, names=['source', 'location']))
+        if kwargs.get("dropna", True):
+            result = result[present]
+        return result
+
+    def compare(self, var, location, **kwargs):
+        """
+        Return a DataFrame date x source -> var of location in every source that holds it
+
+        :param var: str
+        :param location: str
+        :keyword: keyword arguments of frame()
+
+        :return: DataFrame
+        """
+
+        result = self.frame(var, location, **kwargs)
+        result.columns = result.columns.get_level_values('source')
+        return result
+
+    def value(self, var, source, location, date):
+        """
+        Return var of location on date in source, nan if there is no such row
+
+        :param var: str
+        :param source: str
+        :param location: str
+        :param date: str or datetime like
+
+        :return: float
+        """
+
+        self._sync()
+        store = self._stores[source]
+        row = self._source_dates[source].get_indexer([pd.Timestamp(date)])[0]
+        if row < 0 or location not in store.location_map or var not in store.variable_map:
+            return np.nan
+        return store.values[row, store.location_map[location], store.variable_map[var]]
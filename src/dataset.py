@@ -1,7 +1,144 @@
+import functools
+from pathlib import Path
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 from .utilities import rate_to_dbl, dbl_to_rate, dbl_colour
+from .kernels import rolling_mean, diff, ratio, rolling_ratio, window_growth
+from .store import write_columns, read_columns
+from .cache import LRUCache
+from .dense import DenseStore
+from .fetch import open_source, is_url
+from .materialize import MaterializedMetrics, DEFAULT_METRICS
+from .instrument import stage, instrumented
 
+_MISSING = object()
+
+
+def _cache_key(value):
+    """
+    Convert lists, tuples, sets and dicts in value to hashable equivalents
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_cache_key(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _cache_key(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return frozenset(value)
+    return value
+
+
+def _copy(result):
+    """
+    Return a copy of a cached DataFrame or Series, keeping its dtypes, so that callers cannot modify the shared
+    result
+    """
+    if isinstance(result, (pd.DataFrame, pd.Series)):
+        return result.copy()
+    return result
+
+
+def memoized(method):
+    """
+    Cache the results of a CovidDataset method in the dataset's LRU cache.  Callers get a copy of the cached result
+    since it is shared between them.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, _cache_key(args), _cache_key(kwargs))
+        try:
+            result = self._cache.get(key, _MISSING)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        if result is _MISSING:
+            with stage(f"{type(self).__name__}.{method.__name__}") as s:
+                result = None
+                if self._materialized is not None:
+                    result = self._materialized.lookup(method.__name__, args, kwargs)
+                if result is None:
+                    result = method(self, *args, **kwargs)
+                s.rows = len(result) if isinstance(result, pd.DataFrame) else None
+            self._cache.put(key, result)
+        return _copy(result)
+    return wrapper
+
+
+def _row_hashes(df):
+    """
+    Return a hash of every row of df indexed by (location, date)
+    """
+    return pd.Series(pd.util.hash_pandas_object(df, index=False).to_numpy(),
+                     index=pd.MultiIndex.from_arrays([df['location'], df['date']]))
+
+
+def _integer_dtype(low, high):
+    for dtype in ('Int8', 'Int16', 'Int32'):
+        info = np.iinfo(dtype.lower())
+        if info.min <= low and high <= info.max:
+            return dtype
+    return 'Int64'
+
+
+def compact_frame(df, dtypes=None):
+    """
+    Return a copy of df using compact dtypes:
+     - date as datetime64
+     - string and categorical columns as categoricals
+     - numeric columns holding whole numbers as the smallest nullable integer type, other numeric columns as float32
+       where that represents every value exactly
+
+    The original dtypes of the numeric columns are kept in attrs['dtypes'] so that results can be returned in them.
+
+    :param df: pd.DataFrame
+    :param dtypes: dict (default=df.attrs['dtypes']) - original dtypes of columns that are already compact
+
+    :return: pd.DataFrame
+    """
+    dtypes = dict(df.attrs.get('dtypes', {}) if dtypes is None else dtypes)
+    data = {}
+    for name in df.columns:
+        col = df[name]
+        if name == 'date':
+            data[name] = pd.to_datetime(col)
+        elif col.dtype == object or isinstance(col.dtype, pd.CategoricalDtype):
+            data[name] = col.astype('category')
+        elif pd.api.types.is_numeric_dtype(col.dtype) and not pd.api.types.is_bool_dtype(col.dtype):
+            dtypes.setdefault(name, str(col.dtype))
+            values = col.to_numpy(dtype=float, na_value=np.nan)
+            known = values[~np.isnan(values)]
+            if known.size and np.isfinite(known).all() and np.array_equal(known, np.round(known)):
+                data[name] = pd.array(values, dtype=_integer_dtype(known.min(), known.max()))
+            elif np.array_equal(values.astype(np.float32), values, equal_nan=True):
+                data[name] = values.astype(np.float32)
+            else:
+                data[name] = values
+        else:
+            data[name] = col
+    result = pd.DataFrame(data, index=df.index, columns=df.columns)
+    result.attrs['dtypes'] = {name: dtype for name, dtype in dtypes.items() if name in result.columns}
+    return result
+
+
+def _as_windows(window):
+    return [int(w) for w in np.atleast_1d(window)]
+
+
+def _like(values, like):
+    """
+    Wrap a dates x locations kernel result in a DataFrame with the index and columns of like
+    """
+    return pd.DataFrame(values, index=like.index, columns=like.columns)
+
+
+def _window_frame(growth, windows, like, single):
+    """
+    Wrap the result of window_growth in a DataFrame shaped like like
+    """
+    if single:
+        return pd.DataFrame(growth[0], index=like.index, columns=like.columns)
+    columns = pd.MultiIndex.from_product([windows, like.columns], names=['window', like.columns.name])
+    values = growth.transpose(1, 0, 2).reshape(len(like.index), -1)
+    return pd.DataFrame(values, index=like.index, columns=columns)
 
 
 class CovidDataset:
@@ -28,23 +165,318 @@ class CovidDataset:
     }
 
 
-    def __init__(self, src_df):
+    # Maximum number of results held by the analytic method cache
+    cache_size = 256
+
+    # Default source of the data, set by the datasets that read one
+    url = None
+
+    def __init__(self, src_df, **kwargs):
         """
         Initialize object from a source dataframe
 
         :param src_df: pd.DataFrame - src_df.columns must include self.variables
+        :keyword cache_size: int (default=CovidDataset.cache_size) - size of the analytic method cache
+        :keyword dense: boolean (default=False) - also hold the data as a dense date x location x variable array
+                        so that location queries are array slices rather than pivots
+        :keyword compact: boolean (default=False) - hold the data in the compact dtypes of compact_frame().  The
+                          analytic methods return the same results in either case
+        :keyword materialize: boolean or list like of tuple (default=False) - compute the metrics of
+                              src.materialize (DEFAULT_METRICS if True) for all locations after each load or refresh,
+                              so that the analytic methods look them up.  Tables are written only by save()
         """
 
+        self._cache = LRUCache(kwargs.get("cache_size", self.cache_size))
+        self._dense_enabled = kwargs.get("dense", False)
+        self._compact = kwargs.get("compact", False)
+        materialize = kwargs.get("materialize", False)
+        self._metrics = DEFAULT_METRICS if materialize is True else list(materialize or [])
+        self._materialized = None
         self.df = src_df
         return
 
+    @property
+    def df(self):
+        return self._df
+
+    @df.setter
+    def df(self, src_df):
+        """
+        Replace the data.  Rows are ordered by (location, date) and the row range of each location is indexed so
+        that location queries only touch the rows they return.
+
+        :param src_df: pd.DataFrame
+        """
+
+        self._index_rows(src_df)
+        self._dense = self._build_dense() if self._dense_enabled else None
+        self._cache.clear()
+        self._materialize()
+        return
+
+    def _materialize(self):
+        """
+        Compute the materialized metrics, or read them from the directory saved with the data by load()
+        """
+
+        self._materialized = None
+        # a saved table only describes the data it was loaded with, later data is computed
+        saved, self._saved_derived = getattr(self, '_saved_derived', None), None
+        if not self._metrics:
+            return
+        with stage(f"{type(self).__name__}.materialize", rows=len(self._df)):
+            if saved is not None and MaterializedMetrics.exists(saved, self._metrics):
+                self._materialized = MaterializedMetrics.load(saved)
+            else:
+                self._materialized = MaterializedMetrics.compute(self, self._metrics)
+        return
+
+    @property
+    def materialized(self):
+        """
+        The MaterializedMetrics of the data, or None if the dataset was created without materialize
+        """
+
+        return self._materialized
+
+    def _build_dense(self):
+        with stage(f"{type(self).__name__}.build_dense", rows=len(self._df)):
+            return DenseStore(self._df, self.variables, self._dtypes)
+
+    def _index_rows(self, src_df, dtypes=None):
+        """
+        Order src_df by (location, date), store it as the data and index the row range of each location.  In
+        compact mode src_df is converted to compact dtypes first.
+
+        :param src_df: pd.DataFrame
+        :param dtypes: dict (default=src_df.attrs['dtypes']) - original dtypes of columns that are already compact
+        """
+
+        if self._compact:
+            with stage(f"{type(self).__name__}.compact", rows=len(src_df)):
+                src_df = compact_frame(src_df, dtypes)
+        # dtypes the analytic methods return compact numeric columns in
+        self._dtypes = {name: pd.api.types.pandas_dtype(dtype)
+                        for name, dtype in src_df.attrs.get('dtypes', {}).items()}
+
+        with stage(f"{type(self).__name__}.index_rows", rows=len(src_df)):
+            codes, uniques = pd.factorize(src_df['location'], sort=True)
+            dates = src_df['date'].to_numpy()
+            same_location = codes[1:] == codes[:-1]
+            in_order = np.all(codes[1:] >= codes[:-1]) and not np.any(same_location & (dates[1:] < dates[:-1]))
+            if not in_order:
+                order = np.lexsort((dates, codes))
+                src_df = src_df.take(order)
+                codes = codes[order]
+
+            starts = np.searchsorted(codes, np.arange(len(uniques)), side='left')
+            stops = np.searchsorted(codes, np.arange(len(uniques)), side='right')
+        self._df = src_df
+        self._location_index = {loc: slice(start, stop) for loc, start, stop in zip(uniques, starts, stops)}
+        return
+
+    @classmethod
+    def parse(cls, source, **options):
+        """
+        Read a local copy of the source data into the dataset layout, without the derived columns
+
+        :param source: str, Path or file-like
+        :param options: reader specific options, see the parse method of each dataset
+
+        :return: pd.DataFrame
+        """
+
+        # a dataset built from a DataFrame has no reader of its own
+        raise ValueError(f"{cls.__name__} was not read from a source and cannot be refreshed")
+
+    @classmethod
+    def derive(cls, df):
+        """
+        Add the columns computed from the source columns (rates, per capita values).  Derived values only depend on
+        their own row, so refresh() computes them for new and revised rows only.
+
+        :param df: pd.DataFrame - output of parse()
+
+        :return: pd.DataFrame
+        """
+
+        return df
+
+    def _ingest(self, parse_options=None, **kwargs):
+        """
+        Fetch and parse the source data, keeping a hash of every source row for refresh()
+
+        :param parse_options: dict (default=no options) - keyword arguments of parse(), also used by refresh()
+        :keyword source: str - url or local path of the data (default=self.url)
+        :keyword fetcher: Fetcher - fetcher used for url sources (default=the shared snapshot cache)
+
+        :return: pd.DataFrame
+        """
+
+        self.src_url = kwargs.get("source", self.url)
+        self.fetcher = kwargs.get("fetcher")
+        self._parse_options = parse_options or {}
+        name = type(self).__name__
+        with stage(f"{name}.fetch"):
+            self._source = open_source(self.src_url, self.fetcher)
+        parsed = self._parse(self._source)
+        with stage(f"{name}.derive", rows=len(parsed)):
+            return self.derive(parsed)
+
+    def _parse(self, source):
+        """
+        Parse source with the options of the dataset and hash the parsed rows
+        """
+
+        name = type(self).__name__
+        with stage(f"{name}.parse") as s:
+            parsed = self.parse(source, **self._parse_options)
+            s.rows = len(parsed)
+        with stage(f"{name}.hash_rows", rows=len(parsed)):
+            self._row_hashes = _row_hashes(parsed)
+        return parsed
+
+    def refresh(self):
+        """
+        Fetch the source again and merge the rows that are new or revised since the last load.  Derived columns are
+        computed for the merged rows only, rows no longer in the source are kept, and only the cached results that
+        involve a changed location are discarded.
+
+        :return: list - sorted locations with new or revised rows
+        """
+
+        if getattr(self, 'src_url', None) is None:
+            raise ValueError(f"{type(self).__name__} was not read from a source and cannot be refreshed")
+
+        name = type(self).__name__
+        with stage(f"{name}.refresh") as s:
+            with stage(f"{name}.fetch"):
+                source = open_source(self.src_url, self.fetcher)
+            if is_url(self.src_url) and source == self._source:
+                # Snapshots are content addressed, so an unchanged snapshot path means unchanged data
+                return []
+            known = self._row_hashes
+            parsed = self._parse(source)
+            hashes = self._row_hashes
+            self._source = source
+
+            positions = known.index.get_indexer(hashes.index)
+            changed = (positions < 0) | (known.to_numpy()[positions] != hashes.to_numpy())
+            if not changed.any():
+                self._row_hashes = known
+                return []
+
+            with stage(f"{name}.derive", rows=int(changed.sum())):
+                rows = self.derive(parsed.iloc[np.flatnonzero(changed)].copy())
+            changed_keys = hashes.index[changed]
+            stale = pd.MultiIndex.from_arrays([self.df['location'], self.df['date']]).isin(changed_keys)
+            self._row_hashes = pd.concat([known[~known.index.isin(changed_keys)], hashes[changed]])
+
+            locations = sorted(set(rows['location']))
+            self._merge_rows(pd.concat([self.df.iloc[np.flatnonzero(~stale)], rows], ignore_index=True), rows,
+                             locations)
+            s.rows = len(rows)
+        return locations
+
+    def _merge_rows(self, src_df, rows, locations):
+        """
+        Replace the data with src_df, which differs from the current data in rows only
+
+        :param src_df: pd.DataFrame - the new data
+        :param rows: pd.DataFrame - the new and revised rows
+        :param locations: list like - the locations of rows
+        """
+
+        self._index_rows(src_df, {name: str(dtype) for name, dtype in self._dtypes.items()})
+        if self._dense is not None and not self._dense.update(rows):
+            self._dense = self._build_dense()
+        changed = set(locations)
+        self._cache.discard(lambda key: any(arg in changed for arg in key[1] if isinstance(arg, str)))
+        if self._materialized is not None:
+            # the metrics cover every location, so cached lookups of unchanged locations stay valid
+            self._materialize()
+        return
+
+    @property
+    def dense(self):
+        """
+        The DenseStore built at load, or None if the dataset was created with dense=False
+        """
+
+        return self._dense
+
+    def cache_info(self):
+        """
+        Return the statistics of the analytic method cache
+
+        :return: dict with keys hits, misses, size and maxsize
+        """
+
+        return self._cache.info()
+
+    @property
+    def locations(self):
+        return list(self._location_index)
+
+    def _location_rows(self, locations):
+        """
+        Return the positions in self.df of the rows for locations
+
+        :param locations: list like
+
+        :return: np.array
+        """
+
+        slices = [self._location_index[loc] for loc in dict.fromkeys(locations) if loc in self._location_index]
+        if not slices:
+            return np.array([], dtype=np.intp)
+        return np.concatenate([np.arange(sl.start, sl.stop) for sl in slices])
+
+    def save(self, path):
+        """
+        Save the parsed data in the columnar binary format of src.store
+
+        :param path: str or Path - directory to be written
+        """
+
+        with stage(f"{type(self).__name__}.save", rows=len(self.df)):
+            write_columns(self.df, path)
+            if self._materialized is not None:
+                self._materialized.save(Path(path) / "derived")
+        return
+
+    @classmethod
+    def load(cls, path, columns=None, mmap_mode="r", **kwargs):
+        """
+        Load a dataset saved with save() without re-parsing the source data
+
+        :param path: str or Path - directory written by save()
+        :param columns: list like (default=all columns) - the variables to load. date and location are always loaded
+        :param mmap_mode: str or None (default='r') - memory-map the columns; None reads them into memory
+        :keyword: keyword arguments of CovidDataset.__init__.  Materialized metrics saved with the data are read
+                  rather than computed, path itself is never written
+
+        :return: instance of cls
+        """
+
+        if columns is not None:
+            columns = ['date', 'location'] + [col for col in columns if col not in ('date', 'location')]
+        result = cls.__new__(cls)
+        result._saved_derived = Path(path) / "derived"
+        with stage(f"{cls.__name__}.load") as s:
+            df = read_columns(path, columns=columns, mmap_mode=mmap_mode)
+            s.rows = len(df)
+        CovidDataset.__init__(result, df, **kwargs)
+        return result
+
     @property
     def current_date(self):
         return max(self.df.date)
 
     def get_location(self, location):
-        return self.df.loc[self.df.location == location]
+        return self.df.iloc[self._location_index.get(location, slice(0, 0))]
 
+    @memoized
     def var_by_location(self, var, *locations, **kwargs):
         """
         Return a DataFrame date x location -> var
@@ -59,15 +491,26 @@ class CovidDataset:
         if var not in self.variables:
             return NotImplemented
 
-        select_locations = self.df['location'].apply(lambda loc: loc in locations)
-        df = self.df.loc[select_locations]
-        var_pivot = df.pivot(index='date', columns='location', values=var)
-        var_pivot.resample('D').fillna(method='ffill')
+        if self._dense is not None and var in self._dense.variable_map:
+            var_pivot = self._dense.frame(var, locations)
+        else:
+            columns = [self.df.columns.get_loc(col) for col in ('date', 'location', var)]
+            df = self.df.iloc[self._location_rows(locations), columns]
+            if var in self._dtypes:
+                df = df.assign(**{var: df[var].astype(self._dtypes[var])})
+            var_pivot = df.pivot(index='date', columns='location', values=var)
+            if isinstance(var_pivot.columns, pd.CategoricalIndex):
+                # pivoting categoricals keeps the row order of the locations, pivoting strings sorts them
+                var_pivot.columns = pd.Index(np.asarray(var_pivot.columns, dtype=object), name='location')
+                if not var_pivot.columns.is_monotonic_increasing:
+                    var_pivot = var_pivot.sort_index(axis=1)
 
         if "ma_window" in kwargs:
-            var_pivot = var_pivot.rolling(kwargs["ma_window"]).mean()
+            var_pivot = _like(rolling_mean(var_pivot.to_numpy(dtype=float, na_value=np.nan), kwargs["ma_window"]),
+                              var_pivot)
         return var_pivot
 
+    @memoized
     def active_confirmed_cases(self, *locations, **kwargs):
         """
         Return an estimate of the active confirmed cases.
@@ -82,10 +525,12 @@ class CovidDataset:
         """
 
         if kwargs.get("percapita", False):
-            return self.var_by_location("total_cases_per_million", *locations).diff(periods=14)
+            cases = self.var_by_location("total_cases_per_million", *locations)
         else:
-            return self.var_by_location("total_cases", *locations).diff(periods=14)
+            cases = self.var_by_location("total_cases", *locations)
+        return _like(diff(cases.to_numpy(dtype=float, na_value=np.nan), 14), cases)
 
+    @memoized
     def pos_test_rate(self, window,  *locations):
         """
         Return the positive test rate based on the total new cases in the window over the total tests completed
@@ -97,10 +542,10 @@ class CovidDataset:
         :return: DataFrame
         """
 
-        cases = self.var_by_location("total_cases", *locations).diff(periods=window)
-        tests = self.var_by_location("total_tests", *locations).diff(periods=window)
-
-        return cases / tests
+        cases = self.var_by_location("total_cases", *locations)
+        tests = self.var_by_location("total_tests", *locations)
+        return _like(rolling_ratio(cases.to_numpy(dtype=float, na_value=np.nan),
+                                   tests.to_numpy(dtype=float, na_value=np.nan), window), cases)
 
     def incidence(self, window, *locations, **kwargs):
         """
@@ -137,31 +582,38 @@ class CovidDataset:
         """
         return
 
+    @memoized
     def growth_rate(self, var, window, *locations):
         """
         Return a DataFrame indexed by date and with columns containing average growth rate over window
 
         :param var: str - the variable for which average growth is calculated
-        :param window: int - number of days to include in the average calculation
+        :param window: int or list like of int - number of days to include in the average calculation. If a list of
+                       windows is given the base data is fetched once and the columns are a (window, location)
+                       MultiIndex
         :param locations: list like - locations to be included as columns
 
         :return: DataFrame
         """
-        growth = lambda x: np.power(x, 1 / window)
+        windows = _as_windows(window)
 
         if var in self.variables:
-            var_data = self.var_by_location(var, *locations)
+            bases = [self.var_by_location(var, *locations)] * len(windows)
         elif var == "active_confirmed_cases":
-            var_data = self.active_confirmed_cases(*locations)
+            bases = [self.active_confirmed_cases(*locations)] * len(windows)
         elif var == "pos_test_rate":
-            var_data = self.pos_test_rate(window, *locations)
+            bases = [self.pos_test_rate(w, *locations) for w in windows]
         else:
             return NotImplemented
 
-        delta = var_data.diff(periods=window)
-        delta_ratio = (delta / var_data.shift(periods=window)).replace([np.inf, -np.inf], np.nan)
-        return growth(1 + delta_ratio) - 1
+        if bases[0] is bases[-1]:
+            growth = window_growth(bases[0].to_numpy(dtype=float, na_value=np.nan), windows, finite=True)
+        else:
+            growth = np.stack([window_growth(base.to_numpy(dtype=float, na_value=np.nan), [w], finite=True)[0]
+                               for base, w in zip(bases, windows)])
+        return _window_frame(growth, windows, bases[0], np.ndim(window) == 0)
 
+    @memoized
     def cum_pos_test_rate(self, *locations):
         """
         Return a DataFrame date x locations -> positive test rate
@@ -171,24 +623,55 @@ class CovidDataset:
         :return: DataFrame
         """
 
-        return (self.var_by_location('total_cases', *locations)
-                  / self.var_by_location('total_tests', *locations).interpolate(method='linear'))
+        cases = self.var_by_location('total_cases', *locations)
+        tests = self.var_by_location('total_tests', *locations).astype(float).interpolate(method='linear')
+        return _like(ratio(cases.to_numpy(dtype=float, na_value=np.nan), tests.to_numpy(dtype=float, na_value=np.nan)),
+                     cases)
 
     def cum_pos_test_growth_rate(self, window, *locations):
         """
         Return a DataFrame date x locations -> positive test rate  average growth over window
 
+        :param window: int or list like of int - if a list of windows is given the columns are a (window, location)
+                       MultiIndex
         :param locations: list like - locations to be included as columns
 
         :return: DataFrame
         """
 
-        growth = lambda x: np.power(x, 1 / window)
-
+        windows = _as_windows(window)
         pt = self.cum_pos_test_rate(*locations)
-        delta = pt.diff(periods=window)
-        return growth(1 + (delta / pt)) - 1
+        growth = window_growth(pt.to_numpy(dtype=float, na_value=np.nan), windows, finite=False,
+                               relative_to_current=True)
+        return _window_frame(growth, windows, pt, np.ndim(window) == 0)
+
+    def var_plot_data(self, var, *locations, **kwargs):
+        """
+        Return the data drawn by plot_var
+
+        :param var: str - variable to be plotted
+        :param locations: str - list like of str - the locations to be plotted
+        :keyword ma_window: int - if present the moving average over ma_window
+        :keyword percapita: boolean (default=False) Valid only if var is active_confirmed_cases
+
+        :return: DataFrame date x locations
+        """
 
+        if var == "cum_pos_test_rate":
+            return self.cum_pos_test_rate(*locations)
+        elif var == "cum_pos_test_growth_rate":
+            return self.cum_pos_test_growth_rate(kwargs.get("ma_window", 1), *locations)
+        elif var == "active_confirmed_cases":
+            return self.active_confirmed_cases(*locations, percapita=kwargs.get("percapita", False))
+        elif var[-6:] == "growth":
+            return self.growth_rate(var[:-7], kwargs.get("ma_window", 1), *locations)
+        elif "ma_window" in kwargs:
+            if var == "pos_test_rate":
+                return self.pos_test_rate(kwargs["ma_window"], *locations)
+            return self.var_by_location(var, *locations, ma_window=kwargs["ma_window"])
+        return self.var_by_location(var, *locations)
+
+    @instrumented("{cls}.plot_var")
     def plot_var(self, var, *locations, **kwargs):
         """
         plot variable for locations on single axis
@@ -211,43 +694,30 @@ class CovidDataset:
         :return: matplotlib.figure
         """
 
-        if var == "cum_pos_test_rate":
-            plot_data = self.cum_pos_test_rate(*locations)
-        elif var == "cum_pos_test_growth_rate":
-            plot_data = self.cum_pos_test_growth_rate(kwargs.get("ma_window", 1), *locations)
-        elif var == "active_confirmed_cases":
-            plot_data = self.active_confirmed_cases(*locations, **kwargs)
-        elif var[-6:] == "growth":
-            plot_data = self.growth_rate(var[:-7], kwargs.get("ma_window", 1), *locations)
-        elif "ma_window" in kwargs:
-            if var == "pos_test_rate":
-                plot_data = self.pos_test_rate(kwargs["ma_window"], *locations)
-            else:
-                plot_data = self.var_by_location(var, *locations, ma_window=kwargs["ma_window"])
-        else:
-            plot_data = self.var_by_location(var, *locations)
+        return draw_var(self.var_plot_data(var, *locations, **kwargs), var, locations, **kwargs)
 
-        start_date = kwargs.get("date_start", plot_data.index[0])
-        end_date = kwargs.get("date_end", plot_data.index[-1])
+    def location_plot_data(self, *locations, **kwargs):
+        """
+        Return the data drawn by plot_location for each of locations, computed with one query per variable
+
+        :param locations: str - the locations to be plotted
+        :keyword from_date: str = yyyy-mm-dd - first date
 
-        plot_properties = dict(
-            figsize=kwargs.get("figsize", (16,12)),
-            xlim=(start_date, end_date),
-            logy=kwargs.get("log_scale", False),
-            lw=kwargs.get("lw", 3),
-            title=kwargs.get("title", ""),
-            ylabel=kwargs.get("y_label","")
-        )
-        if "colours" in kwargs:
-            plot_properties["color"] = [kwargs["colours"][loc] for loc in sorted(locations)]
-        fig = plot_data.plot(**plot_properties)
+        :return: DataFrame date x (location, series) where series are growth_3, growth_7, growth_28 (growth rates of
+                 total cases), total_cases and total_deaths
+        """
 
-        legend_labels = [f"{loc}: {var}={plot_data.to_dict()[loc][max(plot_data[:end_date].index)]:.4f}"
-                         for loc in sorted(locations)]
+        start = kwargs.get("from_date", None)
+        gwth = self.growth_rate("total_cases", [3, 7, 28], *locations)
+        series = {f"growth_{window}": gwth[window] for window in (3, 7, 28)}
+        series["total_cases"] = self.var_by_location("total_cases", *locations)
+        series["total_deaths"] = self.var_by_location("total_deaths", *locations)
 
-        plt.legend(legend_labels)
-        return fig
+        data = pd.concat(series, axis=1, names=['series', 'location'])
+        data = data.swaplevel(axis=1).sort_index(axis=1, level='location', sort_remaining=False)
+        return data.loc[start:]
 
+    @instrumented("{cls}.plot_location")
     def plot_location(self, location, **kwargs):
         """
         Plot relevant data for a single location.
@@ -264,64 +734,94 @@ class CovidDataset:
         :return: matplotlib.plot.figure
         """
 
-        fig = plt.figure(figsize=kwargs.get("figsize", (16,12)))
-        ax_l = fig.add_subplot(111)
-        # ax_l.xaxis.set_major_locator(MultipleLocator(7))
+        return draw_location(self.location_plot_data(location, **kwargs)[location], **kwargs)
+
 
-        start = kwargs.get("from_date", 0)
+def draw_var(plot_data, var, locations, **kwargs):
+    """
+    Draw the data of CovidDataset.var_plot_data, see CovidDataset.plot_var for the keyword arguments
+
+    :param plot_data: DataFrame date x locations
+    :param var: str - variable name used in the legend
+    :param locations: list like of str
+    :keyword ax: matplotlib.axes.Axes (default=new pyplot figure) - axes to draw on
+
+    :return: matplotlib.axes.Axes
+    """
+
+    start_date = kwargs.get("date_start", plot_data.index[0])
+    end_date = kwargs.get("date_end", plot_data.index[-1])
 
-        gwth_3 = self.growth_rate("total_cases", 3, location)[start:]
-        gwth_7 = self.growth_rate("total_cases", 7, location)[start:]
-        gwth_28 = self.growth_rate("total_cases", 28, location)[start:]
+    plot_properties = dict(
+        figsize=kwargs.get("figsize", (16,12)),
+        xlim=(start_date, end_date),
+        logy=kwargs.get("log_scale", False),
+        lw=kwargs.get("lw", 3),
+        title=kwargs.get("title", ""),
+        ylabel=kwargs.get("y_label","")
+    )
+    if "colours" in kwargs:
+        plot_properties["color"] = [kwargs["colours"][loc] for loc in sorted(locations)]
+    if kwargs.get("ax") is not None:
+        plot_properties["ax"] = kwargs["ax"]
+    fig = plot_data.plot(**plot_properties)
 
-        deaths = self.var_by_location("total_deaths", location)[start:]
-        cases = self.var_by_location("total_cases", location)[start:]
+    last = plot_data.loc[:end_date].iloc[-1]
+    legend_labels = [f"{loc}: {var}={last[loc]:.4f}" for loc in sorted(locations)]
 
-        dates = deaths.index
-        # print([list(map(str, dates))])
+    fig.legend(legend_labels)
+    return fig
 
-        x_ticks = [k for k in range(0,len(dates), 7)]
-        x_tick_labels = [str(dates[x])[10:15] for x in x_ticks]
-        ax_l.set_xticks(x_ticks)
-        ax_l.set_xticklabels(x_tick_labels)
-        ax_l.set_xlabel("2020")
-        # ax_l.xaxis.set_major_locator(MultipleLocator(14))
 
+def draw_location(data, **kwargs):
+    """
+    Draw the data of one location of CovidDataset.location_plot_data, see CovidDataset.plot_location
+
+    :param data: DataFrame date x series
+    :keyword figsize: (float, float)
+    :keyword figure: matplotlib.figure.Figure (default=new pyplot figure) - empty figure to draw on
 
-        ax_l.plot(dates, gwth_3.values, label="3 day rolling average growth rate of total cases", c='g', lw=6)
-        ax_l.plot(dates, gwth_7.values, label="7 day rolling average growth rate of total cases", c='b', lw=6)
-        ax_l.plot(dates, gwth_28.values, label="28 day rolling average growth rate of total cases", c='r', lw=6)
+    :return: matplotlib.figure
+    """
+
+    fig = kwargs.get("figure")
+    if fig is None:
+        fig = plt.figure(figsize=kwargs.get("figsize", (16,12)))
+    ax_l = fig.add_subplot(111)
 
-        ax_r = ax_l.twinx()
-        ax_r.bar(dates, cases[location].values, color=(0,0,1, 0.3))
-        ax_r.plot(dates, deaths[location].values, label="Total Deaths", c='black',lw=6)
+    # dates are plotted by position so that string and datetime indexes give the same axis
+    dates = pd.to_datetime(data.index)
+    x = np.arange(len(dates))
+    x_ticks = x[::7]
+    ax_l.set_xticks(x_ticks)
+    ax_l.set_xticklabels(dates[x_ticks].strftime("%m-%d"))
+    ax_l.set_xlabel(str(dates[0].year) if len(dates) else "")
 
-        # for dbl_days, dbl_rate in self.dbl_periods.items():
-        #     if dbl_days == 28:
-        #         ax_l.axhspan(0, dbl_rate, color=self.dbl_colour[dbl_days], alpha=0.2)
-        #     elif dbl_days == 14:
-        #         ax_l.axhspan(self.dbl_periods[28], dbl_rate, color=self.dbl_colour[dbl_days], alpha=0.2)
-        #     else:
-        #         ax_l.axhline(y=dbl_rate, c=self.dbl_colour[dbl_days], lw=3)
-        y_ticks = ["inf",28,14,7,6,5,4,3,2,1]
-        for bot_idx, top_idx in zip(y_ticks[:-1], y_ticks[1:]):
-            bot, top = dbl_to_rate(bot_idx), dbl_to_rate(top_idx)
-            ax_l.axhspan(bot, top, color=dbl_colour[top_idx], alpha=0.2)
+    ax_l.plot(x, data["growth_3"].values, label="3 day rolling average growth rate of total cases", c='g', lw=6)
+    ax_l.plot(x, data["growth_7"].values, label="7 day rolling average growth rate of total cases", c='b', lw=6)
+    ax_l.plot(x, data["growth_28"].values, label="28 day rolling average growth rate of total cases", c='r', lw=6)
 
-        ax_l.set_yticks([dbl_to_rate(tick) for tick in y_ticks])
-        ax_l.set_yticklabels(y_ticks)
-        ax_l.set_ylabel("Number of Days to Double")
+    ax_r = ax_l.twinx()
+    ax_r.bar(x, data["total_cases"].values, color=(0,0,1, 0.3))
+    ax_r.plot(x, data["total_deaths"].values, label="Total Deaths", c='black',lw=6)
 
-        ax_r.set_ylabel('Log Total Cases')
-        ax_r.set_yscale('log')
-        ax_r.legend(loc='upper right')
+    y_ticks = [np.inf,28,14,7,6,5,4,3,2,1]
+    for bot_days, top_days in zip(y_ticks[:-1], y_ticks[1:]):
+        bot, top = dbl_to_rate(bot_days), dbl_to_rate(top_days)
+        ax_l.axhspan(bot, top, color=dbl_colour(top_days), alpha=0.2)
 
-        ax_l.annotate("Active Cases Stop Growing", (dates[0], 0.06))
+    ax_l.set_yticks([dbl_to_rate(tick) for tick in y_ticks])
+    ax_l.set_yticklabels(["inf"] + y_ticks[1:])
+    ax_l.set_ylabel("Number of Days to Double")
 
-        ax_l.legend(loc='upper left')
-        ax_l.set_ylim(bottom=0, top=0.5)
-        fig.tight_layout()
+    ax_r.set_ylabel('Log Total Cases')
+    ax_r.set_yscale('log')
+    ax_r.legend(loc='upper right')
 
-        return fig
+    ax_l.annotate("Active Cases Stop Growing", (0, 0.06))
 
+    ax_l.legend(loc='upper left')
+    ax_l.set_ylim(bottom=0, top=0.5)
+    fig.tight_layout()
 
+    return fig
@@ -0,0 +1,123 @@
+"""
+Dense date x location x variable representation of a long format CovidDataset frame.
+
+Building the array once lets location queries become array slices instead of DataFrame pivots.
+"""
+import numpy as np
+import pandas as pd
+
+
+class DenseStore:
+    """
+    One contiguous float array of shape (dates, locations, variables) with index maps for each axis
+    """
+
+    def __init__(self, df, variables, dtypes=None):
+        """
+        Build the array from a long format frame
+
+        :param df: pd.DataFrame - must contain date and location columns
+        :param variables: list like - candidate variables. The numeric ones present in df are stored
+        :param dtypes: dict (default=the dtypes of df) - dtypes frame() returns variables in
+        """
+
+        self.variables = [var for var in variables
+                          if var in df.columns and var not in ('date', 'location')
+                          and pd.api.types.is_numeric_dtype(df[var].dtype)]
+        date_codes, self.dates = pd.factorize(df['date'], sort=True)
+        loc_codes, locations = pd.factorize(df['location'], sort=True)
+        self.dates = pd.Index(self.dates, name='date')
+        self.locations = pd.Index(np.asarray(locations, dtype=object), name='location')
+
+        self.location_map = {loc: k for k, loc in enumerate(self.locations)}
+        self.variable_map = {var: k for k, var in enumerate(self.variables)}
+        self.dtypes = {var: (dtypes or {}).get(var, df[var].dtype) for var in self.variables}
+
+        valid = (date_codes >= 0) & (loc_codes >= 0)
+        date_codes, loc_codes = date_codes[valid], loc_codes[valid]
+        keys = np.sort(date_codes.astype(np.int64) * len(self.locations) + loc_codes)
+        if (keys[1:] == keys[:-1]).any():
+            # the error DataFrame.pivot gives for the same rows
+            raise ValueError("Index contains duplicate entries, cannot reshape")
+        self.values = np.full((len(self.dates), len(self.locations), len(self.variables)), np.nan)
+        for k, var in enumerate(self.variables):
+            self.values[date_codes, loc_codes, k] = df[var].to_numpy(dtype=float, na_value=np.nan)[valid]
+        self.present = np.zeros((len(self.dates), len(self.locations)), dtype=bool)
+        self.present[date_codes, loc_codes] = True
+        return
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.present.nbytes
+
+    def location_positions(self, locations):
+        """
+        Return the sorted positions of the known locations in locations
+
+        :param locations: list like
+
+        :return: np.array
+        """
+
+        return np.array(sorted({self.location_map[loc] for loc in locations if loc in self.location_map}),
+                        dtype=np.intp)
+
+    def frame(self, var, locations):
+        """
+        Return a DataFrame date x location -> var, equal to pivoting the source rows for locations
+
+        :param var: str - one of self.variables
+        :param locations: list like
+
+        :return: DataFrame
+        """
+
+        positions = self.location_positions(locations)
+        rows = self.present[:, positions].any(axis=1)
+        values = self.values[:, positions, self.variable_map[var]][rows]
+        result = pd.DataFrame(values, index=self.dates[rows], columns=self.locations[positions])
+        if pd.api.types.is_integer_dtype(self.dtypes[var]) and not np.isnan(values).any():
+            result = result.astype(self.dtypes[var])
+        return result
+
+    def update(self, rows):
+        """
+        Write new or revised rows into the array in place, growing the date axis for dates not in the array
+
+        :param rows: pd.DataFrame - long format rows with date and location columns
+
+        :return: boolean - False, leaving the array unchanged, if rows hold locations not in the array or no date
+        """
+
+        loc_codes = self.locations.get_indexer(rows['location'])
+        if (loc_codes < 0).any() or rows['date'].isna().any():
+            return False
+        self._add_dates(pd.Index(rows['date']).unique().difference(self.dates))
+        date_codes = self.dates.get_indexer(rows['date'])
+        for k, var in enumerate(self.variables):
+            if var in rows.columns:
+                self.values[date_codes, loc_codes, k] = rows[var].to_numpy(dtype=float, na_value=np.nan)
+        self.present[date_codes, loc_codes] = True
+        return True
+
+    def _add_dates(self, dates):
+        """
+        Add empty rows for the sorted dates, appending a block when they all follow the last date of the array
+        """
+
+        if not len(dates):
+            return
+        shape = (len(dates),) + self.values.shape[1:]
+        if not len(self.dates) or dates[0] > self.dates[-1]:
+            self.dates = self.dates.append(dates).rename('date')
+            self.values = np.concatenate([self.values, np.full(shape, np.nan)])
+            self.present = np.concatenate([self.present, np.zeros(shape[:2], dtype=bool)])
+            return
+        merged = self.dates.append(dates).sort_values().rename('date')
+        moved = merged.get_indexer(self.dates)
+        values = np.full((len(merged),) + self.values.shape[1:], np.nan)
+        present = np.zeros((len(merged), len(self.locations)), dtype=bool)
+        values[moved] = self.values
+        present[moved] = self.present
+        self.dates, self.values, self.present = merged, values, present
+        return
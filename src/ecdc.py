@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
-import datetime
-import time
+from collections import defaultdict
 from src import CovidDataset
+from src.populationdata import population_table
+
+_DEFAULT = object()
 
-# from src.populationdata import population_table
 
 class ECDC(CovidDataset):
     """
@@ -13,74 +14,154 @@ class ECDC(CovidDataset):
 
     # Location_map maps Country names in the ECDC dataset to the corresponding country name in the Population
     # Dataset
-    # location_map = {
-    #     'Bolivia': 'Bolivia (Plurinational State of)',
-    #     'Bonaire Sint Eustatius and Saba': 'Bonaire, Sint Eustatius and Saba',
-    #     'Brunei': 'Brunei Darussalam',
-    #     'Cape Verde': 'Cabo Verde',
-    #     "Cote d'Ivoire": "Côte d'Ivoire",
-    #     'Curacao': 'Curaçao',
-    #     'Czech Republic': 'Czechia',
-    #     'Democratic Republic of Congo': 'Democratic Republic of the Congo',
-    #     'Faeroe Islands': 'Faroe Islands',
-    #     'Falkland Islands': 'Falkland Islands (Malvinas)',
-    #     'Guernsey': None,
-    #     'Iran': 'Iran (Islamic Republic of)',
-    #     'Jersey': None,
-    #     'Kosovo': None,
-    #     'Laos': "Lao People's Democratic Republic",
-    #     'Macedonia': 'North Macedonia',
-    #     'Moldova': 'Republic of Moldova',
-    #     'Palestine': None,
-    #     'Russia': 'Russian Federation',
-    #     'South Korea': 'Republic of Korea',
-    #     'Swaziland': None,
-    #     'Syria': 'Syrian Arab Republic',
-    #     'Taiwan': 'China, Taiwan Province of China',
-    #     'Tanzania': 'United Republic of Tanzania',
-    #     'Timor': 'Timor-Leste',
-    #     'United States': 'United States of America',
-    #     'Vatican': None,
-    #     'Venezuela': 'Venezuela (Bolivarian Republic of)',
-    #     'Vietnam': 'Viet Nam'
-    # }
-
-    # @classmethod
-    # def _get_pop(cls, loc):
-    #     """
-    #     For locations in the ecdc dataset, return the population
-    #
-    #     :param loc: str - location
-    #     :return: (population: float or np.nan, population_density: float or np.nan)
-    #     """
-    #
-    #     lookup_name = cls.location_map.get(loc, loc)
-    #     if lookup_name == None:
-    #         return np.nan
-    #     else:
-    #         return population_table.get_population(lookup_name)
-
-    # @classmethod
-    # def _get_density(cls, loc):
-    #     """
-    #     For locations in the ecdc dataset, return the population
-    #
-    #     :param loc: str - location
-    #     :return: (population: float or np.nan, population_density: float or np.nan)
-    #     """
-    #
-    #     lookup_name = cls.location_map.get(loc, loc)
-    #     if lookup_name == None:
-    #         return np.nan
-    #     else:
-    #         return population_table.get_density(lookup_name)
-
-    def __init__(self):
-        dateparse = lambda x: datetime.date(*time.strptime(x, '%Y-%m-%d')[:3])
-        src_df = pd.read_csv('https://covid.ourworldindata.org/data/owid-covid-data.csv',
-                              error_bad_lines=False,
-                              warn_bad_lines=False,
-                              parse_dates=['date'],
-                              date_parser= dateparse)
-        super().__init__(src_df)
+    location_map = {
+        'Bolivia': 'Bolivia (Plurinational State of)',
+        'Bonaire Sint Eustatius and Saba': 'Bonaire, Sint Eustatius and Saba',
+        'Brunei': 'Brunei Darussalam',
+        'Cape Verde': 'Cabo Verde',
+        "Cote d'Ivoire": "Côte d'Ivoire",
+        'Curacao': 'Curaçao',
+        'Czech Republic': 'Czechia',
+        'Democratic Republic of Congo': 'Democratic Republic of the Congo',
+        'Faeroe Islands': 'Faroe Islands',
+        'Falkland Islands': 'Falkland Islands (Malvinas)',
+        'Guernsey': None,
+        'Iran': 'Iran (Islamic Republic of)',
+        'Jersey': None,
+        'Kosovo': None,
+        'Laos': "Lao People's Democratic Republic",
+        'Macedonia': 'North Macedonia',
+        'Moldova': 'Republic of Moldova',
+        'Palestine': None,
+        'Russia': 'Russian Federation',
+        'South Korea': 'Republic of Korea',
+        'Swaziland': None,
+        'Syria': 'Syrian Arab Republic',
+        'Taiwan': 'China, Taiwan Province of China',
+        'Tanzania': 'United Republic of Tanzania',
+        'Timor': 'Timor-Leste',
+        'United States': 'United States of America',
+        'Vatican': None,
+        'Venezuela': 'Venezuela (Bolivarian Republic of)',
+        'Vietnam': 'Viet Nam'
+    }
+
+    @classmethod
+    def populations(cls, locations):
+        """
+        For locations in the ecdc dataset, return the population
+
+        :param locations: list like
+        :return: np.array of float aligned with locations, np.nan where the population is unknown
+        """
+        return population_table.populations(locations, aliases=cls.location_map)
+
+    @classmethod
+    def densities(cls, locations):
+        """
+        For locations in the ecdc dataset, return the population density
+
+        :param locations: list like
+        :return: np.array of float aligned with locations, np.nan where the density is unknown
+        """
+        return population_table.densities(locations, aliases=cls.location_map)
+
+    url = 'https://covid.ourworldindata.org/data/owid-covid-data.csv'
+
+    # Source columns read by default: the dataset variables and the per capita columns.  The OWID file has many
+    # more, pass columns=None to read all of them
+    columns = list(CovidDataset.variables) + ['population',
+                                              'total_cases_per_million', 'new_cases_per_million',
+                                              'total_deaths_per_million', 'new_deaths_per_million',
+                                              'total_tests_per_thousand', 'new_tests_per_thousand']
+
+    # Columns of the OWID file that hold text, every other column is numeric
+    text_columns = ['iso_code', 'continent', 'location', 'date', 'tests_units']
+
+    # Number of source rows parsed at a time
+    chunksize = 100000
+
+    def __init__(self, **kwargs):
+        """
+        Load the OWID dataset
+
+        :keyword source: str - url or local path of the data (default=ECDC.url)
+        :keyword fetcher: Fetcher - fetcher used for url sources (default=the shared snapshot cache)
+        :keyword columns: list like or None (default=ECDC.columns) - source columns to read, None reads all of them
+        :keyword locations: list like (default=all locations) - only read rows for these locations
+        :keyword start: date like (default=first date) - only read rows on or after start
+        :keyword end: date like (default=last date) - only read rows on or before end
+        :keyword chunksize: int (default=ECDC.chunksize) - number of source rows parsed at a time
+        :keyword: other keyword arguments are passed to CovidDataset.__init__
+        """
+        options = {key: kwargs[key] for key in ('columns', 'locations', 'start', 'end', 'chunksize') if key in kwargs}
+        super().__init__(self._ingest(options, **kwargs), **kwargs)
         return
+
+    @classmethod
+    def parse(cls, source, columns=_DEFAULT, locations=None, start=None, end=None, chunksize=None):
+        """
+        Read OWID data in the layout of owid-covid-data.csv.  The file is parsed in chunks and only the projected
+        columns of the selected rows are kept, so memory use is bounded by the result rather than by the file.
+
+        :param source: str, Path or file-like - local copy of the data
+        :param columns: list like or None (default=ECDC.columns) - columns to read, None reads all of them
+        :param locations: list like (default=all locations) - only keep rows for these locations
+        :param start: date like (default=first date) - only keep rows on or after start
+        :param end: date like (default=last date) - only keep rows on or before end
+        :param chunksize: int (default=ECDC.chunksize) - number of source rows parsed at a time
+
+        :return: pd.DataFrame
+        """
+        if columns is _DEFAULT:
+            columns = cls.columns
+        if columns is None:
+            usecols = None
+            dtype = {col: object for col in cls.text_columns}
+        else:
+            wanted = set(columns) | {'date', 'location'}
+            usecols = lambda col: col in wanted
+            dtype = defaultdict(lambda: np.float64, {col: object for col in cls.text_columns})
+        if locations is not None:
+            locations = list(locations)
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+
+        # the selected rows of each chunk are kept column by column and each column is joined on its own, so the
+        # peak memory is the result plus one column rather than twice the result
+        pieces = {}
+        reader = pd.read_csv(source,
+                             usecols=usecols,
+                             dtype=dtype,
+                             chunksize=chunksize or cls.chunksize,
+                             error_bad_lines=False,
+                             warn_bad_lines=False)
+        for chunk in reader:
+            chunk['date'] = pd.to_datetime(chunk['date'], format='%Y-%m-%d')
+            keep = np.ones(len(chunk), dtype=bool)
+            if locations is not None:
+                keep &= chunk['location'].isin(locations).to_numpy()
+            if start is not None:
+                keep &= (chunk['date'] >= start).to_numpy()
+            if end is not None:
+                keep &= (chunk['date'] <= end).to_numpy()
+            for name in chunk.columns:
+                pieces.setdefault(name, []).append(chunk[name].to_numpy()[keep])
+        data = {name: np.concatenate(pieces.pop(name)) for name in list(pieces)}
+        return pd.DataFrame(data, copy=False)
+
+    @classmethod
+    def derive(cls, df):
+        """
+        Fill the populations the OWID file leaves blank from the population table, looking locations up under their
+        names there (location_map)
+
+        :param df: pd.DataFrame - output of parse()
+
+        :return: pd.DataFrame
+        """
+        if 'population' in df:
+            missing = df['population'].isna().to_numpy()
+            if missing.any():
+                df.loc[missing, 'population'] = cls.populations(df['location'][missing])
+        return df
@@ -0,0 +1,48 @@
+"""
+Build the datasets of a session with every download done concurrently up front.
+
+The upstream files are fetched into the snapshot cache by fetch_all, so the build takes about as long as the slowest
+download rather than the sum of all of them, and a url shared by several datasets is downloaded once.  The datasets
+are then parsed from the fresh snapshots.
+"""
+from .fetch import default_fetcher, prefetch
+from .populationdata import PopulationData, population_table
+from .ecdc import ECDC
+from .phac import PHAC
+from .ontario import Ontario
+
+# Datasets known to build_environment by name
+DATASETS = {'ecdc': ECDC, 'phac': PHAC, 'ontario': Ontario}
+
+
+def build_environment(datasets=('ecdc', 'phac'), **kwargs):
+    """
+    Download all sources concurrently and load the datasets
+
+    :param datasets: list like (default=('ecdc', 'phac')) - names of DATASETS to load
+    :keyword refresh_population: boolean (default=False) - also download the population sources and refresh
+                                 population_table before the datasets are loaded
+    :keyword sources: dict (default={}) - urls replacing the default source of a dataset name or of the population
+                      sources world, canada and us
+    :keyword fetcher: Fetcher (default=default_fetcher()) - its ttl must cover the build so that the datasets read
+                      the snapshots just downloaded
+    :keyword fetch_options: dict (default={}) - keyword arguments of fetch_all (max_connections, timeout, retries)
+    :keyword dataset_options: dict (default={}) - keyword arguments of every dataset, e.g. dense or compact
+
+    :return: dict name -> dataset
+    """
+
+    sources = kwargs.get("sources", {})
+    fetcher = kwargs.get("fetcher") or default_fetcher()
+    urls = {name: sources.get(name, DATASETS[name].url) for name in datasets}
+    population_urls = {}
+    if kwargs.get("refresh_population", False):
+        population_urls = {name: sources.get(name, getattr(PopulationData, f"{name}_url"))
+                           for name in ('world', 'canada', 'us')}
+
+    paths = prefetch(list(population_urls.values()) + list(urls.values()), fetcher, **kwargs.get("fetch_options", {}))
+    if population_urls:
+        population_table.refresh({name: paths[url] for name, url in population_urls.items()})
+
+    options = kwargs.get("dataset_options", {})
+    return {name: DATASETS[name](source=url, fetcher=fetcher, **options) for name, url in urls.items()}
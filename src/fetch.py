@@ -0,0 +1,334 @@
+"""
+Shared fetch layer for the remote data sources.
+
+Downloads are stored in a content-addressed snapshot directory:
+
+    <snapshot_dir>/objects/<sha256 of content>   - one file per distinct download
+    <snapshot_dir>/index/<sha256 of url>.json    - validators and snapshot history for a url
+
+A url that was checked less than ttl seconds ago is served from its newest snapshot without touching the network.
+Otherwise a conditional request (If-None-Match / If-Modified-Since) is sent and a 304 response reuses the snapshot.
+In offline mode the newest snapshot is always used.  Only the newest keep snapshots of each url are kept, older
+objects are deleted once no url refers to them.
+
+fetch_all() downloads several sources concurrently with a bounded number of connections, per-source timeouts and
+retries, fetching each distinct url once.  Timeouts are socket timeouts applied by the download thread itself, so an
+attempt that times out has stopped before its retry starts and never holds a connection next to it.
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import warnings
+from collections import namedtuple
+from pathlib import Path
+
+from .cache import cache_dir
+from .instrument import instrumented
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def is_url(source):
+    return isinstance(source, str) and source.split(":", 1)[0].lower() in ("http", "https")
+
+
+class Fetcher:
+    """
+    Fetch remote files into a local snapshot directory
+    """
+
+    chunk_size = 1 << 20
+
+    def __init__(self, **kwargs):
+        """
+        Instantiate a Fetcher
+
+        :keyword snapshot_dir: str or Path (default=<cache root>/snapshots) - where snapshots are stored
+        :keyword ttl: float (default=3600) - seconds for which a snapshot is used without revalidation
+        :keyword offline: boolean (default=COVID19_OFFLINE environment variable) - never use the network
+        :keyword timeout: float (default=60) - socket timeout in seconds
+        :keyword keep: int or None (default=7) - number of snapshots kept for each url, None keeps every snapshot
+        """
+
+        if "snapshot_dir" in kwargs:
+            self.snapshot_dir = Path(kwargs["snapshot_dir"])
+        else:
+            self.snapshot_dir = cache_dir("snapshots")
+        self.ttl = kwargs.get("ttl", 3600)
+        self.offline = kwargs.get("offline", os.environ.get("COVID19_OFFLINE", "") not in ("", "0"))
+        self.timeout = kwargs.get("timeout", 60)
+        self.keep = kwargs.get("keep", 7)
+        self._lock = threading.RLock()
+        (self.snapshot_dir / "objects").mkdir(parents=True, exist_ok=True)
+        (self.snapshot_dir / "index").mkdir(parents=True, exist_ok=True)
+        return
+
+    def _index_path(self, url):
+        return self.snapshot_dir / "index" / f"{_sha256(url)}.json"
+
+    def object_path(self, digest):
+        return self.snapshot_dir / "objects" / digest
+
+    def snapshot(self, url):
+        """
+        Return the index record for url or None if url has never been fetched
+
+        :param url: str
+
+        :return: dict with keys url, digest, etag, last_modified, checked, history
+        """
+
+        path = self._index_path(url)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_index(self, record):
+        path = self._index_path(record["url"])
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f, indent=1)
+        os.replace(tmp, path)
+        return
+
+    def _store(self, response):
+        """
+        Stream a response body into a temporary file of the object store
+
+        :return: (str, str) - sha256 digest of the body and the path of the temporary file
+        """
+
+        digest = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.snapshot_dir / "objects", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in iter(lambda: response.read(self.chunk_size), b""):
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest.hexdigest(), tmp
+
+    @instrumented("Fetcher.fetch")
+    def fetch(self, url, timeout=None):
+        """
+        Return the path of a local snapshot of url, downloading it only if required
+
+        :param url: str
+        :param timeout: float (default=self.timeout) - socket timeout in seconds
+
+        :return: pathlib.Path
+        """
+
+        record = self.snapshot(url)
+        if record is not None:
+            current = self.object_path(record["digest"])
+            if not current.exists():
+                record = None
+
+        if record is not None and (self.offline or time.time() - record["checked"] < self.ttl):
+            return current
+        if self.offline:
+            raise FileNotFoundError(f"offline and no snapshot of {url} in {self.snapshot_dir}")
+
+        headers = {"User-Agent": "covid-19-fetch"}
+        if record is not None:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+
+        try:
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=timeout or self.timeout) as resp:
+                digest, tmp = self._store(resp)
+                etag = resp.headers.get("ETag")
+                last_modified = resp.headers.get("Last-Modified")
+        except urllib.error.HTTPError as err:
+            if err.code == 304 and record is not None:
+                record["checked"] = time.time()
+                self._write_index(record)
+                return current
+            if record is None:
+                raise
+            warnings.warn(f"using stale snapshot of {url}: {err}")
+            return current
+        except (urllib.error.URLError, OSError) as err:
+            if record is None:
+                raise
+            warnings.warn(f"using stale snapshot of {url}: {err}")
+            return current
+
+        now = time.time()
+        history = [] if record is None else record["history"]
+        if not history or history[-1]["digest"] != digest:
+            history.append({"digest": digest, "fetched": now})
+        # an object is only seen by prune() together with the index record that refers to it
+        with self._lock:
+            os.replace(tmp, self.object_path(digest))
+            self._write_index({
+                "url": url,
+                "digest": digest,
+                "etag": etag,
+                "last_modified": last_modified,
+                "checked": now,
+                "history": history
+            })
+            if self.keep is not None and len(history) > self.keep:
+                self.prune()
+        return self.object_path(digest)
+
+    def prune(self, keep=None):
+        """
+        Keep only the newest keep snapshots of each url and delete the objects no url refers to
+
+        :param keep: int (default=self.keep) - number of snapshots kept for each url
+
+        :return: list of pathlib.Path - the deleted objects
+        """
+
+        keep = self.keep if keep is None else keep
+        referenced, removed = set(), []
+        with self._lock:
+            for path in sorted((self.snapshot_dir / "index").glob("*.json")):
+                with open(path) as f:
+                    record = json.load(f)
+                if keep is not None and len(record["history"]) > keep:
+                    record["history"] = record["history"][-keep:] if keep > 0 else []
+                    self._write_index(record)
+                referenced.add(record["digest"])
+                referenced.update(snapshot["digest"] for snapshot in record["history"])
+
+            for path in (self.snapshot_dir / "objects").iterdir():
+                # .tmp files are downloads in progress
+                if path.suffix != ".tmp" and path.name not in referenced:
+                    path.unlink(missing_ok=True)
+                    removed.append(path)
+        return sorted(removed)
+
+
+_default_fetcher = None
+
+
+def default_fetcher():
+    """
+    Return the process wide Fetcher, creating it on first use
+
+    :return: Fetcher
+    """
+
+    global _default_fetcher
+    if _default_fetcher is None:
+        _default_fetcher = Fetcher()
+    return _default_fetcher
+
+
+def open_source(source, fetcher=None):
+    """
+    Resolve a data source to something pandas can read.  URLs are fetched through the snapshot cache, anything
+    else (a local path or file-like object) is returned unchanged.
+
+    :param source: str, Path or file-like
+    :param fetcher: Fetcher (default=default_fetcher())
+
+    :return: Path or source
+    """
+
+    if is_url(source):
+        return (fetcher or default_fetcher()).fetch(source)
+    return source
+
+
+# A source for fetch_all: the url and optional overrides of the timeout (seconds) and number of retries
+Source = namedtuple("Source", ["url", "timeout", "retries"], defaults=[None, None])
+
+
+def _retryable(err):
+    """
+    Server errors, throttling, timeouts and connection failures are retried, other client errors are not
+    """
+    if isinstance(err, urllib.error.HTTPError):
+        return err.code >= 500 or err.code == 429
+    return isinstance(err, (urllib.error.URLError, OSError))
+
+
+async def fetch_all(sources, fetcher=None, **kwargs):
+    """
+    Fetch sources concurrently into the snapshot cache of fetcher.  Each distinct url is fetched once however often
+    it appears in sources.
+
+    :param sources: list like of str or Source
+    :param fetcher: Fetcher (default=default_fetcher())
+    :keyword max_connections: int (default=4) - maximum number of downloads in progress
+    :keyword timeout: float (default=fetcher.timeout) - socket timeout of each attempt of a source, in seconds
+    :keyword retries: int (default=2) - attempts after the first for failures that may be transient
+    :keyword backoff: float (default=0.5) - seconds before the first retry, doubled for each further retry
+    :keyword return_exceptions: boolean (default=False) - map failed urls to their exception instead of raising the
+                                first failure after all downloads finished
+
+    :return: dict url -> pathlib.Path of the snapshot (or the exception if return_exceptions)
+    """
+
+    fetcher = fetcher or default_fetcher()
+    max_connections = kwargs.get("max_connections", 4)
+    backoff = kwargs.get("backoff", 0.5)
+    unique = {}
+    for source in sources:
+        source = Source(source) if isinstance(source, str) else Source(*source)
+        unique.setdefault(source.url, source)
+
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_connections,
+                                               thread_name_prefix="fetch") as pool:
+
+        async def fetch_one(source):
+            timeout = source.timeout or kwargs.get("timeout") or fetcher.timeout
+            retries = kwargs.get("retries", 2) if source.retries is None else source.retries
+            for attempt in range(retries + 1):
+                try:
+                    # the thread returns once its socket times out, cancelling the await would leave it running
+                    return await loop.run_in_executor(pool, fetcher.fetch, source.url, timeout)
+                except Exception as err:
+                    if attempt == retries or not _retryable(err):
+                        raise
+                await asyncio.sleep(backoff * 2 ** attempt)
+
+        results = await asyncio.gather(*(fetch_one(source) for source in unique.values()), return_exceptions=True)
+
+    results = dict(zip(unique, results))
+    if not kwargs.get("return_exceptions", False):
+        for result in results.values():
+            if isinstance(result, BaseException):
+                raise result
+    return results
+
+
+def prefetch(sources, fetcher=None, **kwargs):
+    """
+    Blocking form of fetch_all, also usable where an event loop is already running (e.g. in a notebook)
+
+    :param sources: list like of str or Source
+    :param fetcher: Fetcher (default=default_fetcher())
+    :keyword: keyword arguments of fetch_all
+
+    :return: dict url -> pathlib.Path of the snapshot
+    """
+
+    coroutine = fetch_all(sources, fetcher, **kwargs)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as runner:
+        return runner.submit(asyncio.run, coroutine).result()
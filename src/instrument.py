@@ -0,0 +1,272 @@
+"""
+Opt-in timing and memory instrumentation of named stages.
+
+Code marks its stages with
+
+    with stage("PHAC.parse") as s:
+        df = ...
+        s.rows = len(df)
+
+Nothing is recorded until instrumentation is enabled with enable() or by setting the COVID19_INSTRUMENT
+environment variable; while disabled stage() returns a shared no-op context manager.  COVID19_INSTRUMENT=time records
+wall times only, any other value records times and memory, and "", "0" and "false" (in any case) leave
+instrumentation off.  Each record holds the wall time,
+the rows processed (when the stage reports them) and the peak memory allocated by Python during the stage, measured
+with tracemalloc.  Stages nest, and the records can be summarized, exported as JSON or exported as folded stacks
+for flame graph tools (flamegraph.pl, speedscope).
+
+Memory peaks are exact for stages run in one thread.  tracemalloc has a single peak counter, so stages running
+concurrently in several threads see each other's allocations.
+"""
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import namedtuple
+
+import pandas as pd
+
+StageRecord = namedtuple("StageRecord", ["id", "parent", "name", "path", "start", "seconds", "rows", "peak_bytes",
+                                         "thread"])
+
+_state = {"enabled": False, "memory": False, "started_tracemalloc": False}
+_records = []
+_lock = threading.Lock()
+_ids = itertools.count()
+_local = threading.local()
+
+
+class _NullStage:
+    """
+    Stage returned while instrumentation is disabled.  Values assigned to rows are ignored
+    """
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stage:
+    """
+    A running stage.  Set rows to the number of rows processed by the stage.
+    """
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+        return
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1] if stack else None
+        self.id = next(_ids)
+        self.path = (self.parent.path if self.parent else ()) + (self.name,)
+        self.memory = _state["memory"] and tracemalloc.is_tracing()
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None and self.parent.memory:
+                self.parent.peak = max(self.parent.peak, peak - self.parent.base)
+            tracemalloc.reset_peak()
+            self.base, self.peak = current, 0
+        stack.append(self)
+        self.start = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        peak_bytes = None
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            peak_bytes = max(self.peak, peak - self.base)
+            if self.parent is not None and self.parent.memory:
+                self.parent.peak = max(self.parent.peak, peak - self.parent.base)
+            tracemalloc.reset_peak()
+        _stack().pop()
+        record = StageRecord(self.id, self.parent.id if self.parent else None, self.name, "/".join(self.path),
+                             self.start, seconds, self.rows, peak_bytes, threading.current_thread().name)
+        with _lock:
+            _records.append(record)
+        return False
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def stage(name, rows=None):
+    """
+    Return a context manager recording the stage name while instrumentation is enabled
+
+    :param name: str - stage name, by convention <Class>.<step>
+    :param rows: int (default=None) - rows processed, can also be set on the stage inside the with block
+
+    :return: Stage, or a no-op stand-in while instrumentation is disabled
+    """
+    if not _state["enabled"]:
+        return _NULL_STAGE
+    return Stage(name, rows)
+
+
+def instrumented(name):
+    """
+    Decorator recording each call of the function as the stage name.  The rows of the stage are the length of the
+    result when it has one.
+
+    :param name: str - '{cls}' is replaced by the class name of the first argument, for use on methods
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state["enabled"]:
+                return func(*args, **kwargs)
+            with Stage(name.format(cls=type(args[0]).__name__) if "{cls}" in name else name) as s:
+                result = func(*args, **kwargs)
+                s.rows = _length(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def _length(result):
+    try:
+        return len(result)
+    except TypeError:
+        return None
+
+
+def enable(memory=True):
+    """
+    Start recording stages
+
+    :param memory: boolean (default=True) - also record peak allocations.  This starts tracemalloc, which slows
+                   allocation heavy code down
+    """
+    _state["enabled"] = True
+    _state["memory"] = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _state["started_tracemalloc"] = True
+    return
+
+
+def disable():
+    """
+    Stop recording stages.  Records made so far are kept until reset()
+    """
+    _state["enabled"] = False
+    if _state["started_tracemalloc"]:
+        tracemalloc.stop()
+        _state["started_tracemalloc"] = False
+    return
+
+
+def is_enabled():
+    return _state["enabled"]
+
+
+def reset():
+    """
+    Discard the records
+    """
+    with _lock:
+        _records.clear()
+    return
+
+
+def records(name=None):
+    """
+    Return the records in the order the stages finished
+
+    :param name: str (default=all stages) - only return the records of this stage
+
+    :return: list of StageRecord
+    """
+    with _lock:
+        result = list(_records)
+    if name is not None:
+        result = [record for record in result if record.name == name]
+    return result
+
+
+def summary():
+    """
+    Return the records aggregated by stage path
+
+    :return: pd.DataFrame indexed by path with columns calls, seconds (total), self_seconds (excluding child stages),
+             rows (total) and peak_bytes (max)
+    """
+    recs = records()
+    columns = ['calls', 'seconds', 'self_seconds', 'rows', 'peak_bytes']
+    if not recs:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name='path'))
+    df = pd.DataFrame(recs, columns=StageRecord._fields)
+    df['self_seconds'] = df['seconds'] - df['id'].map(df.groupby('parent')['seconds'].sum()).fillna(0)
+    df['calls'] = 1
+    result = df.groupby('path', sort=False).agg(calls=('calls', 'sum'), seconds=('seconds', 'sum'),
+                                                self_seconds=('self_seconds', 'sum'),
+                                                rows=('rows', lambda rows: rows.sum(min_count=1)),
+                                                peak_bytes=('peak_bytes', 'max'))
+    return result[columns]
+
+
+def to_json(path=None):
+    """
+    Export the records as JSON
+
+    :param path: str or Path (default=None) - file to write
+
+    :return: str
+    """
+    text = json.dumps({"records": [record._asdict() for record in records()]}, indent=2)
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(text)
+    return text
+
+
+def to_folded(path=None):
+    """
+    Export the self time of each stage path as folded stacks, one "stage;child;grandchild microseconds" line per
+    path, the input format of flame graph tools
+
+    :param path: str or Path (default=None) - file to write
+
+    :return: str
+    """
+    table = summary()
+    lines = [f"{stage_path.replace('/', ';')} {max(int(round(1e6 * row.self_seconds)), 0)}"
+             for stage_path, row in table.iterrows()]
+    text = "\n".join(lines) + ("\n" if lines else "")
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(text)
+    return text
+
+
+def _from_environment(value):
+    """
+    Return the keyword arguments of enable() for a value of COVID19_INSTRUMENT, or None if it leaves
+    instrumentation off
+    """
+    value = (value or "").strip().lower()
+    if value in ("", "0", "false"):
+        return None
+    return dict(memory=value != "time")
+
+
+_options = _from_environment(os.environ.get("COVID19_INSTRUMENT"))
+if _options is not None:
+    enable(**_options)
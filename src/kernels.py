@@ -0,0 +1,142 @@
+"""
+Rolling window kernels over arrays of dates x locations.
+
+Each kernel handles every column at once, in time proportional to the array size whatever the window, and treats
+nan as a missing value the way the equivalent pandas operation does.  Windowed sums and means are differences of
+cumulative sums, which are exact for the whole numbers held by the cumulative variables.  Infinite values are not
+supported by the windowed sums.
+"""
+import numpy as np
+
+
+def _window_sums(values, window):
+    """
+    Return the sum of the non-missing values and their number over the trailing window of each row
+    """
+    values = np.asarray(values, dtype=float)
+    valid = ~np.isnan(values)
+    return _lagged(np.cumsum(np.where(valid, values, 0.0), axis=0), window), \
+        _lagged(np.cumsum(valid, axis=0, dtype=np.intp), window)
+
+
+def _lagged(cumulative, window):
+    """
+    Return cumulative[t] - cumulative[t - window], taking cumulative[t] before the first row as 0
+    """
+    result = np.empty_like(cumulative)
+    result[:window] = cumulative[:window]
+    np.subtract(cumulative[window:], cumulative[:-window], out=result[window:])
+    return result
+
+
+def rolling_sum(values, window, min_periods=None):
+    """
+    Return the sum over the trailing window of each column, equal to DataFrame.rolling(window).sum()
+
+    :param values: np.array - dates x locations
+    :param window: int - number of rows in the window
+    :param min_periods: int (default=window) - non-missing values a window requires, fewer give nan
+
+    :return: np.array of float
+    """
+
+    sums, counts = _window_sums(values, window)
+    sums[counts < (window if min_periods is None else min_periods)] = np.nan
+    return sums
+
+
+def rolling_mean(values, window, min_periods=None):
+    """
+    Return the mean over the trailing window of each column, equal to DataFrame.rolling(window).mean()
+
+    :param values: np.array - dates x locations
+    :param window: int - number of rows in the window
+    :param min_periods: int (default=window) - non-missing values a window requires, fewer give nan
+
+    :return: np.array of float
+    """
+
+    sums, counts = _window_sums(values, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        means = sums / counts
+    means[counts < (window if min_periods is None else min_periods)] = np.nan
+    return means
+
+
+def diff(values, periods=1):
+    """
+    Return the change of each column over periods rows, equal to DataFrame.diff(periods)
+
+    :param values: np.array - dates x locations
+    :param periods: int (default=1) - positive number of rows
+
+    :return: np.array of float
+    """
+
+    if periods < 1:
+        raise ValueError(f"periods must be positive, got {periods}")
+    values = np.asarray(values, dtype=float)
+    result = np.full_like(values, np.nan)
+    np.subtract(values[periods:], values[:-periods], out=result[periods:])
+    return result
+
+
+def ratio(numerator, denominator, finite=False):
+    """
+    Return numerator / denominator elementwise without division warnings
+
+    :param numerator: np.array
+    :param denominator: np.array
+    :param finite: boolean (default=False) - replace infinite ratios with nan
+
+    :return: np.array of float
+    """
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = np.true_divide(numerator, denominator, dtype=float)
+    if finite:
+        result[np.isinf(result)] = np.nan
+    return result
+
+
+def rolling_ratio(numerator, denominator, window, finite=False):
+    """
+    Return the ratio of the changes of numerator and denominator over window, e.g. the positive test rate of the
+    tests done in the window from cumulative cases and tests
+
+    :param numerator: np.array - dates x locations
+    :param denominator: np.array - dates x locations
+    :param window: int - number of rows in the window
+    :param finite: boolean (default=False) - replace infinite ratios with nan
+
+    :return: np.array of float
+    """
+
+    return ratio(diff(numerator, window), diff(denominator, window), finite)
+
+
+def window_growth(values, windows, finite=True, relative_to_current=False):
+    """
+    Average growth rate over each window for every column of values, computed for all windows at once
+
+        growth = (1 + (x[t] - x[t-window]) / x[t-window]) ** (1 / window) - 1
+
+    :param values: np.array - dates x locations
+    :param windows: list like of int
+    :param finite: boolean (default=True) - replace infinite ratios with nan
+    :param relative_to_current: boolean (default=False) - divide the change by x[t] rather than x[t-window]
+
+    :return: np.array - windows x dates x locations
+    """
+
+    values = np.asarray(values, dtype=float)
+    windows = np.asarray(windows, dtype=np.intp)
+    rows = np.arange(len(values))[None, :] - windows[:, None]
+    prev = values[np.clip(rows, 0, None)]
+    prev[rows < 0] = np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = values[None, :, :] - prev
+        ratios = delta / (values[None, :, :] if relative_to_current else prev)
+        if finite:
+            ratios[np.isinf(ratios)] = np.nan
+        return np.power(1 + ratios, (1 / windows)[:, None, None]) - 1
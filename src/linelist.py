@@ -0,0 +1,199 @@
+"""
+Streaming aggregation of line lists, sources with a row per case, into daily counts per location.
+
+The file is read in chunks of rows and each chunk is reduced to case and death counts per (location, date) before the
+next one is read, so memory is bounded by the chunk size and the number of location x date pairs whatever the number
+of cases.  A local file can be split into byte ranges on line ends that a pool of worker processes parse in parallel,
+each returning its counts to be summed.  Splitting assumes that no quoted field of the file holds a line break.
+
+    daily = aggregate_line_list("conposcovidloc.csv", processes=4)
+
+The result has a row for every date of every location from its first case to the last date of the file, with the
+new and cumulative cases and deaths, the layout of the aggregated sources.
+"""
+import concurrent.futures
+import io
+import os
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .instrument import stage
+
+# Columns of the result, after date and location
+COUNT_COLUMNS = ['new_cases', 'total_cases', 'new_deaths', 'total_deaths']
+
+
+class _ByteRange(io.RawIOBase):
+    """
+    Read only file over a header line followed by the bytes [start, stop) of a file
+    """
+
+    def __init__(self, path, start, stop, header):
+        super().__init__()
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = stop - start
+        self._header = header
+        return
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        view = memoryview(buffer)
+        if self._header:
+            n = min(len(view), len(self._header))
+            view[:n] = self._header[:n]
+            self._header = self._header[n:]
+            return n
+        n = self._file.readinto(view[:min(len(view), self._remaining)]) if self._remaining > 0 else 0
+        self._remaining -= n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+        return
+
+
+def byte_ranges(path, parts):
+    """
+    Split the rows of a file into at most parts byte ranges starting and ending on line ends
+
+    :param path: str or Path
+    :param parts: int
+
+    :return: (bytes, list of (int, int)) - the header line and the [start, stop) offsets of each range
+    """
+
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.readline()
+        bounds = [len(header)]
+        for k in range(1, parts):
+            f.seek(max(bounds[-1], len(header) + (size - len(header)) * k // parts))
+            if f.tell() > 0:
+                # move to the start of the next line, unless already at one
+                f.seek(f.tell() - 1)
+                f.readline()
+            bounds.append(f.tell())
+        bounds.append(size)
+    return header, [(start, stop) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+
+
+def _count_chunk(chunk, options):
+    """
+    Return the cases and deaths of a chunk of rows per (location, date) as a DataFrame indexed by both
+    """
+    counts = pd.DataFrame({
+        'location': chunk[options['location_column']].to_numpy(),
+        'date': chunk[options['date_column']].to_numpy(),
+        'new_cases': np.ones(len(chunk), dtype=np.int64),
+        'new_deaths': (chunk[options['outcome_column']] == options['fatal']).to_numpy(dtype=np.int64)
+        if options['outcome_column'] is not None else np.zeros(len(chunk), dtype=np.int64),
+    })
+    return counts.groupby(['location', 'date'], sort=False).sum()
+
+
+def _sum_counts(parts):
+    """
+    Return the sum of the counts of parts, matched on (location, date)
+    """
+    parts = [part for part in parts if part is not None and len(part)]
+    if not parts:
+        return pd.DataFrame({'new_cases': [], 'new_deaths': []}, dtype=np.int64,
+                            index=pd.MultiIndex.from_arrays([[], []], names=['location', 'date']))
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts).groupby(level=['location', 'date'], sort=False).sum()
+
+
+def _count_source(source, options):
+    """
+    Read source in chunks and return its counts per (location, date), summing the chunk counts whenever they
+    hold more rows than a chunk
+    """
+    columns = [options['date_column'], options['location_column']]
+    if options['outcome_column'] is not None:
+        columns.append(options['outcome_column'])
+    reader = pd.read_csv(source, usecols=columns, dtype=str, chunksize=options['chunksize'],
+                         encoding=options['encoding'])
+    counts, pending, pending_rows = None, [], 0
+    with reader:
+        for chunk in reader:
+            pending.append(_count_chunk(chunk, options))
+            pending_rows += len(pending[-1])
+            if pending_rows >= options['chunksize']:
+                counts, pending, pending_rows = _sum_counts([counts] + pending), [], 0
+    return _sum_counts([counts] + pending)
+
+
+def _count_range(path, start, stop, header, options):
+    """
+    Return the counts of the rows in the bytes [start, stop) of path
+    """
+    with io.BufferedReader(_ByteRange(path, start, stop, header)) as f:
+        return _count_source(f, options)
+
+
+def _daily(counts, date_format):
+    """
+    Return the daily rows of each location from counts per (location, date string)
+    """
+    counts = counts.reset_index()
+    counts['date'] = pd.to_datetime(counts['date'], format=date_format, errors='coerce')
+    counts = counts.dropna(subset=['date']).groupby(['location', 'date']).sum()
+    if counts.empty:
+        return pd.DataFrame({column: pd.Series(dtype=np.int64) for column in ['date', 'location'] + COUNT_COLUMNS})
+
+    dates = pd.date_range(counts.index.get_level_values('date').min(),
+                          counts.index.get_level_values('date').max(), freq="D", name='date')
+    locations = counts.index.get_level_values('location').unique()
+    index = pd.MultiIndex.from_product([locations, dates], names=['location', 'date'])
+    counts = counts.reindex(index, fill_value=0)
+    totals = counts.groupby(level='location', sort=False).cumsum()
+    daily = pd.DataFrame({'new_cases': counts['new_cases'], 'total_cases': totals['new_cases'],
+                          'new_deaths': counts['new_deaths'], 'total_deaths': totals['new_deaths']})
+    # each location starts on the date of its first case
+    daily = daily[daily['total_cases'] > 0].reset_index()
+    return daily.sort_values(['date', 'location'], kind='mergesort', ignore_index=True)[
+        ['date', 'location'] + COUNT_COLUMNS]
+
+
+def aggregate_line_list(source, date_column='Accurate_Episode_Date', location_column='Reporting_PHU_City',
+                        outcome_column='Outcome1', fatal='Fatal', date_format=None, chunksize=100000,
+                        processes=1, encoding='utf-8'):
+    """
+    Aggregate a line list into daily new and cumulative cases and deaths per location
+
+    :param source: str, Path or file-like - local copy of the line list.  File-like sources are read by this process
+    :param date_column: str (default='Accurate_Episode_Date') - date of each case
+    :param location_column: str (default='Reporting_PHU_City') - location of each case, rows without one are dropped
+    :param outcome_column: str (default='Outcome1') - outcome of each case, None if the source has no deaths
+    :param fatal: str (default='Fatal') - outcome of the cases counted as deaths
+    :param date_format: str (default=inferred) - strftime format of date_column, rows with other dates are dropped
+    :param chunksize: int (default=100000) - number of rows read at a time
+    :param processes: int (default=1) - number of worker processes parsing byte ranges of a path, None for one per
+                      core
+    :param encoding: str (default='utf-8')
+
+    :return: pd.DataFrame - date, location, new_cases, total_cases, new_deaths and total_deaths
+    """
+
+    options = dict(date_column=date_column, location_column=location_column, outcome_column=outcome_column,
+                   fatal=fatal, chunksize=chunksize, encoding=encoding)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    with stage("linelist.count") as s:
+        if processes > 1 and isinstance(source, (str, Path)):
+            header, ranges = byte_ranges(source, processes)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=len(ranges) or 1) as pool:
+                futures = [pool.submit(_count_range, str(source), start, stop, header, options)
+                           for start, stop in ranges]
+                counts = _sum_counts([future.result() for future in futures])
+        else:
+            counts = _count_source(source, options)
+        s.rows = int(counts['new_cases'].sum())
+    with stage("linelist.daily", rows=len(counts)):
+        return _daily(counts, date_format)
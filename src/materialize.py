@@ -0,0 +1,212 @@
+"""
+Materialized tables of derived metrics, computed for every location at once after each load or refresh.
+
+A metric is a tuple naming an analytic method of CovidDataset and its arguments other than the locations, e.g.
+("growth_rate", "total_cases", 7) or ("pos_test_rate", 14).  Each metric is computed with a single call over all the
+locations and the results are held in a DenseStore, so the analytic methods answer queries for materialized metrics
+with an array slice.  Tables can be saved in the column format of src.store next to the data they were computed
+from.
+
+A location whose rows skip dates of the data is not answered from the table: the methods compute over the dates of
+the requested locations only, which for such a location differ from the dates of the table.
+"""
+import hashlib
+import json
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .dense import DenseStore
+from .store import write_columns, read_columns
+
+# Metrics materialized by CovidDataset(materialize=True)
+DEFAULT_METRICS = [
+    ("growth_rate", "total_cases", 3),
+    ("growth_rate", "total_cases", 7),
+    ("growth_rate", "total_cases", 14),
+    ("growth_rate", "total_cases", 28),
+    ("pos_test_rate", 7),
+    ("pos_test_rate", 14),
+    ("active_confirmed_cases",),
+    ("cum_pos_test_rate",),
+]
+
+# Analytic methods that can be materialized -> number of their arguments before the locations
+METHOD_ARGS = {
+    'growth_rate': 2,
+    'pos_test_rate': 1,
+    'active_confirmed_cases': 0,
+    'cum_pos_test_rate': 0,
+}
+
+
+def metric_name(metric):
+    """
+    Return the column name of a metric, e.g. growth_rate:total_cases:7
+    """
+    return ":".join(str(part) for part in metric)
+
+
+def metrics_key(metrics):
+    """
+    Return a short hash identifying a list of metrics
+    """
+    return hashlib.sha256(json.dumps([metric_name(m) for m in metrics]).encode("utf-8")).hexdigest()[:16]
+
+
+class MaterializedMetrics:
+    """
+    Derived metrics of every location held as one dense date x location x metric array
+    """
+
+    def __init__(self, table, metrics, requested=None):
+        """
+        Instantiate from a long format table
+
+        :param table: pd.DataFrame - date and location columns and a column per metric named by metric_name()
+        :param metrics: list like of tuple - the metrics of table
+        :param requested: list like of tuple (default=metrics) - the metrics asked for, of which metrics are those
+                          that could be computed
+        """
+
+        self.metrics = [tuple(metric) for metric in metrics]
+        self.requested = self.metrics if requested is None else [tuple(metric) for metric in requested]
+        self.store = DenseStore(table, [metric_name(metric) for metric in self.metrics])
+        present = self.store.present
+        counts = present.sum(axis=0)
+        first = present.argmax(axis=0)
+        last = len(present) - 1 - present[::-1].argmax(axis=0)
+        self.contiguous = set(self.store.locations[(counts > 0) & (counts == last - first + 1)])
+        return
+
+    @classmethod
+    def compute(cls, dataset, metrics=None):
+        """
+        Compute metrics for all the locations of dataset.  Metrics whose variables dataset does not hold are left out
+
+        :param dataset: CovidDataset
+        :param metrics: list like of tuple (default=DEFAULT_METRICS)
+
+        :return: MaterializedMetrics
+        """
+
+        metrics = [tuple(metric) for metric in (DEFAULT_METRICS if metrics is None else metrics)]
+        unknown = [metric for metric in metrics if metric[0] not in METHOD_ARGS]
+        if unknown:
+            raise ValueError(f"metrics {unknown} are not in {sorted(METHOD_ARGS)}")
+
+        df, locations = dataset.df, dataset.locations
+        table = {'date': df['date'], 'location': df['location']}
+        computed = []
+        for metric in metrics:
+            # the undecorated method, so that the whole table does not pass through the result cache
+            method = getattr(type(dataset), metric[0])
+            method = getattr(method, '__wrapped__', method)
+            try:
+                wide = method(dataset, *metric[1:], *locations)
+            except KeyError:
+                continue
+            if wide is NotImplemented:
+                continue
+            rows = wide.index.get_indexer(df['date'])
+            columns = wide.columns.get_indexer(df['location'])
+            table[metric_name(metric)] = wide.to_numpy(dtype=float, na_value=np.nan)[rows, columns]
+            computed.append(metric)
+        return cls(pd.DataFrame(table), computed, metrics)
+
+    def frame(self, metric, locations):
+        """
+        Return a DataFrame date x location -> metric
+
+        :param metric: tuple
+        :param locations: list like
+
+        :return: DataFrame, or None if metric is not materialized or a location cannot be answered from the table
+        """
+
+        name = metric_name(metric)
+        if name not in self.store.variable_map or not locations or not self.contiguous.issuperset(locations):
+            return None
+        return self.store.frame(name, locations)
+
+    def lookup(self, method, args, kwargs):
+        """
+        Return the result of the analytic method call method(*args, **kwargs) from the table
+
+        :param method: str - name of the analytic method
+        :param args: tuple - arguments of the call, the locations last
+        :param kwargs: dict - keyword arguments of the call; calls with true keyword arguments are not answered
+
+        :return: DataFrame, or None if the call cannot be answered from the table
+        """
+
+        if method not in METHOD_ARGS or any(kwargs.values()):
+            return None
+        params, locations = args[:METHOD_ARGS[method]], args[METHOD_ARGS[method]:]
+        if method == 'growth_rate' and np.ndim(params[1]) > 0:
+            windows = [int(w) for w in params[1]]
+            frames = [self.frame((method, params[0], w), locations) for w in windows]
+            if any(frame is None for frame in frames):
+                return None
+            columns = pd.MultiIndex.from_product([windows, frames[0].columns],
+                                                 names=['window', frames[0].columns.name])
+            return pd.DataFrame(np.hstack([frame.to_numpy() for frame in frames]), index=frames[0].index,
+                                columns=columns)
+        return self.frame((method,) + tuple(params), locations)
+
+    def to_frame(self):
+        """
+        Return the long format table
+
+        :return: pd.DataFrame
+        """
+
+        date_codes, loc_codes = np.nonzero(self.store.present)
+        order = np.lexsort((date_codes, loc_codes))
+        date_codes, loc_codes = date_codes[order], loc_codes[order]
+        table = {'date': self.store.dates[date_codes], 'location': self.store.locations[loc_codes]}
+        for k, name in enumerate(self.store.variables):
+            table[name] = self.store.values[date_codes, loc_codes, k]
+        return pd.DataFrame(table)
+
+    def save(self, path):
+        """
+        Save the table in the column format of src.store
+
+        :param path: str or Path - directory to be written
+        """
+
+        table = self.to_frame()
+        table.attrs['metrics'] = [list(metric) for metric in self.metrics]
+        table.attrs['requested'] = [list(metric) for metric in self.requested]
+        write_columns(table, path)
+        return
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a table written by save()
+
+        :param path: str or Path
+
+        :return: MaterializedMetrics
+        """
+
+        table = read_columns(path, mmap_mode=None)
+        return cls(table, table.attrs['metrics'], table.attrs['requested'])
+
+    @staticmethod
+    def exists(path, metrics):
+        """
+        Return True if path holds a table computed for metrics
+
+        :param path: str or Path
+        :param metrics: list like of tuple
+        """
+
+        meta = Path(path) / "meta.json"
+        if not meta.exists():
+            return False
+        with open(meta) as f:
+            stored = json.load(f).get("attrs", {}).get("requested", [])
+        return [metric_name(m) for m in stored] == [metric_name(m) for m in metrics]
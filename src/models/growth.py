@@ -2,8 +2,107 @@
 Given a time series that is the result of a mixture of underlying geometric processes, the components
 in this module find the model of the underlying processes that best explain the observed behaviour
 """
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import pandas as pd
+from ..instrument import stage, instrumented
+
+def _window_starts(dates, est_per, rows=None):
+    """
+    Return the position of the first row of the window [t - est_per days, t] for rows t of dates
+
+    :param dates: np.array of datetime64 - sorted
+    :param est_per: int
+    :param rows: np.array (default=all rows) - positions of the rows t
+
+    :return: np.array
+    """
+    ends = dates if rows is None else dates[rows]
+    return np.searchsorted(dates, ends - np.timedelta64(est_per, "D"), side="left")
+
+
+def _window_fits(logvals, starts, ends):
+    """
+    Least squares line through the non-NaN points of each window [starts, ends] with x measured from the window
+    start.  The sums are accumulated over the offsets of the points within their windows and centred on the window
+    means, so their rounding error does not grow with the length of the series.  A window holding an infinite
+    value (the log of a zero) gets a NaN fit, as lstsq gives.
+
+    :param logvals: np.array - rows x columns
+    :param starts: np.array - first row position of each window
+    :param ends: np.array - last row position of each window
+
+    :return: (count, slope, intercept, sum of squared residuals) - each windows x columns
+    """
+    shape = (len(ends), logvals.shape[1])
+    width = int((ends - starts).max()) + 1 if len(ends) else 0
+    last = len(logvals) - 1
+
+    def points(k):
+        # the values at offset k of every window and the masks of those that are non-NaN and finite
+        rows = starts + k
+        vals = logvals[np.minimum(rows, last)]
+        valid = (rows <= ends)[:, None] & ~np.isnan(vals)
+        return vals, valid, valid & np.isfinite(vals)
+
+    n, m, bad, sx, sy = (np.zeros(shape) for _ in range(5))
+    for k in range(width):
+        vals, valid, finite = points(k)
+        n += valid
+        m += finite
+        bad += valid & ~finite
+        sx += k * finite
+        sy += np.where(finite, vals, 0.0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mx, my = sx / m, sy / m
+
+    sxx, sxy, syy = (np.zeros(shape) for _ in range(3))
+    for k in range(width):
+        vals, _, finite = points(k)
+        dx = np.where(finite, k - mx, 0.0)
+        dy = np.where(finite, vals - my, 0.0)
+        sxx += dx * dx
+        sxy += dx * dy
+        syy += dy * dy
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = sxy / sxx
+        intercept = my - slope * mx
+        err = np.where(n > 2, np.maximum(syy - slope * sxy, 0.0), 0.0)
+    slope[bad > 0] = np.nan
+    intercept[bad > 0] = np.nan
+    err[(bad > 0) & (n > 2)] = np.nan
+    return n, slope, intercept, err
+
+
+MODEL_COLUMNS = ["LogGrowthRate", "LogPriorProcessLoad", "Error", "PredictedLogValue", "ActualLogValue"]
+
+
+def _fit_block(logvals, dates, est_per, ends=None):
+    """
+    Fit the windows ending at ends for every column of logvals in one batch
+
+    :param logvals: np.array - dates x series of log values
+    :param dates: np.array of datetime64 - the sorted dates
+    :param est_per: int
+    :param ends: np.array (default=all rows from est_per) - positions of the windows to fit
+
+    :return: (np.array, np.array) - ends x columns mask of the windows with at least two points and the ends x
+             columns x MODEL_COLUMNS model values
+    """
+    if ends is None:
+        ends = np.arange(est_per, len(dates))
+    n, slope, intercept, err = _window_fits(logvals, _window_starts(dates, est_per, ends), ends)
+    values = np.stack([slope, intercept, err, intercept + (est_per - 1) * slope, logvals[ends]], axis=-1)
+    return n > 1, values
+
+
+def _fit_chunk(args):
+    """
+    Process pool entry point for GeometricProcess.fit_many
+    """
+    logvals, dates, est_per = args
+    return _fit_block(logvals, dates, est_per)
+
 
 class GeometricProcess:
     """
@@ -24,45 +123,202 @@ class GeometricProcess:
         Fit a model P(t), R(t) that at each point t minimizes the mean squared error
             sum( (series[t-k] - exp(P(t) + R(t)*k)**2 for k in range(est_per) )
 
-        :param series: pandas.Series with DateTimeIndex
+        The fits of all windows are computed at once from the sums of x, y, xy, x^2 and y^2 over each window, where
+        x is the position of a point within its window.  Missing (NaN) points are left out of the window they fall
+        in, and a window holding a zero of series has a NaN fit.
+
+        :param series: pandas.Series with sorted DateTimeIndex
         """
-        def _get_err(rec):
-            if len(rec[1]) > 0:
-                return rec[1][0]
-            else:
-                return 0
-
-        logser = np.log(series)
-
-        x = []
-        fits = []
-        for idx in series.index[self.est_per:]:
-            s = idx - self.est_per * pd.Timedelta("1 day")
-            vals = logser[s:idx].values
-            lvals = np.where(np.logical_not(np.isnan(vals)))[0]
-            # print(vals, lvals)
-            if len(lvals) > 1:
-                A = np.ones((len(lvals), 2))
-                A[:,0] = lvals
-                fits.append(np.linalg.lstsq(A, vals[lvals], rcond=None))
-                x.append(idx)
-
-        self.model = pd.DataFrame(
-            {"LogGrowthRate": [fit[0][0] for fit in fits],
-             "LogPriorProcessLoad": [fit[0][1] for fit in fits],
-             "Error": [_get_err(fit) for fit in fits]},
-            index=x
-        )
-
-        pred_logval = []
-        for row in self.model.itertuples():
-            pred_logval.append(row.LogPriorProcessLoad + (self.est_per - 1) * row.LogGrowthRate)
-
-        self.model["PredictedLogValue"] = pred_logval
-        self.model["ActualLogValue"] = logser[self.model.index]
+        with stage("GeometricProcess.fit", rows=len(series)):
+            logser = np.log(series)
+            logvals = logser.to_numpy(dtype=float, na_value=np.nan)[:, None]
+            self._set_state(logvals, series.index, [series.name], multi=False)
+            ends = np.arange(self.est_per, self._size)
+            self._store(ends, *_fit_block(logvals, self._dates[:self._size], self.est_per, ends))
 
         return
 
+    @instrumented("GeometricProcess.fit_many")
+    def fit_many(self, frame, **kwargs):
+        """
+        Fit every column of a date x location frame, such as the output of CovidDataset.var_by_location.
+
+        Columns are fitted in batches by the same closed form kernel as fit.  With workers > 1 the batches are
+        spread over a process pool.
+
+        :param frame: pandas.DataFrame with sorted DateTimeIndex
+        :keyword workers: int (default=1) - number of worker processes
+        :keyword chunksize: int (default=columns / workers) - number of columns per batch
+
+        :return: pandas.DataFrame - the models of all columns indexed by (location, date).  Also stored as
+                 self.model
+        """
+
+        workers = kwargs.get("workers", 1)
+        chunksize = kwargs.get("chunksize", max(1, -(-frame.shape[1] // max(workers, 1))))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            logvals = np.log(frame.to_numpy(dtype=float, na_value=np.nan))
+        self._names = [frame.columns.name or "location", frame.index.name or "date"]
+        self._set_state(logvals, frame.index, list(frame.columns), multi=True)
+        dates = self._dates[:self._size]
+        chunks = [(logvals[:, k:k + chunksize], dates, self.est_per) for k in range(0, frame.shape[1], chunksize)]
+
+        if workers > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(_fit_chunk, chunks))
+        else:
+            results = [_fit_chunk(chunk) for chunk in chunks]
+
+        if results:
+            self._store(np.arange(self.est_per, self._size), np.concatenate([keep for keep, _ in results], axis=1),
+                        np.concatenate([values for _, values in results], axis=1))
+        return self.model
+
+    def _set_state(self, logvals, index, columns, multi):
+        """
+        Keep what update needs: the fitted dates and log values, and the fit of every window, in buffers with room
+        for appended days
+        """
+        index = pd.DatetimeIndex(index)
+        self._columns = columns
+        self._multi = multi
+        self._index_name = index.name
+        self._tz = index.tz
+        self._size = 0
+        self._dates = np.empty(0, dtype="datetime64[ns]")
+        self._logvals = np.empty((0, len(columns)))
+        self._fitted = np.zeros((0, len(columns)), dtype=bool)
+        self._fitvals = np.empty((0, len(columns), len(MODEL_COLUMNS)))
+        self._resize(len(index))
+        self._dates[:len(index)] = index.values
+        self._logvals[:len(index)] = logvals
+        self._size = len(index)
+        self._model = None
+        return
+
+    def _resize(self, capacity, moved=None):
+        """
+        Move the state into buffers of capacity rows, the kept rows going to positions moved (default=unchanged).
+        Rows that are not filled are NaN and unfitted.
+        """
+        if moved is None:
+            moved = np.arange(self._size)
+        shape = (capacity, len(self._columns))
+        dates = np.zeros(capacity, dtype=self._dates.dtype)
+        logvals = np.full(shape, np.nan)
+        fitted = np.zeros(shape, dtype=bool)
+        fitvals = np.full(shape + (len(MODEL_COLUMNS),), np.nan)
+        dates[moved] = self._dates[:self._size]
+        logvals[moved] = self._logvals[:self._size]
+        fitted[moved] = self._fitted[:self._size]
+        fitvals[moved] = self._fitvals[:self._size]
+        self._dates, self._logvals, self._fitted, self._fitvals = dates, logvals, fitted, fitvals
+        return
+
+    def _store(self, ends, keep, values):
+        """
+        Keep the output of _fit_block for the windows ending at ends
+        """
+        self._fitted[ends] = keep
+        self._fitvals[ends] = values
+        self._model = None
+        return
+
+    def _date_index(self, dates):
+        """
+        Return dates as a DatetimeIndex like the fitted one
+        """
+        index = pd.DatetimeIndex(dates, name=self._index_name)
+        return index if self._tz is None else index.tz_localize("UTC").tz_convert(self._tz)
+
+    @property
+    def model(self):
+        """
+        The model of the fitted data as a DataFrame of MODEL_COLUMNS, indexed by date after fit and by
+        (location, date) after fit_many.  It is built from the window fits when first read after a fit or update.
+        """
+        if self._model is None:
+            keep = self._fitted[:self._size].T
+            cols = np.broadcast_to(np.arange(keep.shape[0])[:, None], keep.shape)[keep]
+            rows = np.broadcast_to(np.arange(keep.shape[1])[None, :], keep.shape)[keep]
+            values = self._fitvals[:self._size].transpose(1, 0, 2)[keep]
+            dates = self._date_index(self._dates[:self._size])
+            if self._multi:
+                index = pd.MultiIndex(levels=[pd.Index(self._columns), dates], codes=[cols, rows],
+                                      names=self._names, verify_integrity=False)
+            else:
+                index = dates.take(rows)
+            self._model = pd.DataFrame(values, index=index, columns=MODEL_COLUMNS)
+        return self._model
+
+    @instrumented("GeometricProcess.update")
+    def update(self, new_points):
+        """
+        Add new or revised points to the fitted data and refit only the windows that contain them.  Days after the
+        last fitted date are appended to the state in place, its buffers doubling when full, and only the revised
+        rows are compared, so appending a day costs O(new days x est_per) whatever the length of the history.  A
+        date before the last fitted one moves the rows after it and refits every window from it on.  The model is
+        identical to fitting the updated data from scratch.
+
+        :param new_points: pandas.Series (after fit) or pandas.DataFrame (after fit_many) with DateTimeIndex.
+                           NaN values do not replace existing points
+
+        :return: pandas.DatetimeIndex - the dates whose model rows were recomputed
+        """
+
+        if not hasattr(self, "_logvals"):
+            raise RuntimeError("update called before fit")
+        if isinstance(new_points, pd.Series):
+            new_points = pd.DataFrame({self._columns[0]: new_points})
+        positions = pd.Index(self._columns).get_indexer(new_points.columns)
+        if (positions < 0).any() or (not self._multi and len(new_points.columns) != 1):
+            raise ValueError(f"update can only revise the fitted series, got {list(new_points.columns)}")
+
+        new_points = new_points[~new_points.index.duplicated(keep="last")].sort_index()
+        index = pd.DatetimeIndex(new_points.index)
+        dates = (index if self._tz is None else index.tz_convert(self._tz)).values
+        with np.errstate(divide="ignore", invalid="ignore"):
+            new_log = np.log(new_points.to_numpy(dtype=float, na_value=np.nan))
+
+        # find the rows of the new points, adding those of new dates
+        size = self._size
+        rows = np.searchsorted(self._dates[:size], dates)
+        found = rows < size
+        found[found] = self._dates[rows[found]] == dates[found]
+        added = dates[~found]
+        first = None
+        if len(added) and size and added[0] < self._dates[size - 1]:
+            merged = np.union1d(self._dates[:size], added)
+            self._resize(len(merged), np.searchsorted(merged, self._dates[:size]))
+            self._dates[:] = merged
+            rows = np.searchsorted(merged, dates)
+            first = rows[~found][0]
+        elif len(added):
+            if size + len(added) > len(self._dates):
+                self._resize(max(size + len(added), 2 * len(self._dates)))
+            self._dates[size:size + len(added)] = added
+            rows[~found] = size + np.arange(len(added))
+        self._size = size + len(added)
 
+        # merge the new log values into the fitted ones, NaN does not overwrite
+        block = self._logvals[rows[:, None], positions[None, :]]
+        merged_log = np.where(np.isnan(new_log), block, new_log)
+        same = (merged_log == block) | (np.isnan(merged_log) & np.isnan(block))
+        self._logvals[rows[:, None], positions[None, :]] = merged_log
+        changed = rows[~found | ~same.all(axis=1)]
+        if first is not None:
+            # the rows after an inserted date have moved
+            changed = np.union1d(changed, np.arange(first, self._size))
+        dates = self._dates[:self._size]
+        if not len(changed):
+            return self._date_index(dates[:0])
 
+        # the windows [t - est_per days, t] holding a changed row r end at r up to the last date within est_per days
+        lengths = np.searchsorted(dates, dates[changed] + np.timedelta64(self.est_per, "D"), side="right") - changed
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        ends = np.unique(np.repeat(changed, lengths) + offsets)
+        ends = ends[ends >= self.est_per]
 
+        self._store(ends, *_fit_block(self._logvals[:self._size], dates, self.est_per, ends))
+        return self._date_index(dates[ends])
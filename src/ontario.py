@@ -4,34 +4,81 @@ import datetime
 import time
 from src import CovidDataset
 from src import population_table
+from src.linelist import aggregate_line_list
 
 class Ontario(CovidDataset):
 
-    def __init__(self):
-        # Set up constants
+    url = "https://health-infobase.canada.ca/src/data/covidLive/covid19.csv"
 
-        # download and shape data
-        col_map = {'Accurate_Episode_Date': 'date',
-                   'Reporting_PHU_City': 'location',
-                   'numtotal': 'total_cases',
-                   'numdeaths': 'total_deaths',
-                   'numtested': 'total_tests'
-                   }
+    # Confirmed cases of Ontario, a row per case, read with line_list=True
+    line_list_url = ("https://data.ontario.ca/dataset/f4112442-bdc8-45d2-be3c-12efae72fb27/resource/"
+                     "455fd63b-603d-4608-8216-7d8647f43350/download/conposcovidloc.csv")
+
+    # Map source columns to dataset variables
+    col_map = {'Accurate_Episode_Date': 'date',
+               'Reporting_PHU_City': 'location',
+               'numtotal': 'total_cases',
+               'numdeaths': 'total_deaths',
+               'numtested': 'total_tests'
+               }
+
+    def __init__(self, **kwargs):
+        """
+        Load the Ontario dataset
+
+        :keyword source: str - url or local path of the data (default=Ontario.url, or Ontario.line_list_url with
+                         line_list)
+        :keyword fetcher: Fetcher - fetcher used for url sources (default=the shared snapshot cache)
+        :keyword line_list: boolean or dict (default=False) - read source as a line list with a row per case,
+                            streamed into daily counts by src.linelist.aggregate_line_list with the keyword arguments
+                            of a dict, e.g. dict(processes=4)
+        :keyword: other keyword arguments are passed to CovidDataset.__init__
+        """
+        line_list = kwargs.pop("line_list", False)
+        if line_list:
+            kwargs.setdefault("source", self.line_list_url)
+        parse_options = dict(line_list=line_list) if line_list else None
+        super().__init__(self._ingest(parse_options, **kwargs), **kwargs)
+        return
+
+    @classmethod
+    def parse(cls, source, line_list=False):
+        """
+        Read and shape Ontario data
+
+        :param source: str, Path or file-like - local copy of the data
+        :param line_list: boolean or dict (default=False) - source is a line list, aggregated by
+                          aggregate_line_list with the keyword arguments of a dict
+
+        :return: pd.DataFrame
+        """
+        if line_list:
+            src = aggregate_line_list(source, **(line_list if isinstance(line_list, dict) else {}))
+            return src.loc[src.location != 'Repatriated travellers'].reset_index(drop=True)
         dateparse = lambda x: datetime.date(*time.strptime(x, '%d-%m-%Y')[:3])
-        src = pd.read_csv("https://health-infobase.canada.ca/src/data/covidLive/covid19.csv",
+        src = pd.read_csv(source,
                           error_bad_lines=False,
                           warn_bad_lines=False,
                           parse_dates=['date'],
                           date_parser= dateparse)
-        src = src[list(col_map)]
-        src.rename(columns=col_map, inplace=True)
-        src = src.loc[src.location != 'Repatriated travellers']
+        src = src[list(cls.col_map)]
+        src = src.rename(columns=cls.col_map)
+        return src.loc[src.location != 'Repatriated travellers'].copy()
+
+    @classmethod
+    def derive(cls, src):
+        """
+        Add the population and per capita columns
 
+        :param src: pd.DataFrame - output of parse()
+
+        :return: pd.DataFrame
+        """
         # Compute proportions
-        src['population'] = src['location'].apply(population_table.get_population)
+        src['population'] = population_table.populations(src['location'])
         src['total_cases_per_million'] = 1000000 * src['total_cases'] / src['population']
         src['total_deaths_per_million'] = 1000000 * src['total_deaths'] / src['population']
-        src['total_tests_per_thousand'] = 1000 * src['total_tests'] / src['population']
-
-        super().__init__(src)
-        return
\ No newline at end of file
+        if 'total_tests' in src:
+            # line lists hold no tests
+            src['total_tests_per_thousand'] = 1000 * src['total_tests'] / src['population']
+        return src
@@ -1,7 +1,5 @@
 import pandas as pd
 import numpy as np
-import datetime
-import time
 from src import CovidDataset
 from src import population_table
 
@@ -36,91 +34,130 @@ class PHAC(CovidDataset):
         'active_cases_rate': ''
     }
 
-    def __init__(self):
-        # set up constants
-        self.provinces = ['Canada',
-                          'Newfoundland and Labrador', 'Prince Edward Island', 'Nova Scotia', 'New Brunswick',
-                          'Quebec',
-                          'Ontario',
-                          'Manitoba', 'Saskatchewan', 'Alberta', 'British Columbia',
-                          'Yukon', 'Northwest Territories', 'Nunavut']
-
-        self.large_provinces = ['Canada', 'British Columbia', 'Ontario', 'Quebec']
-        self.maritimes = ['Newfoundland and Labrador', 'Prince Edward Island', 'Nova Scotia', 'New Brunswick']
-        self.prairies = ['Manitoba', 'Saskatchewan', 'Alberta']
-
-        self.prov_colours = dict(zip(self.provinces,
-                                ['r',
-                                 'darkred', 'salmon', 'darksalmon', 'sienna',
-                                 'cornflowerblue',
-                                 'b',
-                                 'gold', 'goldenrod', 'darkgoldenrod', 'g',
-                                 'olive', 'chartreuse', 'darkseagreen']
-                                )
+    # set up constants
+    provinces = ['Canada',
+                 'Newfoundland and Labrador', 'Prince Edward Island', 'Nova Scotia', 'New Brunswick',
+                 'Quebec',
+                 'Ontario',
+                 'Manitoba', 'Saskatchewan', 'Alberta', 'British Columbia',
+                 'Yukon', 'Northwest Territories', 'Nunavut']
+
+    large_provinces = ['Canada', 'British Columbia', 'Ontario', 'Quebec']
+    maritimes = ['Newfoundland and Labrador', 'Prince Edward Island', 'Nova Scotia', 'New Brunswick']
+    prairies = ['Manitoba', 'Saskatchewan', 'Alberta']
+
+    prov_colours = dict(zip(provinces,
+                            ['r',
+                             'darkred', 'salmon', 'darksalmon', 'sienna',
+                             'cornflowerblue',
+                             'b',
+                             'gold', 'goldenrod', 'darkgoldenrod', 'g',
+                             'olive', 'chartreuse', 'darkseagreen']
                             )
+                        )
+
+    url = "https://health-infobase.canada.ca/src/data/covidLive/covid19.csv"
+
+    # Map source columns to dataset variables
+    col_map = {'date': 'date',
+               'prname': 'location',
+               'numconf': 'total_confirmed_cases',
+               'numprob': 'total_probable_cases',
+               'numtotal': 'total_cases',  # total_confirmed_cases + total_probable
+               'ratetotal': 'total_cases_rate',
+               'numtoday': 'new_cases',
+               'numrecover': 'total_recovered',
+               'numrecoveredtoday': 'new_recovered',
+               'numactive': 'active_cases',
+               'rateactive': 'active_cases_rate',
+               'numdeaths': 'total_deaths',
+               'ratedeaths': 'total_deaths_rate',
+               'numdeathstoday': 'new_deaths',
+               'numtests': 'total_tests',
+               'numteststoday': 'new_tests'
+               }
+
+    # Count columns that may be reported with thousands separators
+    count_columns = ['total_cases', 'new_cases', 'new_tests', 'total_tests', 'new_deaths', 'total_confirmed_cases',
+                     'total_probable_cases', 'total_recovered', 'new_recovered', 'active_cases']
+
+    def __init__(self, **kwargs):
+        """
+        Load the PHAC dataset
+
+        :keyword source: str - url or local path of the data (default=PHAC.url)
+        :keyword fetcher: Fetcher - fetcher used for url sources (default=the shared snapshot cache)
+        :keyword: other keyword arguments are passed to CovidDataset.__init__
+        """
+        super().__init__(self._ingest(**kwargs), **kwargs)
+        return
+
+    @staticmethod
+    def _parse_counts(col):
+        """
+        Convert a column of counts that may contain strings with thousands separators to numbers
+
+        :param col: pd.Series
+
+        :return: pd.Series
+        """
+        if col.dtype != object:
+            return col
+        stripped = col.str.replace(",", "", regex=False)
+        return pd.to_numeric(stripped.where(stripped.notna(), col))
 
-        # download and shape data
-        col_map = {'date': 'date',
-                   'prname': 'location',
-                   'numconf': 'total_confirmed_cases',
-                   'numprob': 'total_probable_cases',
-                   'numtotal': 'total_cases',  # total_confirmed_cases + total_probable
-                   'ratetotal': 'total_cases_rate',
-                   'numtoday': 'new_cases',
-                   'numrecover': 'total_recovered',
-                   'numrecoveredtoday': 'new_recovered',
-                   'numactive': 'active_cases',
-                   'rateactive': 'active_cases_rate',
-                   'numdeaths': 'total_deaths',
-                   'ratedeaths': 'total_deaths_rate',
-                   'numdeathstoday': 'new_deaths',
-                   'numtests': 'total_tests',
-                   'numteststoday': 'new_tests'
-                   }
-        dateparse = lambda x: datetime.date(*time.strptime(x, '%d-%m-%Y')[:3])
-        self.src_url = "https://health-infobase.canada.ca/src/data/covidLive/covid19.csv"
-        src = pd.read_csv(self.src_url,
-                                 error_bad_lines=False,
-                                 warn_bad_lines=False,
-                                 parse_dates=['date'],
-                                 date_parser= dateparse)
+    @classmethod
+    def read_source(cls, source):
+        """
+        Read and shape PHAC data in the layout of covid19.csv, including the derived columns
+
+        :param source: str, Path or file-like - local copy of the data
+
+        :return: pd.DataFrame
+        """
+        return cls.derive(cls.parse(source))
+
+    @classmethod
+    def parse(cls, source):
+        """
+        Read PHAC data in the layout of covid19.csv
+
+        :param source: str, Path or file-like - local copy of the data
+
+        :return: pd.DataFrame
+        """
+        src = pd.read_csv(source,
+                          error_bad_lines=False,
+                          warn_bad_lines=False,
+                          thousands=',')
+        src['date'] = pd.to_datetime(src['date'], format='%d-%m-%Y')
 
         # Starting 2021-02-01 reporting changed from numtested to num tests
-        src['numtests'] = src.apply(lambda row: row['numtested']
-                                        if not np.isnan(row['numtested'])
-                                        else row['numtests'], axis=1)
-        src['numteststoday'] = src.apply(lambda row: row['numtestedtoday']
-                                            if not np.isnan(row['numtestedtoday'])
-                                            else row['numteststoday'], axis=1)
+        src['numtests'] = src['numtested'].where(src['numtested'].notna(), src['numtests'])
+        src['numteststoday'] = src['numtestedtoday'].where(src['numtestedtoday'].notna(), src['numteststoday'])
 
-        src = src[list(col_map)]
-        src.rename(columns=col_map, inplace=True)
-        src = src.loc[src.location != 'Repatriated travellers']
+        src = src[list(cls.col_map)]
+        src = src.rename(columns=cls.col_map)
+        src = src.loc[src.location != 'Repatriated travellers'].copy()
 
         # Clean data
-        cols_to_clean = {
-            'total_cases': int,
-            'new_cases': int,
-            'new_tests': int,
-            'total_tests': int,
-            'new_deaths': int,
-            'total_confirmed_cases': int,
-            'total_probable_cases': int,
-            'total_recovered': int,
-            'new_recovered': int,
-            'active_cases': int
-        }
-        for var in cols_to_clean:
-            src[var] = src[var].apply(lambda x: int(x.replace(",", ""))
-                                                            if isinstance(x, str)
-                                                            else x)
+        for var in cls.count_columns:
+            src[var] = cls._parse_counts(src[var])
 
         # Set test_units
-        # print(src.columns)
-        src['test_units'] = src.apply(lambda row: 'persons'
-                                                   if row['date'] < datetime.date(2021,2,1)
-                                                   else 'tests', axis=1)
+        src['test_units'] = np.where(src['date'] < pd.Timestamp(2021, 2, 1), 'persons', 'tests')
 
+        return src
+
+    @classmethod
+    def derive(cls, src):
+        """
+        Add the population and rate columns
+
+        :param src: pd.DataFrame - output of parse()
+
+        :return: pd.DataFrame
+        """
         # Compute proportions
         # src['population'] = src['location'].apply(population_table.get_population)
         src['population'] = 100000 * src['total_cases'] / src['total_cases_rate']
@@ -132,6 +169,4 @@ class PHAC(CovidDataset):
                     'total_probable_cases', 'total_recovered', 'new_recovered', 'active_cases']:
             src[var+"_rate"] = src[var] / src['population']
 
-        super().__init__(src)
-        return
-
+        return src
@@ -1,6 +1,10 @@
+import threading
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from .cache import cache_dir
+from .fetch import prefetch
+from .instrument import stage, instrumented
 
 class PopulationData:
     """
@@ -8,43 +12,130 @@ class PopulationData:
      - UN: https://population.un.org/wpp
      - Statistics Canada: https://www150.statcan.gc.ca/n1/pub/91-002-x/2019004/quarterly_trimestrielles_202001_v1.xlsx
      - US Census Bureau: https://www2.census.gov/programs-surveys/popest/datasets/2010-2019/national/totals/nst-est2019-alldata.csv?#
+
+    The primary sources are only downloaded by refresh().  Otherwise the table is loaded from the local cache written
+    by the last refresh, falling back to the population_data.csv snapshot bundled with the package.
     """
+
+    # Bump when the layout of the cached table changes so that stale caches are ignored
+    cache_version = 1
+    bundled_csv = Path(__file__).resolve().parent.parent / "population_data.csv"
+
+    # Primary sources read by refresh()
+    world_url = "https://population.un.org/wpp/Download/Files/1_Indicators%20(Standard)/CSV_FILES/WPP2019_TotalPopulationBySex.csv"
+    canada_url = "https://www150.statcan.gc.ca/n1/pub/91-002-x/2019004/quarterly_trimestrielles_202001_v1.xlsx"
+    us_url = "https://www2.census.gov/programs-surveys/popest/datasets/2010-2019/national/totals/nst-est2019-alldata.csv?#"
+
     def __init__(self, **args):
+        """
+        Initialize the population table
+
+        :keyword df: pd.DataFrame - use df as the table
+        :keyword refresh: boolean (default=False) - download the primary sources instead of loading a local copy
+        :keyword sources: dict - passed to refresh()
+        """
         if 'df' in args:
             self.df = args['df']
+        elif args.get('refresh', False):
+            self.refresh(args.get('sources'))
         else:
-            self.df = pd.DataFrame(columns=['year', 'location', 'population', 'population_density'])
-            self.update(self._get_world())
-            self.update(self._get_canada())
-            self.update(self._get_us())
+            with stage("PopulationData.read") as s:
+                self.df = pd.read_csv(self.local_source())
+                s.rows = len(self.df)
+        return
+
+    @property
+    def df(self):
+        return self._df
+
+    @df.setter
+    def df(self, table):
+        """
+        Replace the table and index it by location.  When a location has several rows the first one is used.
+
+        :param table: pd.DataFrame - columns location, population and population_density
+        """
+        self._df = table
+        first = ~table['location'].duplicated().to_numpy()
+        self._locations = pd.Index(table['location'].to_numpy()[first])
+        self._values = {col: table[col].to_numpy(dtype=float)[first] for col in ('population', 'population_density')}
+        self._positions = {loc: k for k, loc in enumerate(self._locations)}
         return
 
     @classmethod
     def from_csv(cls, filename):
-        result = PopulationData()
-        result.df = pd.read_csv(filename)
-        return result
+        return cls(df=pd.read_csv(filename))
+
+    @classmethod
+    def cache_path(cls):
+        """
+        Return the path of the versioned on-disk cache written by refresh()
+
+        :return: pathlib.Path
+        """
+        return cache_dir("population") / f"population_data_v{cls.cache_version}.csv"
+
+    @classmethod
+    def local_source(cls):
+        """
+        Return the local file the table is loaded from: the cache if it exists, else the bundled snapshot
+
+        :return: pathlib.Path
+        """
+        cached = cls.cache_path()
+        if cached.exists():
+            return cached
+        return cls.bundled_csv
+
+    def refresh(self, sources=None):
+        """
+        Download the primary sources, replace the table and rewrite the on-disk cache.  The sources are downloaded
+        concurrently.
+
+        :param sources: dict (default=download world_url, canada_url and us_url) - local copies of the sources, keyed
+                        by world, canada and us
+        """
+        with stage("PopulationData.refresh"):
+            if sources is None:
+                paths = prefetch([self.world_url, self.canada_url, self.us_url])
+                sources = dict(world=paths[self.world_url], canada=paths[self.canada_url], us=paths[self.us_url])
+            self.df = pd.DataFrame(columns=['year', 'location', 'population', 'population_density'])
+            self.update(self._get_world(sources['world']))
+            self.update(self._get_canada(sources['canada']))
+            self.update(self._get_us(sources['us']))
+            self.to_csv(self.cache_path())
+        return
 
     def update(self, pop_data):
         self.df = self.df.merge(pop_data, how='outer')
         return
 
-    def _get_world(self):
-        url = "https://population.un.org/wpp/Download/Files/1_Indicators%20(Standard)/CSV_FILES/WPP2019_TotalPopulationBySex.csv"
+    @instrumented("PopulationData.world")
+    def _get_world(self, source):
+        """
+        Read the UN world population prospects in the layout of world_url
+
+        :param source: str, Path or file-like
+        """
         col_map = {
             "Location": "location",
             "PopTotal": "population",
             "PopDensity": "population_density",
             "Time": "year"
         }
-        df = pd.read_csv(url)
+        df = pd.read_csv(source)
         df.rename(columns=col_map, inplace=True)
         df['population'] = 1000 * df['population']
         df = df.loc[df.Variant == 'Medium'][list(col_map.values())]
         return df.loc[df.year == 2020]
 
-    def _get_canada(self):
-        url = "https://www150.statcan.gc.ca/n1/pub/91-002-x/2019004/quarterly_trimestrielles_202001_v1.xlsx"
+    @instrumented("PopulationData.canada")
+    def _get_canada(self, source):
+        """
+        Read the Statistics Canada quarterly estimates in the layout of canada_url
+
+        :param source: str, Path or file-like
+        """
         pr_mapper = {'Canada': 'Canada',
                      'N.L.': 'Newfoundland and Labrador',
                      'P.E.I.': 'Prince Edward Island',
@@ -76,7 +167,7 @@ class PopulationData:
             'Nunavut': 1936113
         }
         df = pd.read_excel(
-            url,
+            source,
             sheet_name="Population",
             header=[3],
             skiprows=[4],
@@ -98,9 +189,14 @@ class PopulationData:
         df["population_density"] = df["population"] / (df["location"].apply(lambda loc: areas[loc]))
         return df.loc[(df.year == 2020) & (df.month == 1)].drop('month', axis='columns')
 
-    def _get_us(self):
-        url = "https://www2.census.gov/programs-surveys/popest/datasets/2010-2019/national/totals/nst-est2019-alldata.csv?#"
-        df = pd.read_csv(url)
+    @instrumented("PopulationData.us")
+    def _get_us(self, source):
+        """
+        Read the US Census Bureau estimates in the layout of us_url
+
+        :param source: str, Path or file-like
+        """
+        df = pd.read_csv(source)
         df = df[["NAME", "POPESTIMATE2019"]]
         df.rename(
             columns={'NAME': 'location', 'POPESTIMATE2019': 'population'}, inplace=True
@@ -111,19 +207,56 @@ class PopulationData:
         return df
 
 
+    @instrumented("PopulationData.lookup")
+    def _lookup(self, col, locations, aliases=None):
+        """
+        Return the values of col for locations as an aligned array, np.nan for unknown locations
+
+        :param col: str - population or population_density
+        :param locations: list like
+        :param aliases: dict (default=None) - maps names used by a data source to the names in the table.  Names
+                        mapped to None have no entry in the table
+
+        :return: np.array of float
+        """
+        codes, uniques = pd.factorize(np.asarray(locations, dtype=object))
+        names = pd.Index(uniques)
+        if aliases:
+            names = names.map(lambda loc: aliases.get(loc, loc))
+        positions = self._locations.get_indexer(names)
+        values = np.append(self._values[col], np.nan)[positions]
+        # codes of -1 mark missing locations, which take the trailing nan
+        return np.append(values, np.nan)[codes]
+
+    def populations(self, locations, aliases=None):
+        """
+        Return the population of each location
+
+        :param locations: list like
+        :param aliases: dict (default=None) - maps names used by a data source to the names in the table
+
+        :return: np.array of float aligned with locations, np.nan where the population is unknown
+        """
+        return self._lookup('population', locations, aliases)
+
+    def densities(self, locations, aliases=None):
+        """
+        Return the population density of each location
+
+        :param locations: list like
+        :param aliases: dict (default=None) - maps names used by a data source to the names in the table
+
+        :return: np.array of float aligned with locations, np.nan where the density is unknown
+        """
+        return self._lookup('population_density', locations, aliases)
+
     def get_population(self, loc):
-        try:
-            result = self.df.loc[self.df['location'] == loc, 'population'].values[0]
-        except:
-            result = np.nan
-        return result
+        position = self._positions.get(loc)
+        return np.nan if position is None else self._values['population'][position]
 
     def get_density(self, loc):
-        try:
-            result = self.df.loc[self.df['location'] == loc, 'population_density'].values[0]
-        except:
-            result = np.nan
-        return result
+        position = self._positions.get(loc)
+        return np.nan if position is None else self._values['population_density'][position]
 
     def to_csv(self, filename):
         """
@@ -136,5 +269,46 @@ class PopulationData:
         self.df.to_csv(save_path, index=False)
         return
 
-# population_table = PopulationData.from_csv("../population_data.csv")
-population_table = PopulationData()
+
+
+class LazyPopulationTable:
+    """
+    Stand-in for a PopulationData object that defers loading the table until it is first used.  Attribute access
+    is forwarded to the underlying PopulationData object.
+    """
+    def __init__(self):
+        self._table = None
+        self._lock = threading.Lock()
+        return
+
+    @property
+    def loaded(self):
+        return self._table is not None
+
+    def resolve(self):
+        """
+        Return the underlying PopulationData object, loading it on first use
+
+        :return: PopulationData
+        """
+        if self._table is None:
+            with self._lock:
+                if self._table is None:
+                    self._table = PopulationData()
+        return self._table
+
+    def refresh(self, sources=None):
+        """
+        Download the primary sources and rewrite the on-disk cache
+
+        :param sources: dict (default=download the sources) - see PopulationData.refresh
+        """
+        table = PopulationData(refresh=True, sources=sources)
+        self._table = table
+        return
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+
+population_table = LazyPopulationTable()
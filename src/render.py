@@ -0,0 +1,346 @@
+"""
+Headless batch rendering of the location and variable charts.
+
+The plotted series are computed once per dataset in the calling process, with one query per variable for all the
+locations, and the drawing is fanned out to a pool of worker processes.  Each worker draws a chart from its slice of
+the data and writes it in every requested format, so the dataset itself is never copied to the workers.  Charts are
+drawn on their own Agg canvas outside pyplot, so drawing in the calling process (processes=1) leaves its backend
+alone.
+
+    render_locations(ecdc, directory="charts", formats=("png", "svg"), processes=8, cache=RenderCache())
+
+With a RenderCache the images are stored under a fingerprint of the drawn data slice and the drawing options, so a
+chart whose data has not changed since the last run is copied from the cache instead of being drawn again.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import concurrent.futures
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from .cache import cache_dir
+from .instrument import stage
+
+# Formats accepted by render_locations and render_vars
+FORMATS = ("png", "svg", "pdf")
+
+# Part of every fingerprint, increment when the drawing functions change what they draw
+RENDER_VERSION = 1
+
+
+def _file_stem(*parts):
+    """
+    Return a file name made of parts with characters that are unsafe in file names replaced
+    """
+    return "-".join(re.sub(r"[^\w.]+", "_", str(part)).strip("_") for part in parts)
+
+
+def _draw(job):
+    """
+    Draw one chart and write it in each format.  The chart is drawn on a figure with its own Agg canvas, outside
+    pyplot, so the backend and the open figures of the calling process are left alone.
+
+    :param job: tuple - (kind, data, args, kwargs, stem, formats, dpi)
+
+    :return: list of str - paths written
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from .dataset import draw_location, draw_var
+
+    kind, data, args, kwargs, stem, formats, dpi = job
+    fig = Figure(figsize=kwargs.get("figsize", (16, 12)))
+    FigureCanvasAgg(fig)
+    if kind == "location":
+        draw_location(data, figure=fig, **kwargs)
+    else:
+        draw_var(data, *args, ax=fig.add_subplot(111), **kwargs)
+    paths = []
+    for fmt in formats:
+        path = f"{stem}.{fmt}"
+        fig.savefig(path, format=fmt, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+def _fingerprint(job):
+    """
+    Return a hash of what a job draws: the values, dates and columns of its data and the drawing options
+    """
+    import matplotlib
+
+    kind, data, args, kwargs, _, _, dpi = job
+    digest = hashlib.sha256()
+    options = dict(version=RENDER_VERSION, matplotlib=matplotlib.__version__, kind=kind, args=args, kwargs=kwargs,
+                   dpi=dpi, columns=[str(column) for column in data.columns])
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(pd.DatetimeIndex(pd.to_datetime(data.index)).asi8.tobytes())
+    digest.update(np.ascontiguousarray(data.to_numpy(dtype=float, na_value=np.nan)).tobytes())
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """
+    Rendered chart images stored on disk by fingerprint.  The least recently used images are evicted once the
+    stored images exceed max_bytes
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Instantiate a RenderCache
+
+        :keyword directory: str or Path (default=<cache root>/renders) - where images are stored
+        :keyword max_bytes: int (default=256 MiB) - size of the stored images above which images are evicted
+        """
+
+        if "directory" in kwargs:
+            self.directory = Path(kwargs["directory"])
+            self.directory.mkdir(parents=True, exist_ok=True)
+        else:
+            self.directory = cache_dir("renders")
+        self.max_bytes = kwargs.get("max_bytes", 256 * 2 ** 20)
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def path(self, key, fmt):
+        return self.directory / f"{key}.{fmt}"
+
+    def get(self, key, fmt):
+        """
+        Return the path of the image stored for key and mark it as recently used, or None if there is none
+
+        :param key: str - fingerprint
+        :param fmt: str - image format
+
+        :return: pathlib.Path or None
+        """
+
+        path = self.path(key, fmt)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put(self, key, fmt, source):
+        """
+        Store a copy of the image source under key
+
+        :param key: str - fingerprint
+        :param fmt: str - image format
+        :param source: str or Path - image file
+
+        :return: pathlib.Path - the stored copy
+        """
+
+        path = self.path(key, fmt)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        shutil.copyfile(source, tmp)
+        os.replace(tmp, path)
+        return path
+
+    def evict(self):
+        """
+        Remove the least recently used images until the stored images fit in max_bytes
+
+        :return: int - number of images removed
+        """
+
+        entries = []
+        for path in self.directory.iterdir():
+            if path.suffix[1:] in FORMATS:
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        size = sum(entry[1] for entry in entries)
+        removed = 0
+        for _, nbytes, path in entries:
+            if size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            size -= nbytes
+            removed += 1
+        return removed
+
+    def size(self):
+        return sum(path.stat().st_size for path in self.directory.iterdir() if path.suffix[1:] in FORMATS)
+
+    def clear(self):
+        for path in self.directory.iterdir():
+            if path.suffix[1:] in FORMATS:
+                path.unlink(missing_ok=True)
+        return
+
+    def info(self):
+        """
+        :return: dict with the hits, misses, size in bytes and max_bytes of the cache
+        """
+
+        return dict(hits=self.hits, misses=self.misses, size=self.size(), max_bytes=self.max_bytes)
+
+
+def _run(jobs, processes, chunksize):
+    """
+    Draw jobs in a process pool, or in this process when processes is 1
+
+    :return: list of str - paths written, in the order of jobs
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(jobs)))
+    if processes == 1:
+        return [path for job in jobs for path in _draw(job)]
+
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (4 * processes))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        return [path for paths in pool.map(_draw, jobs, chunksize=chunksize) for path in paths]
+
+
+def _render(jobs, processes, chunksize, cache):
+    """
+    Draw the jobs whose images are not in cache and copy the others from it
+
+    :return: list of str - paths written, in the order of jobs
+    """
+    if cache is None:
+        return _run(jobs, processes, chunksize)
+
+    stale = []
+    for job in jobs:
+        key, stem, formats = _fingerprint(job), job[4], job[5]
+        stored = [cache.get(key, fmt) for fmt in formats]
+        if all(stored):
+            for fmt, path in zip(formats, stored):
+                shutil.copyfile(path, f"{stem}.{fmt}")
+        else:
+            stale.append((key, job))
+
+    _run([job for _, job in stale], processes, chunksize)
+    for key, job in stale:
+        for fmt in job[5]:
+            cache.put(key, fmt, f"{job[4]}.{fmt}")
+    cache.evict()
+    return [f"{job[4]}.{fmt}" for job in jobs for fmt in job[5]]
+
+
+def _check(formats, directory):
+    unknown = [fmt for fmt in formats if fmt not in FORMATS]
+    if unknown:
+        raise ValueError(f"unknown formats {unknown}, expected a subset of {FORMATS}")
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def render_locations(dataset, locations=None, directory=".", **kwargs):
+    """
+    Write the CovidDataset.plot_location chart of each location
+
+    :param dataset: CovidDataset
+    :param locations: list like of str (default=dataset.locations)
+    :param directory: str or Path (default=".") - created if missing; files are named location-<location>.<format>
+    :keyword formats: list like of str (default=("png",)) - subset of FORMATS
+    :keyword processes: int (default=os.cpu_count()) - worker processes, 1 draws in this process
+    :keyword chunksize: int (default=jobs / (4 * processes)) - charts sent to a worker at a time
+    :keyword dpi: int (default=100)
+    :keyword cache: RenderCache (default=None) - copy the images of unchanged charts from cache
+    :keyword figsize: (float, float)
+    :keyword from_date: str = yyyy-mm-dd
+
+    :return: list of str - paths written
+    """
+
+    formats = tuple(kwargs.get("formats", ("png",)))
+    directory = _check(formats, directory)
+    locations = list(dataset.locations if locations is None else locations)
+    options = {key: kwargs[key] for key in ("figsize", "from_date") if key in kwargs}
+
+    with stage("render.prepare", rows=len(locations)):
+        data = dataset.location_plot_data(*locations, **options)
+        jobs = [("location", data[location], (), options, str(directory / _file_stem("location", location)),
+                 formats, kwargs.get("dpi", 100)) for location in locations]
+    with stage("render.draw", rows=len(jobs)):
+        return _render(jobs, kwargs.get("processes"), kwargs.get("chunksize"), kwargs.get("cache"))
+
+
+def render_vars(dataset, variables, groups, directory=".", **kwargs):
+    """
+    Write the CovidDataset.plot_var chart of each variable for each group of locations
+
+    :param dataset: CovidDataset
+    :param variables: list like of str - variables accepted by CovidDataset.plot_var
+    :param groups: list like of list like of str - the locations drawn together on a chart, a str is a group of one
+    :param directory: str or Path (default=".") - created if missing; files are named <var>-<locations>.<format>
+    :keyword formats: list like of str (default=("png",)) - subset of FORMATS
+    :keyword processes: int (default=os.cpu_count()) - worker processes, 1 draws in this process
+    :keyword chunksize: int (default=jobs / (4 * processes)) - charts sent to a worker at a time
+    :keyword dpi: int (default=100)
+    :keyword cache: RenderCache (default=None) - copy the images of unchanged charts from cache
+    :keyword: other keyword arguments of CovidDataset.plot_var
+
+    :return: list of str - paths written
+    """
+
+    formats = tuple(kwargs.pop("formats", ("png",)))
+    directory = _check(formats, directory)
+    processes, chunksize, dpi = kwargs.pop("processes", None), kwargs.pop("chunksize", None), kwargs.pop("dpi", 100)
+    cache = kwargs.pop("cache", None)
+    groups = [(group,) if isinstance(group, str) else tuple(group) for group in groups]
+    locations = sorted({location for group in groups for location in group})
+
+    jobs = []
+    with stage("render.prepare", rows=len(variables) * len(groups)):
+        for var in variables:
+            data = dataset.var_plot_data(var, *locations, **kwargs)
+            for group in groups:
+                jobs.append(("var", data[sorted(group)], (var, group), kwargs,
+                             str(directory / _file_stem(var, *group)), formats, dpi))
+    with stage("render.draw", rows=len(jobs)):
+        return _render(jobs, processes, chunksize, cache)
+
+
+def location_image(dataset, location, fmt="png", **kwargs):
+    """
+    Return the CovidDataset.plot_location chart of location as image bytes
+
+    :param dataset: CovidDataset
+    :param location: str
+    :param fmt: str (default="png") - one of FORMATS
+    :keyword cache: RenderCache (default=None) - return the stored image if the chart is unchanged
+    :keyword: other keyword arguments of render_locations
+
+    :return: bytes
+    """
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, = render_locations(dataset, [location], tmp, formats=[fmt], processes=1, **kwargs)
+        return Path(path).read_bytes()
+
+
+def var_image(dataset, var, *locations, fmt="png", **kwargs):
+    """
+    Return the CovidDataset.plot_var chart of var for locations as image bytes
+
+    :param dataset: CovidDataset
+    :param var: str
+    :param locations: str - the locations drawn together
+    :param fmt: str (default="png") - one of FORMATS
+    :keyword cache: RenderCache (default=None) - return the stored image if the chart is unchanged
+    :keyword: other keyword arguments of render_vars
+
+    :return: bytes
+    """
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, = render_vars(dataset, [var], [locations], tmp, formats=[fmt], processes=1, **kwargs)
+        return Path(path).read_bytes()
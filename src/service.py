@@ -0,0 +1,342 @@
+"""
+Local HTTP/JSON service answering metric queries from datasets loaded once and shared by every client.
+
+    python -m src.service [--host HOST] [--port PORT] [--workers N] [ecdc phac ...]
+
+Queries are GET requests
+
+    /<source>/<metric>?var=total_cases&location=Canada&location=Italy&window=7&start=2020-03-01&end=2020-06-30
+
+where metric is one of METRICS.  /, /<source> and /<source>/locations list the sources, the metrics and the locations.
+Responses are JSON with the index, columns and data of the result frame, missing values as null.  Each response is
+kept in an LRU cache and carries an ETag so that clients revalidating with If-None-Match get a 304 without a body.
+Requests are handled by a fixed pool of worker threads.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import http.server
+import json
+import threading
+import urllib.parse
+import pandas as pd
+
+from .cache import LRUCache
+from .instrument import stage
+
+
+def _var_by_location(dataset, var, window, locations):
+    if window is None:
+        return dataset.var_by_location(var, *locations)
+    return dataset.var_by_location(var, *locations, ma_window=window)
+
+
+def _growth_rate(dataset, var, window, locations):
+    return dataset.growth_rate(var, window or 1, *locations)
+
+
+def _pos_test_rate(dataset, var, window, locations):
+    return dataset.pos_test_rate(window or 1, *locations)
+
+
+# metric -> function(dataset, var, window, locations) returning a date x location DataFrame
+METRICS = {
+    'var_by_location': _var_by_location,
+    'growth_rate': _growth_rate,
+    'pos_test_rate': _pos_test_rate,
+}
+
+# metric -> derived series accepted as var besides the variables of the dataset, None for metrics without a var
+DERIVED_VARS = {
+    'var_by_location': (),
+    'growth_rate': ('active_confirmed_cases', 'pos_test_rate'),
+    'pos_test_rate': None,
+}
+
+
+class QueryError(Exception):
+    """
+    A query that cannot be answered, with the HTTP status to answer it with
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        return
+
+
+class QueryService:
+    """
+    Answer metric queries from a set of datasets, caching the encoded responses
+    """
+
+    def __init__(self, sources, cache_size=256):
+        """
+        Instantiate a QueryService
+
+        :param sources: dict name -> CovidDataset, or a callable returning one, called once on first use
+        :param cache_size: int (default=256) - number of responses kept
+        """
+
+        self._sources = dict(sources)
+        self._datasets = {}
+        self._lock = threading.Lock()
+        self.cache = LRUCache(cache_size)
+        return
+
+    @property
+    def sources(self):
+        return sorted(self._sources)
+
+    def dataset(self, source):
+        """
+        Return the dataset of source, loading it on first use
+
+        :param source: str
+
+        :return: CovidDataset
+        """
+
+        if source not in self._sources:
+            raise QueryError(404, f"unknown source {source!r}, expected one of {self.sources}")
+        if source not in self._datasets:
+            with self._lock:
+                if source not in self._datasets:
+                    dataset = self._sources[source]
+                    self._datasets[source] = dataset() if callable(dataset) else dataset
+        return self._datasets[source]
+
+    def refresh(self, source):
+        """
+        Refresh the dataset of source and drop the cached responses involving a changed location
+
+        :param source: str
+
+        :return: list - locations with new or revised rows, see CovidDataset.refresh()
+        """
+
+        changed = self.dataset(source).refresh()
+        if changed:
+            changed_set = set(changed)
+            self.cache.discard(lambda key: key[0] == source and not changed_set.isdisjoint(key[3]))
+        return changed
+
+    def query(self, source, metric, var=None, locations=(), window=None, start=None, end=None):
+        """
+        Return the encoded response of a query, from the cache when possible
+
+        :param source: str - name of the dataset
+        :param metric: str - one of METRICS
+        :param var: str (default=None) - variable of the dataset, required by var_by_location and growth_rate and
+                    refused by pos_test_rate
+        :param locations: list like of str
+        :param window: int (default=None) - moving average or growth window
+        :param start: str (default=first date) - yyyy-mm-dd
+        :param end: str (default=last date) - yyyy-mm-dd
+
+        :return: (str, bytes) - ETag and JSON body
+        """
+
+        key = (source, metric, var, tuple(locations), window, start, end)
+        response = self.cache.get(key)
+        if response is None:
+            with stage("QueryService.query"):
+                response = self._answer(source, metric, var, list(locations), window, start, end)
+            self.cache.put(key, response)
+        return response
+
+    def _answer(self, source, metric, var, locations, window, start, end):
+        dataset = self.dataset(source)
+        if metric not in METRICS:
+            raise QueryError(404, f"unknown metric {metric!r}, expected one of {sorted(METRICS)}")
+        if DERIVED_VARS[metric] is None:
+            if var is not None:
+                raise QueryError(400, f"{metric} does not take a variable")
+        elif var not in dataset.variables and var not in DERIVED_VARS[metric]:
+            raise QueryError(400, f"unknown variable {var!r}")
+        if not locations:
+            raise QueryError(400, "no location given")
+        unknown = sorted(set(locations) - set(dataset.locations))
+        if unknown:
+            raise QueryError(400, f"unknown locations {unknown}")
+        start, end = _date(start, "start"), _date(end, "end")
+
+        frame = METRICS[metric](dataset, var, window, locations)
+        if not isinstance(frame.index, pd.DatetimeIndex):
+            # datasets with yyyy-mm-dd string dates
+            start, end = (None if date is None else date.strftime("%Y-%m-%d") for date in (start, end))
+        frame = frame.loc[start:end]
+        result = json.loads(frame.to_json(orient="split", date_format="iso"))
+        body = json.dumps(dict(source=source, metric=metric, var=var, window=window, **result)).encode("utf-8")
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"', body
+
+    def describe(self, source=None):
+        """
+        Return the encoded listing of the sources, or of the metrics, variables and locations of source
+
+        :return: (str, bytes) - ETag and JSON body
+        """
+
+        if source is None:
+            listing = dict(sources=self.sources, metrics=sorted(METRICS))
+        else:
+            dataset = self.dataset(source)
+            listing = dict(source=source, metrics=sorted(METRICS), variables=sorted(dataset.variables),
+                           locations=list(dataset.locations), current_date=str(dataset.current_date))
+        body = json.dumps(listing).encode("utf-8")
+        return '"' + hashlib.sha256(body).hexdigest()[:32] + '"', body
+
+
+def _integer(params, name):
+    if name not in params:
+        return None
+    try:
+        return int(params[name][-1])
+    except ValueError:
+        raise QueryError(400, f"{name} must be an integer")
+
+
+def _date(value, name):
+    if value is None:
+        return None
+    try:
+        date = pd.Timestamp(value)
+    except (ValueError, TypeError):
+        date = pd.NaT
+    if date is pd.NaT:
+        raise QueryError(400, f"{name} must be a date, yyyy-mm-dd")
+    return date
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    service = None
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        parts = [urllib.parse.unquote(part) for part in url.path.split("/") if part]
+        try:
+            if not parts:
+                etag, body = self.service.describe()
+            elif len(parts) == 1 or parts[1] == "locations":
+                etag, body = self.service.describe(parts[0])
+            else:
+                etag, body = self.service.query(parts[0], parts[1], params.get("var", [None])[-1],
+                                                params.get("location", []), _integer(params, "window"),
+                                                params.get("start", [None])[-1], params.get("end", [None])[-1])
+        except QueryError as err:
+            self._send(err.status, json.dumps(dict(error=str(err))).encode("utf-8"))
+            return
+        except Exception as err:
+            self._send(500, json.dumps(dict(error=f"{type(err).__name__}: {err}")).encode("utf-8"))
+            return
+
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            self._send(304, b"", etag)
+        else:
+            self._send(200, body, etag)
+        return
+
+    def _send(self, status, body, etag=None):
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+        if status != 304:
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class QueryServer(http.server.HTTPServer):
+    """
+    HTTP server handing each connection to a fixed pool of worker threads
+    """
+
+    def __init__(self, address, service, workers=8):
+        """
+        Instantiate a QueryServer
+
+        :param address: (str, int) - host and port, port 0 picks a free port
+        :param service: QueryService
+        :param workers: int (default=8) - number of worker threads
+        """
+
+        handler = type("Handler", (_Handler,), {"service": service})
+        super().__init__(address, handler)
+        self.service = service
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query")
+        return
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process, request, client_address)
+        return
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+        return
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+        return
+
+
+def serve(sources, host="127.0.0.1", port=8050, **kwargs):
+    """
+    Start a QueryServer in a background thread
+
+    :param sources: dict - see QueryService
+    :param host: str (default="127.0.0.1")
+    :param port: int (default=8050) - 0 picks a free port, see server.server_port
+    :keyword workers: int (default=8) - number of worker threads
+    :keyword cache_size: int (default=256) - number of responses kept
+
+    :return: QueryServer - stop it with shutdown() and server_close()
+    """
+
+    service = QueryService(sources, kwargs.get("cache_size", 256))
+    server = QueryServer((host, port), service, kwargs.get("workers", 8))
+    threading.Thread(target=server.serve_forever, name="query-server", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    from .environment import DATASETS, build_environment
+
+    parser = argparse.ArgumentParser(description="Serve dataset metrics as JSON")
+    parser.add_argument("sources", nargs="*", help=f"datasets to serve, of {sorted(DATASETS)} (default=ecdc phac)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--cache-size", type=int, default=256)
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.sources) - set(DATASETS))
+    if unknown:
+        parser.error(f"unknown datasets {unknown}")
+
+    datasets = build_environment(args.sources or ("ecdc", "phac"))
+    server = QueryServer((args.host, args.port), QueryService(datasets, args.cache_size), args.workers)
+    print(f"serving {', '.join(sorted(datasets))} on http://{args.host}:{server.server_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Columnar binary storage for parsed data frames.
+
+A frame is saved as a directory holding one .npy file per column plus a meta.json describing the columns:
+ - datetime columns are stored as datetime64[ns]
+ - string (object) and categorical columns are stored as integer codes, the categories are kept in meta.json
+ - nullable (pandas masked) columns are stored as their values plus a boolean mask file
+ - numeric columns are stored with their own dtype
+
+The attrs of the frame are kept in meta.json and must be JSON serializable.
+
+Columns can be read selectively and .npy files are memory-mapped, so reloading a frame costs little more than
+reading the bytes of the requested columns.
+"""
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+FORMAT_NAME = "covid-columns"
+FORMAT_VERSION = 2
+
+# Versions read by read_columns. Version 1 directories have no nullable columns or attrs
+READABLE_VERSIONS = (1, 2)
+
+# pandas array types rebuilt from values and mask, by numpy dtype kind
+_MASKED_ARRAYS = {'i': pd.arrays.IntegerArray, 'u': pd.arrays.IntegerArray,
+                  'f': pd.arrays.FloatingArray, 'b': pd.arrays.BooleanArray}
+
+
+def _code_dtype(n_categories):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def _to_json_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def write_columns(df, path):
+    """
+    Save df as a column directory.  An existing directory at path is replaced.
+
+    :param df: pd.DataFrame - the index is not saved
+    :param path: str or Path - target directory
+    """
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}."))
+    columns = []
+    try:
+        for i, name in enumerate(df.columns):
+            col = df[name]
+            file_name = f"{i}.npy"
+            if pd.api.types.is_datetime64_any_dtype(col.dtype):
+                kind = "datetime"
+                values = col.to_numpy(dtype="datetime64[ns]")
+                spec = {}
+            elif isinstance(col.dtype, pd.CategoricalDtype) or col.dtype == object:
+                kind = "categorical" if isinstance(col.dtype, pd.CategoricalDtype) else "object"
+                codes, categories = pd.factorize(col, sort=True)
+                values = codes.astype(_code_dtype(len(categories)))
+                spec = {"categories": [_to_json_value(c) for c in categories]}
+            elif isinstance(col.dtype, pd.api.extensions.ExtensionDtype) and col.dtype.kind in _MASKED_ARRAYS:
+                kind = "nullable"
+                values = col.to_numpy(dtype=col.dtype.numpy_dtype, na_value=col.dtype.numpy_dtype.type(0))
+                mask_file = f"{i}.mask.npy"
+                np.save(tmp / mask_file, col.isna().to_numpy(), allow_pickle=False)
+                spec = {"mask": mask_file}
+            else:
+                kind = "numeric"
+                values = col.to_numpy()
+                spec = {}
+            np.save(tmp / file_name, values, allow_pickle=False)
+            columns.append(dict(name=name, kind=kind, file=file_name, dtype=str(values.dtype), **spec))
+
+        with open(tmp / "meta.json", "w") as f:
+            json.dump({"format": FORMAT_NAME, "version": FORMAT_VERSION, "nrows": len(df), "columns": columns,
+                       "attrs": df.attrs}, f)
+
+        if path.exists():
+            shutil.rmtree(path)
+        os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return
+
+
+def read_meta(path):
+    """
+    Return the meta data of a column directory
+
+    :param path: str or Path
+
+    :return: dict
+    """
+
+    with open(Path(path) / "meta.json") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT_NAME or meta.get("version") not in READABLE_VERSIONS:
+        raise ValueError(f"{path} is not a {FORMAT_NAME} v{FORMAT_VERSION} directory")
+    return meta
+
+
+def read_columns(path, columns=None, mmap_mode="r"):
+    """
+    Load a column directory written by write_columns
+
+    :param path: str or Path
+    :param columns: list like (default=all columns) - the columns to load
+    :param mmap_mode: str or None (default='r') - passed to numpy.load; None reads the columns into memory
+
+    :return: pd.DataFrame
+    """
+
+    path = Path(path)
+    meta = read_meta(path)
+    specs = {spec["name"]: spec for spec in meta["columns"]}
+    if columns is None:
+        columns = list(specs)
+    missing = [name for name in columns if name not in specs]
+    if missing:
+        raise KeyError(f"columns not in {path}: {missing}")
+
+    data = {}
+    for name in columns:
+        spec = specs[name]
+        values = np.load(path / spec["file"], mmap_mode=mmap_mode, allow_pickle=False)
+        if spec["kind"] == "categorical":
+            data[name] = pd.Categorical.from_codes(values, categories=spec["categories"])
+        elif spec["kind"] == "object":
+            lookup = np.empty(len(spec["categories"]) + 1, dtype=object)
+            lookup[:-1] = spec["categories"]
+            lookup[-1] = np.nan
+            data[name] = lookup.take(values)
+        elif spec["kind"] == "nullable":
+            mask = np.load(path / spec["mask"], mmap_mode=mmap_mode, allow_pickle=False)
+            data[name] = _MASKED_ARRAYS[values.dtype.kind](values, mask)
+        else:
+            data[name] = values
+    df = pd.DataFrame(data, columns=columns, copy=False)
+    df.attrs.update(meta.get("attrs", {}))
+    return df
@@ -0,0 +1,43 @@
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from benchmarks import suite, synthetic
+from src import ECDC, PHAC
+from src.ontario import Ontario
+
+
+class TestSynthetic(unittest.TestCase):
+    def test_sources_parse(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "owid.csv"
+            synthetic.owid_csv(path, locations=5, days=20, gap_rate=0.25, extra_columns=['stringency_index'])
+            ecdc = ECDC(source=str(path))
+        self.assertEqual(len(ecdc.locations), 5)
+        self.assertLess(len(ecdc.df), 5 * 20)
+
+        phac = PHAC(source=io.StringIO(synthetic.phac_csv(locations=16, days=20)))
+        self.assertEqual(len(phac.df), 16 * 20)
+        self.assertIn('Region 015', phac.locations)
+
+        ontario = Ontario(source=io.StringIO(synthetic.ontario_csv(locations=3, days=20)))
+        self.assertEqual(ontario.locations, sorted(synthetic.ONTARIO_CITIES[:3]))
+        return
+
+
+class TestSuite(unittest.TestCase):
+    def test_results_are_json(self):
+        report = suite.run_suite(locations=4, days=40, repeat=1, only=['ingest_phac', 'growth_rate'])
+        self.assertEqual([r['name'] for r in report['results']], ['ingest_phac', 'growth_rate'])
+        self.assertTrue(all(r['status'] == 'ok' for r in report['results']))
+        report = json.loads(json.dumps(report))
+        self.assertEqual(set(suite.compare(report, report).values()), {1.0})
+        with self.assertRaises(ValueError):
+            suite.run_suite(only=['no_such_scenario'])
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
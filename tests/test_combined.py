@@ -0,0 +1,81 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from src import CovidDataset, ECDC, PHAC, PopulationData, population_table
+from src.combined import CombinedStore
+from tests.test_coviddataset import synthetic_frame
+
+
+class TestCombinedStore(unittest.TestCase):
+    def setUp(self):
+        self.phac = PHAC(source=io.StringIO(synthetic.phac_csv(days=30)), dense=True)
+        df = synthetic_frame(locations=('Canada', 'France'), days=40)
+        df['date'] = (pd.to_datetime(df['date']) - pd.Timedelta(days=5)).dt.strftime('%Y-%m-%d')
+        self.world = CovidDataset(df)
+        self.combined = CombinedStore({'phac': self.phac, 'world': self.world})
+        return
+
+    def test_aligned_lookup(self):
+        self.assertEqual(len(self.combined.dates), 40)
+        self.assertEqual(self.combined.sources_of('Canada'), ['phac', 'world'])
+        self.assertEqual(self.combined.sources_of('France'), ['world'])
+
+        compare = self.combined.compare('total_cases', 'Canada')
+        self.assertEqual(list(compare.columns), ['phac', 'world'])
+        for name, dataset in (('phac', self.phac), ('world', self.world)):
+            expected = dataset.var_by_location('total_cases', 'Canada')['Canada'].astype(float)
+            expected.index = pd.to_datetime(expected.index)
+            pd.testing.assert_series_equal(compare[name].dropna(), expected, check_names=False, check_freq=False)
+
+        frame = self.combined.frame('new_cases', ('phac', 'Ontario'), 'France', ('world', 'Atlantis'))
+        self.assertEqual(list(frame.columns), [('phac', 'Ontario'), ('world', 'France'), ('world', 'Atlantis')])
+        self.assertTrue(frame[('world', 'Atlantis')].isna().all())
+        day = frame.index[20]
+        self.assertEqual(self.combined.value('new_cases', 'phac', 'Ontario', day), frame.loc[day, ('phac', 'Ontario')])
+        self.assertTrue(np.isnan(self.combined.value('new_cases', 'phac', 'Ontario', frame.index[0])))
+        return
+
+    def test_memory_is_shared(self):
+        self.assertIs(self.combined._stores['phac'], self.phac.dense)
+        before = self.combined.frame('total_cases', ('phac', 'Quebec'))
+        self.phac.dense.values[-1, self.phac.dense.location_map['Quebec'],
+                               self.phac.dense.variable_map['total_cases']] = -1
+        self.assertEqual(self.combined.frame('total_cases', ('phac', 'Quebec')).iloc[-1, 0], -1)
+        self.assertNotEqual(before.iloc[-1, 0], -1)
+        self.assertLess(self.combined.nbytes, self.phac.dense.nbytes)
+        return
+
+    def test_per_million(self):
+        table = PopulationData(df=pd.DataFrame({'year': [2020], 'location': ['Canada'],
+                                                'population': [2e6], 'population_density': [1.0]}))
+        with mock.patch('src.combined.population_table', table):
+            frame = self.combined.frame('total_cases', 'Canada', per_million=True)
+        plain = self.combined.frame('total_cases', 'Canada')
+        np.testing.assert_allclose(frame.to_numpy(), plain.to_numpy() / 2)
+        return
+
+    def test_per_million_uses_source_aliases(self):
+        df = synthetic.owid_frame(locations=2, days=10, extra_columns=[])
+        df['location'] = df['location'].map({'Location 000': 'Bolivia', 'Location 001': 'Canada'})
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "owid.csv"
+            df.to_csv(path, index=False)
+            ecdc = ECDC(source=str(path))
+        combined = CombinedStore({'ecdc': ecdc, 'phac': self.phac})
+        frame = combined.frame('total_cases', 'Bolivia', ('phac', 'Ontario'), per_million=True)
+        plain = combined.frame('total_cases', 'Bolivia', ('phac', 'Ontario'))
+        populations = np.array([ECDC.populations(['Bolivia'])[0], population_table.populations(['Ontario'])[0]])
+        self.assertFalse(np.isnan(populations).any())
+        np.testing.assert_allclose(frame.to_numpy(), plain.to_numpy() / (populations / 1e6))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
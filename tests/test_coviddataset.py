@@ -1,4 +1,7 @@
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -6,7 +9,32 @@ import matplotlib.colors as mcolors
 from matplotlib.ticker import (MultipleLocator, FormatStrFormatter,
                                AutoMinorLocator)
 
-from src import ECDC, PHAC
+from src import CovidDataset, ECDC, PHAC
+from src.dense import DenseStore
+from src.materialize import MaterializedMetrics
+
+
+def synthetic_frame(locations=('Canada', 'France', 'United States'), days=60, seed=0):
+    """
+    Return a shuffled long-format frame in the CovidDataset layout
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for k, loc in enumerate(locations):
+        new_cases = rng.poisson(20 * (k + 1), days).astype(float)
+        new_tests = rng.poisson(500 * (k + 1), days).astype(float)
+        frames.append(pd.DataFrame({
+            'date': pd.date_range('2020-03-01', periods=days, freq='D'),
+            'location': loc,
+            'new_cases': new_cases,
+            'total_cases': np.cumsum(new_cases) + 1,
+            'total_deaths': np.cumsum(rng.poisson(1, days)).astype(float),
+            'total_tests': np.cumsum(new_tests)
+        }))
+    df = pd.concat(frames, ignore_index=True)
+    # drop some rows so locations have different date ranges
+    df = df.drop(index=[0, 1, 2, days + 5])
+    return df.sample(frac=1, random_state=seed)
 
 
 
@@ -58,7 +86,262 @@ class TestCovidDataset(unittest.TestCase):
         return
 
 
+class TestLocationIndex(unittest.TestCase):
+    def setUp(self):
+        self.src = synthetic_frame()
+        self.dataset = CovidDataset(self.src.copy())
+        return
+
+    def test_get_location(self):
+        canada = self.dataset.get_location('Canada')
+        expected = self.src.loc[self.src.location == 'Canada'].sort_values('date')
+        pd.testing.assert_frame_equal(canada, expected)
+        self.assertEqual(len(self.dataset.get_location('Atlantis')), 0)
+        return
+
+    def test_var_by_location_matches_full_scan(self):
+        locations = ('France', 'Canada', 'Atlantis')
+        select = self.src['location'].apply(lambda loc: loc in locations)
+        expected = self.src.loc[select].pivot(index='date', columns='location', values='total_cases')
+        pd.testing.assert_frame_equal(self.dataset.var_by_location('total_cases', *locations), expected)
+        return
+
+
+class TestMethodCache(unittest.TestCase):
+    def setUp(self):
+        self.dataset = CovidDataset(synthetic_frame())
+        return
+
+    def test_repeat_query_hits_cache(self):
+        first = self.dataset.growth_rate('total_cases', 7, 'Canada')
+        info = self.dataset.cache_info()
+        second = self.dataset.growth_rate('total_cases', 7, 'Canada')
+        pd.testing.assert_frame_equal(first, second)
+        self.assertEqual(self.dataset.cache_info()['hits'], info['hits'] + 1)
+        self.assertEqual(self.dataset.cache_info()['misses'], info['misses'])
+        return
+
+    def test_results_are_copies(self):
+        cases = self.dataset.var_by_location('total_cases', 'Canada')
+        expected = cases.copy()
+        cases.iloc[0, 0] = -1
+        cases['France'] = 0
+        pd.testing.assert_frame_equal(self.dataset.var_by_location('total_cases', 'Canada'), expected)
+        return
+
+    def test_cached_results_keep_dtypes(self):
+        df = synthetic_frame()
+        df['total_cases'] = df['total_cases'].astype('Int64')
+        nullable = CovidDataset(df)
+        for _ in range(2):
+            cases = nullable.var_by_location('total_cases', 'Canada', 'France')
+            self.assertEqual(set(map(str, cases.dtypes)), {'Int64'})
+            self.assertTrue(cases.isna().any().any())
+            pd.testing.assert_frame_equal(nullable.growth_rate('total_cases', 7, 'Canada', 'France'),
+                                          self.dataset.growth_rate('total_cases', 7, 'Canada', 'France'))
+        return
+
+    def test_replacing_df_invalidates(self):
+        before = self.dataset.var_by_location('total_cases', 'Canada')
+        df = self.dataset.df.copy()
+        df['total_cases'] = 2 * df['total_cases']
+        self.dataset.df = df
+        self.assertEqual(self.dataset.cache_info()['size'], 0)
+        after = self.dataset.var_by_location('total_cases', 'Canada')
+        pd.testing.assert_frame_equal(after, 2 * before)
+        return
+
+    def test_cache_is_bounded(self):
+        dataset = CovidDataset(synthetic_frame(), cache_size=2)
+        for window in (3, 7, 14):
+            dataset.pos_test_rate(window, 'France')
+        self.assertEqual(dataset.cache_info()['size'], 2)
+        return
+
+
+class TestDenseBackend(unittest.TestCase):
+    def setUp(self):
+        self.pivoted = CovidDataset(synthetic_frame())
+        self.dense = CovidDataset(synthetic_frame(), dense=True)
+        return
+
+    def test_store_shape(self):
+        store = self.dense.dense
+        self.assertEqual(store.values.shape, (60, 3, len(store.variables)))
+        self.assertIsNone(self.pivoted.dense)
+        return
+
+    def test_matches_pivot(self):
+        for locations in [('Canada',), ('United States', 'Canada'), ('France', 'Atlantis'), ()]:
+            for var in ['new_cases', 'total_cases', 'total_tests']:
+                pd.testing.assert_frame_equal(self.dense.var_by_location(var, *locations),
+                                              self.pivoted.var_by_location(var, *locations))
+        pd.testing.assert_frame_equal(self.dense.growth_rate('total_cases', 7, 'Canada', 'France'),
+                                      self.pivoted.growth_rate('total_cases', 7, 'Canada', 'France'))
+        pd.testing.assert_frame_equal(self.dense.pos_test_rate(7, 'Canada', 'France'),
+                                      self.pivoted.pos_test_rate(7, 'Canada', 'France'))
+        return
+
+    def test_update_grows_dates(self):
+        full = synthetic_frame()
+        variables = ['new_cases', 'total_cases', 'total_tests']
+        dropped = (full['date'] >= '2020-04-20') | (full['date'] == '2020-03-15')
+        store = DenseStore(full[~dropped], variables)
+        self.assertTrue(store.update(full[dropped]))
+        expected = DenseStore(full, variables)
+        pd.testing.assert_index_equal(store.dates, expected.dates)
+        for var in variables:
+            pd.testing.assert_frame_equal(store.frame(var, ['Canada', 'France']),
+                                          expected.frame(var, ['Canada', 'France']))
+
+        rows = full[full['location'] == 'Canada'].assign(location='Atlantis')
+        self.assertFalse(store.update(rows))
+        pd.testing.assert_index_equal(store.locations, expected.locations)
+        return
+
+    def test_duplicate_rows(self):
+        df = synthetic_frame()
+        df = pd.concat([df, df.iloc[[3]]])
+        with self.assertRaisesRegex(ValueError, "duplicate entries"):
+            CovidDataset(df).var_by_location('total_cases', 'Canada')
+        with self.assertRaisesRegex(ValueError, "duplicate entries"):
+            CovidDataset(df, dense=True)
+        return
+
+
+class TestMultiWindowGrowth(unittest.TestCase):
+    def setUp(self):
+        self.dataset = CovidDataset(synthetic_frame())
+        self.locations = ('Canada', 'France', 'United States')
+        return
+
+    def test_single_window_matches_pandas_formula(self):
+        cases = self.dataset.var_by_location('total_cases', *self.locations)
+        delta_ratio = (cases.diff(periods=7) / cases.shift(periods=7)).replace([np.inf, -np.inf], np.nan)
+        expected = np.power(1 + delta_ratio, 1 / 7) - 1
+        pd.testing.assert_frame_equal(self.dataset.growth_rate('total_cases', 7, *self.locations), expected)
+
+        pt = self.dataset.cum_pos_test_rate(*self.locations)
+        expected = np.power(1 + pt.diff(periods=7) / pt, 1 / 7) - 1
+        pd.testing.assert_frame_equal(self.dataset.cum_pos_test_growth_rate(7, *self.locations), expected)
+        return
+
+    def test_window_list(self):
+        for var in ['total_cases', 'active_confirmed_cases', 'pos_test_rate']:
+            growth = self.dataset.growth_rate(var, [3, 7, 28], *self.locations)
+            self.assertEqual(growth.columns.names, ['window', 'location'])
+            for window in (3, 7, 28):
+                pd.testing.assert_frame_equal(growth[window],
+                                              self.dataset.growth_rate(var, window, *self.locations),
+                                              check_names=False)
+        growth = self.dataset.cum_pos_test_growth_rate([7, 14], *self.locations)
+        pd.testing.assert_frame_equal(growth[14], self.dataset.cum_pos_test_growth_rate(14, *self.locations),
+                                      check_names=False)
+        return
+
+
+class TestCompact(unittest.TestCase):
+    def setUp(self):
+        df = synthetic_frame()
+        df['tests_units'] = 'tests performed'
+        df['total_cases_rate'] = df['total_cases'] / 3e7
+        self.full = CovidDataset(df)
+        self.compact = CovidDataset(df, compact=True)
+        self.locations = ('Canada', 'France', 'United States')
+        return
+
+    def test_dtypes(self):
+        dtypes = self.compact.df.dtypes
+        self.assertIsInstance(dtypes['location'], pd.CategoricalDtype)
+        self.assertIsInstance(dtypes['tests_units'], pd.CategoricalDtype)
+        self.assertEqual(str(dtypes['new_cases']), 'Int8')
+        self.assertEqual(str(dtypes['total_tests']), 'Int32')
+        self.assertEqual(dtypes['total_cases_rate'], np.float64)
+        self.assertLess(self.compact.df.memory_usage(deep=True).sum(), self.full.df.memory_usage(deep=True).sum() / 3)
+        return
+
+    def test_results_match(self):
+        for dataset in (self.compact, CovidDataset(self.full.df, compact=True, dense=True)):
+            for var in ['new_cases', 'total_cases', 'total_tests', 'total_cases_rate']:
+                pd.testing.assert_frame_equal(dataset.var_by_location(var, *self.locations),
+                                              self.full.var_by_location(var, *self.locations))
+            pd.testing.assert_frame_equal(dataset.var_by_location('total_cases', 'United States', 'Canada'),
+                                          self.full.var_by_location('total_cases', 'United States', 'Canada'))
+            pd.testing.assert_frame_equal(dataset.growth_rate('total_cases', [3, 7], *self.locations),
+                                          self.full.growth_rate('total_cases', [3, 7], *self.locations))
+            pd.testing.assert_frame_equal(dataset.pos_test_rate(7, *self.locations),
+                                          self.full.pos_test_rate(7, *self.locations))
+            pd.testing.assert_frame_equal(dataset.cum_pos_test_growth_rate(7, 'France'),
+                                          self.full.cum_pos_test_growth_rate(7, 'France'))
+        return
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.compact.save(tmp + "/compact")
+            loaded = CovidDataset.load(tmp + "/compact")
+            pd.testing.assert_frame_equal(loaded.df, self.compact.df.reset_index(drop=True))
+            pd.testing.assert_frame_equal(loaded.var_by_location('total_cases', 'France'),
+                                          self.full.var_by_location('total_cases', 'France'))
+        return
+
+
+class TestMaterialize(unittest.TestCase):
+    def setUp(self):
+        df = synthetic_frame()
+        self.plain = CovidDataset(df)
+        self.materialized = CovidDataset(df, materialize=True)
+        self.calls = [
+            lambda d, *locs: d.growth_rate('total_cases', 7, *locs),
+            lambda d, *locs: d.growth_rate('total_cases', [3, 7, 28], *locs),
+            lambda d, *locs: d.pos_test_rate(14, *locs),
+            lambda d, *locs: d.active_confirmed_cases(*locs),
+            lambda d, *locs: d.cum_pos_test_rate(*locs),
+        ]
+        return
+
+    def test_lookups_match_computation(self):
+        # France skips a date, so its queries are computed
+        self.assertEqual(self.materialized.materialized.contiguous, {'Canada', 'United States'})
+        for locations in [('Canada',), ('United States', 'Canada'), ('Canada', 'France')]:
+            for call in self.calls:
+                pd.testing.assert_frame_equal(call(self.materialized, *locations), call(self.plain, *locations))
 
+        with mock.patch('src.dataset.window_growth', side_effect=AssertionError):
+            self.materialized.growth_rate('total_cases', 14, 'United States')
+        return
+
+    def test_saved_with_the_data(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.materialized.save(tmp + "/data")
+            self.assertTrue(Path(tmp, "data", "derived", "meta.json").exists())
+            with mock.patch.object(MaterializedMetrics, 'compute', side_effect=AssertionError):
+                loaded = CovidDataset.load(tmp + "/data", materialize=True)
+            for call in self.calls:
+                pd.testing.assert_frame_equal(call(loaded, 'Canada', 'United States'),
+                                              call(self.plain, 'Canada', 'United States'))
+
+            # other metrics are computed, and the saved data is left as it was
+            loaded = CovidDataset.load(tmp + "/data", materialize=[('pos_test_rate', 3)])
+            self.assertEqual(loaded.materialized.metrics, [('pos_test_rate', 3)])
+            self.assertTrue(MaterializedMetrics.exists(tmp + "/data/derived", self.materialized.materialized.requested))
+
+            # the saved table does not describe replaced data
+            loaded = CovidDataset.load(tmp + "/data", materialize=True)
+            df = loaded.df.copy()
+            df['total_cases'] = 2 * df['total_cases']
+            loaded.df = df
+            pd.testing.assert_frame_equal(loaded.growth_rate('total_cases', 7, 'Canada'),
+                                          CovidDataset(df).growth_rate('total_cases', 7, 'Canada'))
+        return
+
+    def test_load_does_not_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.plain.save(tmp + "/data")
+            before = sorted(Path(tmp).rglob("*"))
+            loaded = CovidDataset.load(tmp + "/data", materialize=True)
+            self.assertIsNotNone(loaded.materialized)
+            self.assertEqual(sorted(Path(tmp).rglob("*")), before)
+        return
 
 
 if __name__ == '__main__':
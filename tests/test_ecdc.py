@@ -1,4 +1,7 @@
+import io
 import unittest
+import numpy as np
+import pandas as pd
 from src.ecdc import ECDC
 from src.populationdata import population_table
 
@@ -12,6 +15,39 @@ class TestECDC(unittest.TestCase):
         print(ecdc.df.loc[ecdc.df.location == 'Canada'][-7:])
         self.assertEqual(True, True)
 
+    def test_parse_projection_and_filters(self):
+        text = ('iso_code,continent,location,date,total_cases,new_cases,stringency_index,tests_units\n'
+                'CAN,North America,Canada,2020-03-01,10,1,50.0,tests performed\n'
+                'CAN,North America,Canada,2020-03-02,12,2,50.0,tests performed\n'
+                'FRA,Europe,France,2020-03-01,20,,60.0,\n'
+                'FRA,Europe,France,2020-03-02,25,5,60.0,\n')
+        df = ECDC.parse(io.StringIO(text))
+        self.assertEqual(list(df.columns), ['location', 'date', 'total_cases', 'new_cases', 'tests_units'])
+        self.assertEqual(df['total_cases'].dtype, np.float64)
+        self.assertTrue(pd.api.types.is_datetime64_dtype(df['date']))
+
+        chunked = ECDC.parse(io.StringIO(text), chunksize=1)
+        pd.testing.assert_frame_equal(chunked, df)
+
+        filtered = ECDC.parse(io.StringIO(text), columns=['total_cases'], locations=['France'], start='2020-03-02')
+        self.assertEqual(list(filtered.columns), ['location', 'date', 'total_cases'])
+        self.assertEqual(filtered.values.tolist(), [['France', pd.Timestamp('2020-03-02'), 25.0]])
+        self.assertIn('stringency_index', ECDC.parse(io.StringIO(text), columns=None).columns)
+        return
+
+
+    def test_missing_populations_from_table(self):
+        text = ('iso_code,continent,location,date,total_cases,population\n'
+                'BOL,South America,Bolivia,2020-03-01,10,\n'
+                'BOL,South America,Bolivia,2020-03-02,12,\n'
+                'CAN,North America,Canada,2020-03-01,20,1000.0\n')
+        ecdc = ECDC(source=io.StringIO(text))
+        populations = ecdc.df.set_index('location')['population']
+        self.assertEqual(populations['Canada'], 1000.0)
+        np.testing.assert_array_equal(populations['Bolivia'], ECDC.populations(['Bolivia', 'Bolivia']))
+        self.assertFalse(np.isnan(populations['Bolivia']).any())
+        return
+
 
 if __name__ == '__main__':
     unittest.main()
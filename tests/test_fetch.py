@@ -0,0 +1,244 @@
+import asyncio
+import hashlib
+import http.server
+import io
+import tempfile
+import threading
+import time
+import unittest
+import urllib.error
+
+from benchmarks import synthetic
+from src.fetch import Fetcher, open_source, fetch_all, prefetch, Source
+from src.environment import build_environment
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    body = b"date,location\n2020-03-01,Canada\n"
+    etag = '"v1"'
+    requests = []
+
+    def do_GET(self):
+        type(self).requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class TestFetcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.HTTPServer(("127.0.0.1", 0), _Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/covid19.csv"
+        return
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        return
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        _Handler.requests = []
+        _Handler.body = b"date,location\n2020-03-01,Canada\n"
+        _Handler.etag = '"v1"'
+        return
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        return
+
+    def test_snapshot_is_content_addressed_and_reused_within_ttl(self):
+        fetcher = Fetcher(snapshot_dir=self.tmp.name, ttl=60)
+        path = fetcher.fetch(self.url)
+        self.assertEqual(path.name, hashlib.sha256(_Handler.body).hexdigest())
+        self.assertEqual(path.read_bytes(), _Handler.body)
+        self.assertEqual(fetcher.fetch(self.url), path)
+        self.assertEqual(len(_Handler.requests), 1)
+        return
+
+    def test_conditional_request_after_ttl(self):
+        fetcher = Fetcher(snapshot_dir=self.tmp.name, ttl=0)
+        first = fetcher.fetch(self.url)
+        self.assertEqual(fetcher.fetch(self.url), first)
+        self.assertEqual(_Handler.requests[-1][1], '"v1"')
+
+        _Handler.body = b"date,location\n2020-03-02,Canada\n"
+        _Handler.etag = '"v2"'
+        second = fetcher.fetch(self.url)
+        self.assertNotEqual(second, first)
+        self.assertEqual([h["digest"] for h in fetcher.snapshot(self.url)["history"]], [first.name, second.name])
+        return
+
+    def test_old_snapshots_are_pruned(self):
+        fetcher = Fetcher(snapshot_dir=self.tmp.name, ttl=0, keep=2)
+        paths = []
+        for day in range(1, 5):
+            _Handler.body = f"date,location\n2020-03-0{day},Canada\n".encode()
+            _Handler.etag = f'"v{day}"'
+            paths.append(fetcher.fetch(self.url))
+        self.assertEqual([h["digest"] for h in fetcher.snapshot(self.url)["history"]], [p.name for p in paths[2:]])
+        self.assertEqual([p.exists() for p in paths], [False, False, True, True])
+
+        # objects shared with another url are kept
+        other = Fetcher(snapshot_dir=self.tmp.name, ttl=0, keep=None)
+        self.assertEqual(other.fetch(self.url + "?copy"), paths[-1])
+        self.assertEqual(fetcher.prune(keep=1), [paths[2]])
+        self.assertTrue(paths[3].exists())
+        return
+
+    def test_offline_mode_reads_newest_snapshot(self):
+        Fetcher(snapshot_dir=self.tmp.name).fetch(self.url)
+        count = len(_Handler.requests)
+        offline = Fetcher(snapshot_dir=self.tmp.name, ttl=0, offline=True)
+        self.assertEqual(offline.fetch(self.url).read_bytes(), _Handler.body)
+        self.assertEqual(len(_Handler.requests), count)
+        with self.assertRaises(FileNotFoundError):
+            offline.fetch(self.url + "?other")
+        return
+
+    def test_open_source_passes_local_paths_through(self):
+        self.assertEqual(open_source("population_data.csv"), "population_data.csv")
+        fetcher = Fetcher(snapshot_dir=self.tmp.name)
+        self.assertEqual(open_source(self.url, fetcher).read_bytes(), _Handler.body)
+        return
+
+
+class _SourceHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves files by path; /slow/ paths answer after a delay, /missing is not found and /flaky fails until its
+    failures are used up
+    """
+    files = {}
+    delay = 0.3
+    failures = 0
+    requests = []
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests.append(self.path)
+        if self.path.startswith("/slow/"):
+            time.sleep(cls.delay)
+        if self.path.startswith("/flaky") and cls.failures > 0:
+            cls.failures -= 1
+            self.send_error(503)
+            return
+        body = cls.files.get(self.path, b"x,y\n1,2\n" if self.path != "/missing" else None)
+        if body is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return
+
+    def log_message(self, *args):
+        return
+
+
+class TestFetchAll(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _SourceHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+        return
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        return
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fetcher = Fetcher(snapshot_dir=self.tmp.name, ttl=60)
+        _SourceHandler.requests = []
+        _SourceHandler.failures = 0
+        _SourceHandler.files = {}
+        return
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        return
+
+    def test_concurrent_and_deduplicated(self):
+        urls = [f"{self.base}/slow/{k}.csv" for k in range(4)]
+        start = time.perf_counter()
+        paths = prefetch(urls + urls[:2], self.fetcher, max_connections=4)
+        elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 3 * _SourceHandler.delay)
+        self.assertEqual(list(paths), urls)
+        self.assertEqual(sorted(_SourceHandler.requests), sorted(f"/slow/{k}.csv" for k in range(4)))
+        self.assertEqual(paths[urls[0]].read_bytes(), b"x,y\n1,2\n")
+        return
+
+    def test_bounded_connections(self):
+        urls = [f"{self.base}/slow/{k}.csv" for k in range(4)]
+        start = time.perf_counter()
+        prefetch(urls, self.fetcher, max_connections=2)
+        self.assertGreaterEqual(time.perf_counter() - start, 2 * _SourceHandler.delay)
+        return
+
+    def test_retries(self):
+        _SourceHandler.failures = 2
+        paths = prefetch([f"{self.base}/flaky"], self.fetcher, retries=2, backoff=0.01)
+        self.assertTrue(paths[f"{self.base}/flaky"].exists())
+        self.assertEqual(_SourceHandler.requests, ["/flaky"] * 3)
+
+        _SourceHandler.requests, _SourceHandler.failures = [], 2
+        with self.assertRaises(urllib.error.HTTPError):
+            prefetch([Source(f"{self.base}/flaky?again", retries=1)], self.fetcher, backoff=0.01)
+        self.assertEqual(len(_SourceHandler.requests), 2)
+
+        _SourceHandler.requests = []
+        with self.assertRaises(urllib.error.HTTPError):
+            prefetch([f"{self.base}/missing"], self.fetcher, backoff=0.01)
+        self.assertEqual(_SourceHandler.requests, ["/missing"])
+        return
+
+    def test_timeout_and_return_exceptions(self):
+        slow, fast = f"{self.base}/slow/late.csv", f"{self.base}/fast.csv"
+        results = asyncio.run(fetch_all([Source(slow, timeout=0.05), fast], self.fetcher, retries=0,
+                                        return_exceptions=True))
+        self.assertIsInstance(results[slow], OSError)
+        self.assertTrue(results[fast].exists())
+
+        # the retry starts after the timed out attempt has returned
+        _SourceHandler.requests = []
+        with self.assertRaises(OSError):
+            prefetch([Source(f"{self.base}/slow/later.csv", timeout=0.05)], self.fetcher, retries=1, backoff=0.01)
+        self.assertEqual(_SourceHandler.requests, ["/slow/later.csv"] * 2)
+        return
+
+    def test_build_environment(self):
+        owid = io.StringIO()
+        synthetic.owid_frame(locations=3, days=10).to_csv(owid, index=False)
+        _SourceHandler.files = {"/owid.csv": owid.getvalue().encode(),
+                                "/phac.csv": synthetic.phac_csv(days=10).encode()}
+        env = build_environment(['ecdc', 'phac'], fetcher=self.fetcher,
+                                sources=dict(ecdc=f"{self.base}/owid.csv", phac=f"{self.base}/phac.csv"))
+        self.assertEqual(len(env['ecdc'].locations), 3)
+        self.assertIn('Canada', env['phac'].locations)
+        self.assertEqual(sorted(_SourceHandler.requests), ["/owid.csv", "/phac.csv"])
+        self.assertEqual(env['phac'].src_url, f"{self.base}/phac.csv")
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
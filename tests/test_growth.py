@@ -0,0 +1,165 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import reference_growth_fit
+from src.models.growth import GeometricProcess
+
+
+def synthetic_series(days=300, seed=0, gaps=True):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2020-03-01", periods=days, freq="D")
+    rate = 0.05 * np.sin(np.arange(days) / 40)
+    values = 100 * np.exp(np.cumsum(rate) + rng.normal(0, 0.05, days))
+    series = pd.Series(values, index=index)
+    if gaps:
+        series[rng.random(days) < 0.1] = np.nan
+        series[40:55] = np.nan
+        # drop some dates so the index is irregular
+        series = series.drop(index[[100, 101, 150]])
+    return series
+
+
+class TestGeometricProcess(unittest.TestCase):
+    def test_fit_matches_lstsq(self):
+        for est_per in (3, 14):
+            series = synthetic_series()
+            process = GeometricProcess(est_per=est_per)
+            process.fit(series)
+            expected = reference_growth_fit(series, est_per)
+            pd.testing.assert_index_equal(process.model.index, pd.DatetimeIndex(expected.index))
+            np.testing.assert_allclose(process.model.values, expected.values, rtol=1e-7, atol=1e-9)
+        return
+
+    def test_fit_with_zeros(self):
+        single = synthetic_series(days=199, gaps=False)
+        single.iloc[5] = 0
+        leading = synthetic_series(days=160)
+        leading.iloc[:8] = 0
+        leading.iloc[60] = 0
+        for series in (single, leading):
+            for est_per in (5, 14):
+                process = GeometricProcess(est_per=est_per)
+                process.fit(series)
+                expected = reference_growth_fit(series, est_per)
+                pd.testing.assert_index_equal(process.model.index, pd.DatetimeIndex(expected.index))
+                np.testing.assert_allclose(process.model.values, expected.values, rtol=1e-7, atol=1e-9)
+                self.assertEqual(process.model['LogGrowthRate'].isna().sum(),
+                                 expected['LogGrowthRate'].isna().sum())
+        return
+
+    def test_fit_long_series(self):
+        series = synthetic_series(days=6000, gaps=False)
+        process = GeometricProcess(est_per=14)
+        process.fit(series)
+        np.testing.assert_allclose(process.model.values, reference_growth_fit(series, 14).values, rtol=1e-7, atol=1e-9)
+        return
+
+    def test_fit_short_series(self):
+        process = GeometricProcess()
+        process.fit(synthetic_series(days=10, gaps=False))
+        self.assertEqual(len(process.model), 0)
+        return
+
+    def test_fit_many_matches_fit(self):
+        frame = pd.DataFrame({loc: synthetic_series(seed=k, gaps=False) for k, loc in
+                              enumerate(['Canada', 'France', 'Italy', 'Spain', 'United States'])})
+        frame.iloc[::7, 1] = np.nan
+        frame.columns.name = 'location'
+        frame.index.name = 'date'
+        for kwargs in [{}, {'workers': 2, 'chunksize': 2}]:
+            combined = GeometricProcess(est_per=7).fit_many(frame, **kwargs)
+            self.assertEqual(combined.index.names, ['location', 'date'])
+            for loc in frame.columns:
+                process = GeometricProcess(est_per=7)
+                process.fit(frame[loc])
+                pd.testing.assert_frame_equal(combined.loc[loc], process.model, check_names=False)
+        return
+
+    def test_fit_many_with_zeros(self):
+        frame = pd.DataFrame({loc: synthetic_series(days=100, seed=k, gaps=False) for k, loc in
+                              enumerate(['Canada', 'France', 'Italy'])})
+        frame.iloc[:10, 0] = 0
+        frame.iloc[50, 2] = 0
+        combined = GeometricProcess(est_per=7).fit_many(frame, workers=2, chunksize=1)
+        for loc in frame.columns:
+            expected = reference_growth_fit(frame[loc], 7)
+            np.testing.assert_allclose(combined.loc[loc].values, expected.values, rtol=1e-7, atol=1e-9)
+        self.assertEqual(combined.loc['Canada', 'LogGrowthRate'].isna().sum(), 10)
+        self.assertFalse(combined.loc['France'].isna().any().any())
+        return
+
+    def test_update_matches_refit(self):
+        series = synthetic_series(days=200)
+        process = GeometricProcess(est_per=7)
+        process.fit(series[:-5])
+
+        # two new days and a revision of an existing one
+        new_points = series[-5:-3].copy()
+        new_points[series.index[-20]] = 123.0
+        refit_dates = process.update(new_points)
+        self.assertIn(series.index[-20], refit_dates)
+        self.assertLess(len(refit_dates), 20)
+
+        expected = series[:-3].copy()
+        expected[series.index[-20]] = 123.0
+        reference = GeometricProcess(est_per=7)
+        reference.fit(expected)
+        pd.testing.assert_frame_equal(process.model, reference.model, check_freq=False, rtol=1e-9)
+
+        self.assertEqual(len(process.update(series[-10:-6])), 0)
+        return
+
+    def test_update_after_zeros(self):
+        series = synthetic_series(days=80, gaps=False)
+        series.iloc[:5] = 0
+        series.iloc[40] = 0
+        process = GeometricProcess(est_per=7)
+        process.fit(series[:-10])
+        for k in range(10, 0, -2):
+            process.update(series[-k:len(series) - k + 2])
+        np.testing.assert_allclose(process.model.values, reference_growth_fit(series, 7).values, rtol=1e-7, atol=1e-9)
+        self.assertTrue(np.isfinite(process.model['LogGrowthRate'].iloc[-10:]).all())
+        return
+
+    def test_update_appends_and_inserts(self):
+        series = synthetic_series(days=200)
+        process = GeometricProcess(est_per=7)
+        process.fit(series[:20])
+        for k in range(20, len(series)):
+            process.update(series[k:k + 1])
+        reference = GeometricProcess(est_per=7)
+        reference.fit(series)
+        pd.testing.assert_frame_equal(process.model, reference.model, check_freq=False, rtol=1e-9)
+
+        # dates dropped by synthetic_series come back before the last one, with a revision before them
+        full = synthetic_series(days=200, gaps=False)
+        inserted = full[full.index.difference(series.index)]
+        inserted[series.index[30]] = 55.0
+        refit_dates = process.update(inserted)
+        self.assertNotIn(series.index[50], refit_dates)
+        expected = series.combine_first(inserted)
+        expected[series.index[30]] = 55.0
+        reference.fit(expected)
+        pd.testing.assert_frame_equal(process.model, reference.model, check_freq=False, rtol=1e-9)
+        return
+
+    def test_update_before_fit(self):
+        with self.assertRaisesRegex(RuntimeError, "update called before fit"):
+            GeometricProcess().update(synthetic_series(days=20, gaps=False))
+        return
+
+    def test_update_after_fit_many(self):
+        frame = pd.DataFrame({loc: synthetic_series(days=120, seed=k, gaps=False) for k, loc in
+                              enumerate(['Canada', 'France', 'Italy'])})
+        process = GeometricProcess(est_per=7)
+        process.fit_many(frame[:-2])
+        process.update(frame[-2:])
+        reference = GeometricProcess(est_per=7)
+        reference.fit_many(frame)
+        pd.testing.assert_frame_equal(process.model, reference.model, check_exact=True, check_freq=False)
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import unittest
+
+from src import CovidDataset, instrument
+from src.models.growth import GeometricProcess
+from tests.test_coviddataset import synthetic_frame
+
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        instrument.reset()
+        return
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+        return
+
+    def test_disabled_records_nothing(self):
+        self.assertFalse(instrument.is_enabled())
+        with instrument.stage("outer") as s:
+            s.rows = 10
+        self.assertEqual(instrument.records(), [])
+        return
+
+    def test_environment_values(self):
+        for value in (None, "", "0", "false", "FALSE", " False "):
+            self.assertIsNone(instrument._from_environment(value))
+        self.assertEqual(instrument._from_environment("time"), dict(memory=False))
+        self.assertEqual(instrument._from_environment("1"), dict(memory=True))
+        self.assertEqual(instrument._from_environment("true"), dict(memory=True))
+        return
+
+    def test_nested_stages(self):
+        instrument.enable()
+        with instrument.stage("outer", rows=3):
+            with instrument.stage("inner") as s:
+                block = bytearray(4 * 2 ** 20)
+                s.rows = len(block)
+                del block
+            with instrument.stage("inner"):
+                pass
+        inner, _, outer = instrument.records()
+        self.assertEqual(outer.path, "outer")
+        self.assertEqual(inner.path, "outer/inner")
+        self.assertEqual(inner.parent, outer.id)
+        self.assertGreaterEqual(inner.peak_bytes, 4 * 2 ** 20)
+        self.assertGreaterEqual(outer.peak_bytes, 4 * 2 ** 20)
+        self.assertEqual(outer.rows, 3)
+
+        table = instrument.summary()
+        self.assertEqual(table.loc["outer/inner", "calls"], 2)
+        self.assertEqual(table.loc["outer/inner", "rows"], 4 * 2 ** 20)
+        self.assertLessEqual(table.loc["outer", "self_seconds"], table.loc["outer", "seconds"])
+
+        self.assertEqual(len(json.loads(instrument.to_json())["records"]), 3)
+        folded = instrument.to_folded().splitlines()
+        self.assertEqual([line.split()[0] for line in folded], ["outer;inner", "outer"])
+        return
+
+    def test_hooks(self):
+        instrument.enable(memory=False)
+        dataset = CovidDataset(synthetic_frame())
+        dataset.growth_rate('total_cases', 7, 'Canada')
+        GeometricProcess().fit(dataset.var_by_location('total_cases', 'Canada')['Canada'])
+        paths = set(instrument.summary().index)
+        self.assertIn("CovidDataset.index_rows", paths)
+        self.assertIn("CovidDataset.growth_rate/CovidDataset.var_by_location", paths)
+        self.assertIn("GeometricProcess.fit", paths)
+        self.assertTrue(all(record.peak_bytes is None for record in instrument.records()))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
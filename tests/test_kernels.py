@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src import kernels
+
+
+class TestKernels(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        values = np.cumsum(rng.integers(0, 50, size=(120, 6)), axis=0).astype(float)
+        values[rng.random(values.shape) < 0.1] = np.nan
+        values[:15, 2] = np.nan
+        self.frame = pd.DataFrame(values)
+        return
+
+    def test_rolling_matches_pandas(self):
+        values = self.frame.to_numpy()
+        for window in (1, 3, 7, 28, 200):
+            np.testing.assert_allclose(kernels.rolling_sum(values, window),
+                                       self.frame.rolling(window).sum().to_numpy(), rtol=1e-12)
+            np.testing.assert_allclose(kernels.rolling_mean(values, window),
+                                       self.frame.rolling(window).mean().to_numpy(), rtol=1e-12)
+            np.testing.assert_allclose(kernels.rolling_mean(values, window, min_periods=1),
+                                       self.frame.rolling(window, min_periods=1).mean().to_numpy(), rtol=1e-12)
+            np.testing.assert_array_equal(kernels.diff(values, window), self.frame.diff(window).to_numpy())
+        np.testing.assert_allclose(kernels.rolling_mean(values[:, 0], 7), self.frame[0].rolling(7).mean(), rtol=1e-12)
+        with self.assertRaises(ValueError):
+            kernels.diff(values, 0)
+        return
+
+    def test_ratios(self):
+        values = self.frame.to_numpy()
+        tests = 10 * values
+        tests[5:10] = tests[4]
+        expected = (self.frame.diff(7) / pd.DataFrame(tests).diff(7)).to_numpy()
+        np.testing.assert_array_equal(kernels.rolling_ratio(values, tests, 7), expected)
+        self.assertTrue(np.isinf(kernels.ratio(np.array([1.0]), np.array([0.0])))[0])
+        np.testing.assert_array_equal(kernels.ratio(np.array([1.0, 0.0]), np.array([0.0, 0.0]), finite=True),
+                                      [np.nan, np.nan])
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
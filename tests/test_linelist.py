@@ -0,0 +1,89 @@
+import io
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks import synthetic
+from src.linelist import aggregate_line_list, byte_ranges
+from src.ontario import Ontario
+
+
+class TestLineList(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "conposcovidloc.csv"
+        self.cases = synthetic.ontario_line_list_csv(self.path, locations=4, days=60, cases=10, block_days=7)
+        return
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        return
+
+    def expected(self):
+        """
+        The daily counts from the whole file read at once
+        """
+        full = pd.read_csv(self.path)
+        full['fatal'] = full['Outcome1'] == 'Fatal'
+        counts = full.groupby(['Reporting_PHU_City', 'Accurate_Episode_Date']).agg(
+            new_cases=('fatal', 'size'), new_deaths=('fatal', 'sum'))
+        return counts.rename_axis(['location', 'date'])
+
+    def test_matches_full_read(self):
+        daily = aggregate_line_list(self.path, chunksize=500)
+        self.assertEqual(daily['new_cases'].sum(), self.cases)
+        self.assertEqual(list(daily.columns), ['date', 'location', 'new_cases', 'total_cases', 'new_deaths',
+                                               'total_deaths'])
+
+        expected = self.expected()
+        indexed = daily.assign(date=daily['date'].dt.strftime('%Y-%m-%d')).set_index(['location', 'date'])
+        joined = indexed.join(expected, rsuffix='_expected')
+        np.testing.assert_array_equal(joined['new_cases'], joined['new_cases_expected'].fillna(0))
+        np.testing.assert_array_equal(joined['new_deaths'], joined['new_deaths_expected'].fillna(0))
+        for location, rows in indexed.groupby(level='location'):
+            np.testing.assert_array_equal(rows['total_cases'], rows['new_cases'].cumsum())
+            np.testing.assert_array_equal(rows['total_deaths'], rows['new_deaths'].cumsum())
+            self.assertEqual(len(rows), 60)
+        return
+
+    def test_chunks_and_processes_agree(self):
+        serial = aggregate_line_list(self.path, chunksize=100000)
+        with open(self.path, "rb") as f:
+            pd.testing.assert_frame_equal(aggregate_line_list(f, chunksize=97), serial)
+        pd.testing.assert_frame_equal(aggregate_line_list(self.path, chunksize=300, processes=3), serial)
+        return
+
+    def test_byte_ranges(self):
+        header, ranges = byte_ranges(self.path, 5)
+        data = self.path.read_bytes()
+        self.assertEqual(header, data[:len(header)])
+        self.assertEqual(b"".join(data[start:stop] for start, stop in ranges), data[len(header):])
+        self.assertTrue(all(data[stop - 1:stop] == b"\n" for _, stop in ranges))
+        self.assertEqual(len(byte_ranges(self.path, 10 ** 6)[1]), len(data[len(header):].splitlines()))
+        return
+
+    def test_ontario(self):
+        ontario = Ontario(source=str(self.path), line_list=dict(chunksize=1000))
+        self.assertEqual(ontario.locations, sorted(synthetic.ONTARIO_CITIES[:4]))
+        self.assertNotIn('total_tests_per_thousand', ontario.df)
+        daily = aggregate_line_list(self.path)
+        location = ontario.locations[0]
+        np.testing.assert_array_equal(ontario.var_by_location('total_cases', location)[location],
+                                      daily.loc[daily['location'] == location, 'total_cases'])
+
+        text = self.path.read_text()
+        more = Path(self.tmp.name) / "more.csv"
+        more.write_text(text + "999999,2020-04-29,2020-04-30,30s,MALE,Fatal,Toronto\n")
+        ontario.src_url = str(more)
+        self.assertEqual(ontario.refresh(), ['Toronto'])
+        self.assertEqual(ontario.var_by_location('total_deaths', 'Toronto')['Toronto'].iloc[-1],
+                         daily.loc[daily['location'] == 'Toronto', 'total_deaths'].iloc[-1] + 1)
+        self.assertEqual(len(Ontario(source=io.StringIO(text), line_list=True).df), len(ontario.df))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
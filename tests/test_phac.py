@@ -1,5 +1,29 @@
+import io
+import tempfile
 import unittest
-from src import PHAC
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from src import CovidDataset, PHAC
+
+HEADER = ('prname,date,numconf,numprob,numtotal,ratetotal,numtoday,numrecover,numrecoveredtoday,numactive,'
+          'rateactive,numdeaths,ratedeaths,numdeathstoday,numtested,numtests,numtestedtoday,numteststoday\n')
+
+
+def phac_csv(days, revisions=None):
+    """
+    Return covid19.csv text for three provinces over days, with total cases overridden by revisions
+    {(province, day): total}
+    """
+    revisions = revisions or {}
+    lines = [HEADER]
+    for k, prov in enumerate(['Alberta', 'Ontario', 'Quebec']):
+        for day in range(days):
+            total = revisions.get((prov, day), 100 * (k + 1) + 10 * day)
+            date = (pd.Timestamp(2021, 2, 1) + pd.Timedelta(days=day)).strftime('%d-%m-%Y')
+            lines.append(f'{prov},{date},{total},0,{total},{total / 1000},10,0,0,0,,1,0.1,0,,{1000 + day},,10\n')
+    return ''.join(lines)
 
 
 class TestPHAC(unittest.TestCase):
@@ -10,6 +34,79 @@ class TestPHAC(unittest.TestCase):
         print(phac.df[-26:])
         self.assertEqual(True, True)
 
+    def test_read_source(self):
+        header = ('prname,date,numconf,numprob,numtotal,ratetotal,numtoday,numrecover,numrecoveredtoday,numactive,'
+                  'rateactive,numdeaths,ratedeaths,numdeathstoday,numtested,numtests,numtestedtoday,numteststoday\n')
+        text = (header +
+                'Ontario,31-01-2021,"1,000",0,"1,000",10.0,10,900,5,90,0.9,10,0.1,1,"20,000",,200,\n'
+                'Ontario,01-02-2021,"1,010",0,"1,010",10.1,10,905,5,95,0.95,10,0.1,0,,"20,300",,300\n'
+                'Repatriated travellers,01-02-2021,13,0,13,,0,13,0,0,,0,,0,,,,\n')
+        df = PHAC.read_source(io.StringIO(text))
+        self.assertEqual(list(df.location), ['Ontario', 'Ontario'])
+        self.assertEqual(list(df.total_cases), [1000, 1010])
+        self.assertEqual(list(df.total_tests), [20000, 20300])
+        self.assertEqual(list(df.new_tests), [200, 300])
+        self.assertEqual(list(df.test_units), ['persons', 'tests'])
+        self.assertTrue(np.allclose(df.population, 1e7))
+        self.assertTrue(np.allclose(df.total_cases_rate, [1e-4, 1.01e-4]))
+        return
+
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "covid19.csv"
+        self.path.write_text(phac_csv(5))
+        return
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        return
+
+    def test_refresh_merges_new_and_revised_rows(self):
+        for options in ({}, {'dense': True}, {'compact': True, 'dense': True},
+                        {'materialize': [('growth_rate', 'total_cases', 1)]}):
+            self.path.write_text(phac_csv(5))
+            phac = PHAC(source=str(self.path), **options)
+            alberta = phac.var_by_location('total_cases', 'Alberta')
+            phac.var_by_location('total_cases', 'Ontario')
+            self.assertEqual(phac.refresh(), [])
+
+            # revise an Ontario row and add a day for every province
+            self.path.write_text(phac_csv(6, {('Ontario', 2): 999}))
+            dense = phac.dense
+            self.assertEqual(phac.refresh(), ['Alberta', 'Ontario', 'Quebec'])
+            # the new day is added to the dense store in place
+            self.assertIs(phac.dense, dense)
+            fresh = PHAC(source=str(self.path), **options)
+            pd.testing.assert_frame_equal(phac.df.reset_index(drop=True), fresh.df.reset_index(drop=True))
+            pd.testing.assert_frame_equal(phac.var_by_location('total_cases', 'Ontario', 'Quebec'),
+                                          fresh.var_by_location('total_cases', 'Ontario', 'Quebec'))
+            self.assertNotEqual(phac.var_by_location('total_cases', 'Alberta').shape, alberta.shape)
+            pd.testing.assert_frame_equal(phac.growth_rate('total_cases', 1, 'Ontario', 'Quebec'),
+                                          fresh.growth_rate('total_cases', 1, 'Ontario', 'Quebec'))
+
+            # only the revised location changes and unrelated cached results survive
+            self.path.write_text(phac_csv(6, {('Ontario', 2): 998}))
+            quebec = phac.var_by_location('total_cases', 'Quebec')
+            self.assertEqual(phac.refresh(), ['Ontario'])
+            hits = phac.cache_info()['hits']
+            pd.testing.assert_frame_equal(phac.var_by_location('total_cases', 'Quebec'), quebec)
+            self.assertEqual(phac.cache_info()['hits'], hits + 1)
+            self.assertEqual(phac.var_by_location('total_cases', 'Ontario').loc['2021-02-03', 'Ontario'], 998)
+            self.assertAlmostEqual(phac.df.set_index(['location', 'date']).loc[('Ontario', '2021-02-03'),
+                                                                              'total_cases_rate'], 998e-8)
+        return
+
+    def test_dataset_without_reader(self):
+        self.path.write_text(phac_csv(5))
+        dataset = CovidDataset(PHAC(source=str(self.path)).df)
+        with self.assertRaisesRegex(ValueError, "not read from a source"):
+            dataset.refresh()
+        with self.assertRaisesRegex(ValueError, "not read from a source"):
+            CovidDataset.parse(str(self.path))
+        return
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from src.populationdata import PopulationData, LazyPopulationTable
+
+
+class TestPopulationData(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {"COVID19_CACHE_DIR": self.tmp.name})
+        self.env.start()
+        return
+
+    def tearDown(self):
+        self.env.stop()
+        self.tmp.cleanup()
+        return
+
+    def test_lazy_table_does_not_load_until_used(self):
+        with mock.patch.object(PopulationData, '_get_world') as get_world:
+            table = LazyPopulationTable()
+            self.assertFalse(table.loaded)
+            self.assertGreater(table.get_population('Canada'), 3e7)
+            self.assertTrue(table.loaded)
+            get_world.assert_not_called()
+        return
+
+    def test_cache_is_preferred_to_bundled_csv(self):
+        self.assertEqual(PopulationData.local_source(), PopulationData.bundled_csv)
+        PopulationData(df=pd.DataFrame({'year': [2020], 'location': ['Atlantis'],
+                                        'population': [42.0], 'population_density': [np.nan]})
+                       ).to_csv(PopulationData.cache_path())
+        self.assertEqual(PopulationData.local_source(), PopulationData.cache_path())
+        self.assertEqual(LazyPopulationTable().get_population('Atlantis'), 42.0)
+        return
+
+    def test_refresh_writes_cache(self):
+        world = pd.DataFrame({'year': [2020], 'location': ['Atlantis'],
+                              'population': [42.0], 'population_density': [1.0]})
+        empty = pd.DataFrame(columns=['year', 'location', 'population', 'population_density'])
+        with mock.patch.object(PopulationData, '_get_world', return_value=world), \
+                mock.patch.object(PopulationData, '_get_canada', return_value=empty), \
+                mock.patch.object(PopulationData, '_get_us', return_value=empty):
+            table = LazyPopulationTable()
+            table.refresh(dict(world='world.csv', canada='canada.xlsx', us='us.csv'))
+        self.assertTrue(PopulationData.cache_path().exists())
+        self.assertEqual(table.get_population('Atlantis'), 42.0)
+        self.assertEqual(PopulationData().get_density('Atlantis'), 1.0)
+        return
+
+    def test_bulk_lookup(self):
+        table = PopulationData(df=pd.DataFrame({'year': [2020, 2019, 2020],
+                                                'location': ['Atlantis', 'Atlantis', 'Lemuria'],
+                                                'population': [42.0, 41.0, 7.0],
+                                                'population_density': [1.0, 0.5, np.nan]}))
+        locations = np.array(['Lemuria', 'Atlantis', 'Mu', np.nan, 'Lemuria', 'Old Atlantis', 'Hy-Brasil'],
+                             dtype=object)
+        np.testing.assert_array_equal(table.populations(locations[:5]), [7.0, 42.0, np.nan, np.nan, 7.0])
+        np.testing.assert_array_equal(table.populations(locations, aliases={'Old Atlantis': 'Atlantis',
+                                                                            'Hy-Brasil': None})[5:], [42.0, np.nan])
+        np.testing.assert_array_equal(table.densities(['Atlantis', 'Lemuria']), [1.0, np.nan])
+        self.assertEqual(table.get_population('Atlantis'), 42.0)
+        self.assertTrue(np.isnan(table.get_population('Mu')))
+        self.assertTrue(np.isnan(table.get_density('Lemuria')))
+        return
+
+    def test_bulk_lookup_matches_scalar_lookup(self):
+        table = PopulationData()
+        locations = list(table.df['location'].unique()) + ['Atlantis']
+        np.testing.assert_array_equal(table.populations(locations),
+                                      [table.get_population(loc) for loc in locations])
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import csv
+import io
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from benchmarks import synthetic
+from src import PHAC
+from src import render
+from src.render import render_locations, render_vars, location_image, RenderCache
+
+
+class TestRender(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.phac = PHAC(source=io.StringIO(synthetic.phac_csv(days=40)))
+        return
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        return
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        return
+
+    def test_plot_location(self):
+        fig = self.phac.plot_location('Ontario', from_date='2020-03-10')
+        self.assertEqual(len(fig.axes), 2)
+        plt.close(fig)
+        data = self.phac.location_plot_data('Ontario', 'Quebec')
+        self.assertEqual(list(data['Quebec'].columns),
+                         ['growth_3', 'growth_7', 'growth_28', 'total_cases', 'total_deaths'])
+        return
+
+    def test_render_locations(self):
+        locations = ['Ontario', 'Quebec', 'Prince Edward Island']
+        serial = render_locations(self.phac, locations, Path(self.tmp.name) / "serial", processes=1)
+        parallel = render_locations(self.phac, locations, Path(self.tmp.name) / "parallel",
+                                    formats=["png", "svg"], processes=2)
+        self.assertEqual([Path(p).name for p in serial],
+                         ["location-Ontario.png", "location-Quebec.png", "location-Prince_Edward_Island.png"])
+        self.assertEqual(len(parallel), 6)
+        self.assertTrue(all(Path(p).read_bytes().startswith(b"\x89PNG") for p in serial))
+        with self.assertRaises(ValueError):
+            render_locations(self.phac, locations, self.tmp.name, formats=["bmp"])
+        return
+
+    def test_render_vars(self):
+        paths = render_vars(self.phac, ['total_cases', 'new_cases'], [['Ontario', 'Quebec'], 'Alberta'],
+                            self.tmp.name, formats=["svg"], processes=2, ma_window=7)
+        self.assertEqual([Path(p).name for p in paths],
+                         ["total_cases-Ontario-Quebec.svg", "total_cases-Alberta.svg",
+                          "new_cases-Ontario-Quebec.svg", "new_cases-Alberta.svg"])
+        self.assertTrue(all(b"<svg" in Path(p).read_bytes() for p in paths))
+        return
+
+    def test_in_process_drawing_keeps_backend(self):
+        backend = matplotlib.get_backend()
+        figures = plt.get_fignums()
+        try:
+            matplotlib.use("pdf")
+            image = location_image(self.phac, 'Ontario')
+            render_vars(self.phac, ['total_cases'], ['Quebec'], self.tmp.name, processes=1)
+            self.assertEqual(matplotlib.get_backend(), "pdf")
+        finally:
+            matplotlib.use(backend)
+        self.assertTrue(image.startswith(b"\x89PNG"))
+        self.assertEqual(plt.get_fignums(), figures)
+        return
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = RenderCache(directory=Path(self.tmp.name) / "cache")
+        return
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        return
+
+    def test_only_changed_locations_are_drawn(self):
+        text = synthetic.phac_csv(days=40)
+        phac = PHAC(source=io.StringIO(text))
+        locations = ['Ontario', 'Quebec', 'Alberta']
+        first = render_locations(phac, locations, Path(self.tmp.name) / "first", processes=1, cache=self.cache)
+        self.assertEqual(self.cache.info()['misses'], 3)
+
+        # the next file only changes the deaths of the last Ontario row
+        rows = list(csv.reader(io.StringIO(text)))
+        last = max(k for k, row in enumerate(rows) if row[1] == 'Ontario')
+        rows[last][6] = str(int(rows[last][6]) + 1)
+        changed = io.StringIO()
+        csv.writer(changed).writerows(rows)
+        phac = PHAC(source=io.StringIO(changed.getvalue()))
+        with mock.patch("src.render._draw", wraps=render._draw) as draw:
+            second = render_locations(phac, locations, Path(self.tmp.name) / "second", processes=1, cache=self.cache)
+        drawn = [Path(call.args[0][4]).name for call in draw.call_args_list]
+        self.assertEqual(drawn, ["location-Ontario"])
+        self.assertEqual(self.cache.info()['hits'], 2)
+        for before, after in zip(first[1:], second[1:]):
+            self.assertEqual(Path(before).read_bytes(), Path(after).read_bytes())
+
+        image = location_image(phac, 'Quebec', cache=self.cache)
+        self.assertEqual(image, Path(second[1]).read_bytes())
+        self.assertNotEqual(location_image(phac, 'Quebec', cache=self.cache, figsize=(8, 6)), image)
+        return
+
+    def test_eviction_by_size(self):
+        phac = PHAC(source=io.StringIO(synthetic.phac_csv(days=40)))
+        render_locations(phac, ['Ontario', 'Quebec'], self.tmp.name, processes=1, cache=self.cache)
+        size = self.cache.size()
+        self.cache.max_bytes = size - 1
+        self.assertEqual(self.cache.evict(), 1)
+        self.assertLess(self.cache.size(), size)
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
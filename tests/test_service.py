@@ -0,0 +1,91 @@
+import concurrent.futures
+import io
+import json
+import unittest
+import urllib.error
+import urllib.request
+
+from benchmarks import synthetic
+from src import PHAC
+from src.service import serve
+
+
+class TestQueryService(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.loads = 0
+
+        def load():
+            cls.loads += 1
+            return PHAC(source=io.StringIO(synthetic.phac_csv(days=40)))
+
+        cls.server = serve({'phac': load}, port=0, workers=4)
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+        return
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        return
+
+    def get(self, path, etag=None):
+        headers = {} if etag is None else {"If-None-Match": etag}
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.base + path, headers=headers)) as resp:
+                return resp.status, resp.headers.get("ETag"), resp.read()
+        except urllib.error.HTTPError as err:
+            return err.code, err.headers.get("ETag"), err.read()
+
+    def test_query(self):
+        path = "/phac/var_by_location?var=total_cases&location=Ontario&location=Quebec&window=7&end=2020-03-20"
+        status, etag, body = self.get(path)
+        self.assertEqual(status, 200)
+        result = json.loads(body)
+        self.assertEqual(result['columns'], ['Ontario', 'Quebec'])
+        self.assertEqual(len(result['index']), 20)
+        self.assertIsNone(result['data'][0][0])
+
+        expected = self.server.service.dataset('phac').var_by_location('total_cases', 'Ontario', 'Quebec',
+                                                                       ma_window=7)
+        self.assertAlmostEqual(result['data'][-1][1], expected.loc['2020-03-20', 'Quebec'])
+
+        hits = self.server.service.cache.info()['hits']
+        self.assertEqual(self.get(path, etag), (304, etag, b""))
+        self.assertEqual(self.server.service.cache.info()['hits'], hits + 1)
+        return
+
+    def test_growth_of_derived_series(self):
+        for var in ['active_confirmed_cases', 'pos_test_rate']:
+            status, _, body = self.get(f"/phac/growth_rate?var={var}&location=Ontario&window=3")
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['var'], var)
+        return
+
+    def test_errors(self):
+        self.assertEqual(self.get("/nowhere/growth_rate?var=total_cases&location=Ontario")[0], 404)
+        self.assertEqual(self.get("/phac/no_metric?var=total_cases&location=Ontario")[0], 404)
+        self.assertEqual(self.get("/phac/growth_rate?var=no_var&location=Ontario")[0], 400)
+        self.assertEqual(self.get("/phac/pos_test_rate?var=anything&location=Ontario")[0], 400)
+        self.assertEqual(self.get("/phac/pos_test_rate?location=Ontario")[0], 200)
+        self.assertEqual(self.get("/phac/growth_rate?var=total_cases&location=Atlantis")[0], 400)
+        self.assertEqual(self.get("/phac/growth_rate?var=total_cases&location=Ontario&window=x")[0], 400)
+        self.assertEqual(self.get("/phac/growth_rate?var=total_cases&location=Ontario&start=soon")[0], 400)
+        self.assertEqual(self.get("/phac/growth_rate?var=total_cases&location=Ontario&end=2020-13-45")[0], 400)
+        self.assertIn(b"phac", self.get("/")[2])
+        self.assertIn("Ontario", json.loads(self.get("/phac/locations")[2])['locations'])
+        return
+
+    def test_concurrent_clients_share_one_dataset(self):
+        paths = [f"/phac/growth_rate?var=total_cases&location={loc}&window={w}"
+                 for loc in ('Ontario', 'Quebec', 'Alberta') for w in (3, 7)] * 4
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(self.get, paths))
+        self.assertTrue(all(status == 200 for status, _, _ in results))
+        self.assertEqual(results[0][2], results[6][2])
+        self.assertEqual(type(self).loads, 1)
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
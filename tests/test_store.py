@@ -0,0 +1,76 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src import CovidDataset
+from src.store import read_columns, read_meta, write_columns
+
+
+def _sample_frame():
+    dates = pd.date_range("2020-03-01", periods=5, freq="D")
+    return pd.DataFrame({
+        'date': np.tile(dates, 2),
+        'location': ['Canada'] * 5 + ['United States'] * 5,
+        'total_cases': np.arange(10, dtype=float),
+        'new_cases': np.arange(10, dtype=np.int64),
+        'tests_units': ['tests performed', np.nan] * 5
+    })
+
+
+class TestStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "frame"
+        return
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        return
+
+    def test_round_trip(self):
+        df = _sample_frame()
+        write_columns(df, self.path)
+        meta = read_meta(self.path)
+        kinds = {col['name']: col['kind'] for col in meta['columns']}
+        self.assertEqual(kinds['date'], 'datetime')
+        self.assertEqual(kinds['location'], 'object')
+        self.assertEqual(meta['columns'][1]['categories'], ['Canada', 'United States'])
+        pd.testing.assert_frame_equal(read_columns(self.path), df)
+        pd.testing.assert_frame_equal(read_columns(self.path, mmap_mode=None), df)
+        return
+
+    def test_projection(self):
+        write_columns(_sample_frame(), self.path)
+        df = read_columns(self.path, columns=['total_cases', 'date'])
+        self.assertEqual(list(df.columns), ['total_cases', 'date'])
+        with self.assertRaises(KeyError):
+            read_columns(self.path, columns=['new_deaths'])
+        return
+
+    def test_nullable_columns_and_attrs(self):
+        df = _sample_frame()
+        df['new_cases'] = pd.array([1, None] * 5, dtype='Int16')
+        df['new_tests'] = pd.array([0.5, None] * 5, dtype='Float32')
+        df.attrs['dtypes'] = {'new_cases': 'float64'}
+        write_columns(df, self.path)
+        self.assertEqual(read_meta(self.path)['columns'][3]['kind'], 'nullable')
+        loaded = read_columns(self.path)
+        pd.testing.assert_frame_equal(loaded, df)
+        self.assertEqual(loaded.attrs, df.attrs)
+        return
+
+    def test_dataset_save_load(self):
+        dataset = CovidDataset(_sample_frame())
+        dataset.save(self.path)
+        loaded = CovidDataset.load(self.path, columns=['total_cases'])
+        self.assertEqual(list(loaded.df.columns), ['date', 'location', 'total_cases'])
+        pd.testing.assert_frame_equal(loaded.var_by_location('total_cases', 'Canada'),
+                                      dataset.var_by_location('total_cases', 'Canada'))
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()